@@ -0,0 +1,464 @@
+from board import AmazonsBoard
+from game import BOARD_BACKENDS, create_board, play_game, take_turn
+from player import Player
+from move import Move
+from search import AlphaBetaSearch
+
+from copy import deepcopy
+from typing import Optional, Tuple
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Perft counts from the default starting positions with player 1 to move, by board size then depth (index 0 is
+# depth 1). Arrows can't pass through the square the queen just left, so the counts are a little lower than the
+# usual Amazons perft numbers (2176 / 4307152 on 10x10)
+KNOWN_PERFT = {
+    4 : (104, 7594, 443610),
+    5 : (252, 46198, 6652380),
+    6 : (528, 221436),
+    7 : (796, 531504),
+    8 : (1200, 1249682),
+    9 : (1588, 2229486),
+    10 : (2128, 4082944),
+}
+
+# Keyword arguments for take_turn, small enough that every mode makes a decision in about a second or less
+PLAYER_MODES = {
+    "Random" : {},
+    "Min" : {},
+    "Max" : {},
+    "MinMax" : {},
+    "Territory" : {},
+    "MCTS" : {"n_mcts_games" : 1},
+    "AlphaBeta" : {"alphabeta_depth" : 1},
+    "UCT" : {"uct_iterations" : 200},
+}
+
+# (board size, player 1, player 2, games)
+GAME_MATCHUPS = (
+    (6, "Random", "Random", 20),
+    (10, "Random", "Random", 10),
+    (6, "MinMax", "Random", 2),
+)
+
+# (board size, random moves played first) for the alpha-beta depth check, which has to get at least
+# MIN_ALPHABETA_DEPTH plies deep in the time MinMax takes for one move
+ALPHABETA_POSITIONS = tuple((n, plies) for n in (6, 8, 10) for plies in (0, 2, 10))
+MIN_ALPHABETA_DEPTH = 2
+
+def legacy_mcts(player : Player, b : AmazonsBoard, opponent_id : int, times_play : int) -> None:
+    '''
+        The old way Player.mcts evaluated root moves, a deepcopy of the board for every move
+    '''
+    for m in player.generate_all_moves(b):
+        new_board = deepcopy(b)
+        player.make_move(m, new_board, print_move = False)
+        for _ in range(times_play):
+            start = len(new_board.history)
+            player.play_full_game(new_board, opponent_id)
+            new_board.rewind(start)
+
+def measure(label : str, function, *args) -> dict:
+    '''
+        Time a call and count the memory blocks and bytes it allocates
+    '''
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # Blocks still alive from the call, plus the high water mark of everything allocated during it
+    growth = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    result = {"label" : label, "seconds" : elapsed, "peak_bytes" : peak, "retained_blocks" : growth}
+    print(f"{label:>24}: {elapsed:8.3f}s  peak {peak / 1024:10.1f} KiB  retained blocks {growth}")
+    return result
+
+def deepcopy_cost(b : AmazonsBoard) -> dict:
+    '''
+        Blocks and bytes allocated by a single deepcopy of the board
+    '''
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    copy = deepcopy(b)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    del copy
+    return {
+        "blocks" : sum(stat.count_diff for stat in stats if stat.count_diff > 0),
+        "bytes" : sum(stat.size_diff for stat in stats if stat.size_diff > 0),
+    }
+
+def bench_mcts_allocations(board_size : int = 6, opening_moves : int = 6, times_play : int = 2, seed : int = 0) -> list[dict]:
+    '''
+        Compare the deepcopy-per-move simulations with the make/unmake simulations Player.mcts now uses
+    '''
+    random.seed(seed)
+    b = AmazonsBoard(board_size)
+    players = {1 : Player(1), 2 : Player(2)}
+    for turn in range(opening_moves):
+        players[turn % 2 + 1].make_random_move(b)
+    player = players[opening_moves % 2 + 1]
+    opponent_id = 2 if player.id == 1 else 1
+
+    n_root_moves = len(player.generate_all_moves(b))
+    copy = deepcopy_cost(b)
+    print(f"{board_size}x{board_size} board, {n_root_moves} root moves, {times_play} simulations each")
+    print(f"one deepcopy allocates {copy['blocks']} blocks / {copy['bytes']} bytes, {copy['blocks'] * n_root_moves} blocks per decision")
+
+    random.seed(seed)
+    before = measure("deepcopy per root move", legacy_mcts, player, b, opponent_id, times_play)
+    random.seed(seed)
+    after = measure("make/unmake", player.mcts, b, opponent_id, times_play)
+    return [before, after]
+
+# (board size, queens per side) for bench_board_sizes, the larger boards with many queens scattered over them
+BOARD_SIZES = ((10, 4), (20, 12), (32, 20))
+
+def scattered_queens(n : int, queens : int, seed : int = 0) -> dict[Tuple[int, int], int]:
+    '''
+        Starting positions with queens for each player on random squares of an n x n board
+    '''
+    rng = random.Random(seed)
+    squares = rng.sample(range(n * n), 2 * queens)
+    return {divmod(sq, n) : 1 if i < queens else 2 for i, sq in enumerate(squares)}
+
+def position_bytes(b : AmazonsBoard) -> int:
+    '''
+        Bytes a deepcopy of the board allocates, what every extra position held by a search or a pondering thread costs
+    '''
+    tracemalloc.start()
+    copy = deepcopy(b)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del copy
+    return size
+
+def bench_board_sizes(sizes : tuple = BOARD_SIZES, backends : tuple[str, ...] = tuple(BOARD_BACKENDS), plies : int = 200, seed : int = 0) -> list[dict]:
+    '''
+        Memory per position and time per move across board sizes and backends
+
+        Each board starts from scattered_queens and plays up to plies random moves (made with validation, the
+        way a game makes them), timing move generation and printing the board along the way
+    '''
+    results = []
+    for backend in backends:
+        for n, queens in sizes:
+            b = create_board(n, backend, starting_positions = scattered_queens(n, queens, seed))
+            players = {1 : Player(1), 2 : Player(2)}
+            random.seed(seed)
+            generate = make = show = 0.0
+            generated = moves = 0
+            for _ in range(plies):
+                if b.done:
+                    break
+                id = 2 if b.last_player == 1 else 1
+                start = time.perf_counter()
+                generated += len(b.populate_all_move_codes(id))
+                generate += time.perf_counter() - start
+                start = time.perf_counter()
+                players[id].make_random_move(b, print_move = False)
+                make += time.perf_counter() - start
+                start = time.perf_counter()
+                str(b)
+                show += time.perf_counter() - start
+                moves += 1
+
+            results.append({
+                "name" : f"board {backend} {n}x{n} {queens} queens",
+                "position_bytes" : position_bytes(b),
+                "moves" : moves,
+                "move_us" : make / moves * 1e6,
+                "generated_move_us" : generate / generated * 1e6,
+                "str_us" : show / moves * 1e6,
+                "rate" : moves / make if make > 0 else 0.0,
+            })
+            result = results[-1]
+            print(f"{result['name']:>32}: {result['position_bytes'] / 1024:8.1f} KiB a position {result['move_us']:8.1f}us a move {result['generated_move_us']:6.2f}us a generated move {result['str_us']:8.1f}us str")
+
+    return results
+
+def repeat_for(function, min_seconds : float, min_runs : int = 1) -> tuple:
+    '''
+        Call function until it has run at least min_runs times and min_seconds in total, so quick benchmarks get
+        timed over enough calls to be comparable
+
+        Returns (result of the last call, runs, seconds)
+    '''
+    runs = 0
+    elapsed = 0.0
+    while runs < min_runs or elapsed < min_seconds:
+        start = time.perf_counter()
+        result = function()
+        elapsed += time.perf_counter() - start
+        runs += 1
+    return result, runs, elapsed
+
+def perft(b : AmazonsBoard, depth : int, id : int) -> int:
+    '''
+        Number of move sequences depth moves long for the players taking turns from id, counting each slide and
+        arrow as one move. Sequences stop early when the game is over
+    '''
+    if depth <= 0:
+        return 1
+    opponent_id = 2 if id == 1 else 1
+    total = 0
+    for movement in b.populate_all_movements(id):
+        attacks = b.populate_all_attacks_for_move(*movement)
+        # No need to play the last move out, just count it
+        if depth == 1:
+            total += len(attacks)
+            continue
+        for attack in attacks:
+            b.make_move(Move(*movement, attack, id), print_move = False, validate = False)
+            if not b.done:
+                total += perft(b, depth - 1, opponent_id)
+            b.pop_last_move()
+
+    return total
+
+def perft_codes(b : AmazonsBoard, depth : int, id : int) -> int:
+    '''
+        perft using populate_all_move_codes, which has to agree with the movement/attack generators
+    '''
+    if depth <= 0:
+        return 1
+    moves = b.populate_all_move_codes(id)
+    if depth == 1:
+        return len(moves)
+    opponent_id = 2 if id == 1 else 1
+    total = 0
+    for m in moves:
+        b.make_move(m, print_move = False, validate = False)
+        if not b.done:
+            total += perft_codes(b, depth - 1, opponent_id)
+        b.pop_last_move()
+
+    return total
+
+def bench_perft(sizes : tuple[int, ...] = tuple(KNOWN_PERFT), max_depth : int = 2, backends : tuple[str, ...] = tuple(BOARD_BACKENDS), min_seconds : float = 0.2) -> list[dict]:
+    '''
+        Time perft from the starting position of every board size and backend, checking the counts against
+        KNOWN_PERFT and the packed move generator
+    '''
+    results = []
+    for backend in backends:
+        for n in sizes:
+            known = KNOWN_PERFT.get(n, ())
+            for depth in range(1, min(max_depth, len(known)) + 1):
+                b = create_board(n, backend)
+                nodes, runs, elapsed = repeat_for(lambda : perft(b, depth, 1), min_seconds)
+                codes = perft_codes(b, depth, 1)
+                ok = nodes == known[depth - 1] and codes == nodes
+                results.append({
+                    "name" : f"perft {backend} {n}x{n} depth {depth}",
+                    "nodes" : nodes,
+                    "expected" : known[depth - 1],
+                    "ok" : ok,
+                    "problem" : f"counted {nodes} nodes ({codes} from move codes), expected {known[depth - 1]}",
+                    "seconds" : elapsed / runs,
+                    "rate" : nodes * runs / elapsed if elapsed > 0 else 0.0,
+                })
+                print(f"{results[-1]['name']:>32}: {nodes:>10} nodes {elapsed / runs:8.3f}s {results[-1]['rate']:>12.0f} nodes/s{'' if ok else '  MISMATCH'}")
+
+    return results
+
+def opening_position(board_size : int, opening_moves : int, seed : int, backend : str = "array") -> AmazonsBoard:
+    '''
+        A board a few random moves into the game, the same every time for the same seed
+    '''
+    random.seed(seed)
+    b = create_board(board_size, backend)
+    players = {1 : Player(1), 2 : Player(2)}
+    for turn in range(opening_moves):
+        players[turn % 2 + 1].make_random_move(b, print_move = False)
+    return b
+
+def bench_decisions(board_size : int = 6, opening_moves : int = 6, decisions : int = 3, modes : Optional[dict] = None, seed : int = 0, min_seconds : float = 0.2) -> list[dict]:
+    '''
+        Decisions per second for each player mode from the same fixed position, at least decisions of them and
+        for at least min_seconds
+
+        Every decision starts from a fresh player so nothing searched for an earlier one carries over
+    '''
+    modes = modes if modes is not None else PLAYER_MODES
+    results = []
+    for kind, kwargs in modes.items():
+        b = opening_position(board_size, opening_moves, seed)
+        id = opening_moves % 2 + 1
+        random.seed(seed)
+
+        def decide():
+            take_turn(Player(id), kind, b, print_move = False, endgame = False, **kwargs)
+            b.pop_last_move()
+
+        _, runs, elapsed = repeat_for(decide, min_seconds, decisions)
+        results.append({
+            "name" : f"decisions {kind} {board_size}x{board_size}",
+            "decisions" : runs,
+            "seconds" : elapsed,
+            "rate" : runs / elapsed if elapsed > 0 else 0.0,
+        })
+        print(f"{results[-1]['name']:>32}: {runs:>10} decisions {elapsed:8.3f}s {results[-1]['rate']:>12.2f} decisions/s")
+
+    return results
+
+def bench_games(matchups : tuple = GAME_MATCHUPS, seed : int = 0, min_seconds : float = 0.2) -> list[dict]:
+    '''
+        Games per second of play_game for each (board size, player 1, player 2, games) matchup, playing at least
+        that many games and for at least min_seconds
+    '''
+    results = []
+    for board_size, player_1, player_2, games in matchups:
+        random.seed(seed)
+        lengths = []
+
+        def play():
+            lengths.append(play_game(board_size, player_1, player_2, print_move = False)[1])
+
+        _, n_games, elapsed = repeat_for(play, min_seconds, games)
+        moves = sum(lengths)
+        results.append({
+            "name" : f"games {player_1} vs {player_2} {board_size}x{board_size}",
+            "games" : n_games,
+            "moves" : moves,
+            "seconds" : elapsed,
+            "rate" : n_games / elapsed if elapsed > 0 else 0.0,
+        })
+        print(f"{results[-1]['name']:>32}: {n_games:>10} games {elapsed:8.3f}s {results[-1]['rate']:>12.2f} games/s")
+
+    return results
+
+def bench_alphabeta_depth(positions : tuple = ALPHABETA_POSITIONS, seed : int = 0) -> list[dict]:
+    '''
+        How deep alpha-beta gets in the time one MinMax move takes (the median of three), from each (board size,
+        random moves played) position, ok if it's at least MIN_ALPHABETA_DEPTH
+    '''
+    results = []
+    for board_size, opening_moves in positions:
+        b = opening_position(board_size, opening_moves, seed)
+        id = opening_moves % 2 + 1
+        # The first search on a board size fills the per-size tables, which shouldn't count against the budget
+        AlphaBetaSearch().search(b, id, max_depth = 1)
+
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            Player(id).make_minmax_move(b, print_move = False)
+            times.append(time.perf_counter() - start)
+            b.pop_last_move()
+        budget = sorted(times)[1]
+
+        search = AlphaBetaSearch()
+        start = time.perf_counter()
+        search.search(b, id, budget)
+        elapsed = time.perf_counter() - start
+        ok = search.depth >= MIN_ALPHABETA_DEPTH
+        results.append({
+            "name" : f"alphabeta depth {board_size}x{board_size} +{opening_moves}",
+            "depth" : search.depth,
+            "nodes" : search.nodes,
+            "ok" : ok,
+            "problem" : f"reached depth {search.depth} in {budget:.3f}s, expected at least {MIN_ALPHABETA_DEPTH}",
+            "seconds" : elapsed,
+            "rate" : search.nodes / elapsed if elapsed > 0 else 0.0,
+        })
+        print(f"{results[-1]['name']:>32}: depth {search.depth:>4} {search.nodes:>10} nodes {elapsed:8.3f}s (MinMax {budget:.3f}s){'' if ok else '  TOO SHALLOW'}")
+
+    return results
+
+def run_suite(quick : bool = False, perft_depth : Optional[int] = None) -> dict:
+    '''
+        Run every benchmark and collect the results in one JSON friendly dict
+
+        quick only runs perft to depth 1, with fewer decisions and everything timed over less time, for a fast check
+    '''
+    results = {
+        "python" : platform.python_version(),
+        "machine" : platform.machine(),
+        "quick" : quick,
+        "benchmarks" : [],
+    }
+    min_seconds = 0.05 if quick else 0.2
+    results["benchmarks"].extend(bench_perft(max_depth = perft_depth or (1 if quick else 2), min_seconds = min_seconds))
+    results["benchmarks"].extend(bench_alphabeta_depth())
+    results["benchmarks"].extend(bench_decisions(decisions = 1 if quick else 3, min_seconds = min_seconds))
+    # Every game is different, so the same games are played either way to keep the rates comparable
+    results["benchmarks"].extend(bench_games(min_seconds = min_seconds))
+    return results
+
+def compare(results : dict, baseline : dict, tolerance : float = 0.25) -> list[str]:
+    '''
+        Problems with the results: any check that failed (a perft count that doesn't match, alpha-beta not getting
+        deep enough), and anything whose rate dropped more than tolerance below the baseline. Benchmarks missing
+        from either side are skipped
+    '''
+    previous = {entry["name"] : entry for entry in baseline.get("benchmarks", [])}
+    problems = []
+    for entry in results["benchmarks"]:
+        if not entry.get("ok", True):
+            problems.append(f"{entry['name']}: {entry['problem']}")
+        if entry["name"] not in previous:
+            continue
+        before = previous[entry["name"]]["rate"]
+        if before > 0 and entry["rate"] < before * (1 - tolerance):
+            problems.append(f"{entry['name']}: {entry['rate']:.2f}/s, baseline {before:.2f}/s ({entry['rate'] / before - 1:+.0%})")
+
+    return problems
+
+def main(argv : Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description = "Perft counts, decisions per second and games per second")
+    parser.add_argument("--output", help = "write the results as JSON to this file")
+    parser.add_argument("--baseline", default = BASELINE_PATH, help = "results to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", help = "overwrite the baseline with these results")
+    parser.add_argument("--tolerance", type = float, default = 0.25, help = "fraction a rate may drop before it counts as a regression")
+    parser.add_argument("--perft-depth", type = int, help = "deepest perft to run, up to what KNOWN_PERFT has")
+    parser.add_argument("--quick", action = "store_true", help = "smaller runs, for a fast check")
+    parser.add_argument("--allocations", action = "store_true", help = "only run the MCTS allocation comparison")
+    parser.add_argument("--sizes", action = "store_true", help = "only run the memory and time per move comparison across board sizes")
+    args = parser.parse_args(argv)
+
+    if args.allocations:
+        bench_mcts_allocations()
+        return 0
+    if args.sizes:
+        bench_board_sizes()
+        return 0
+
+    results = run_suite(args.quick, args.perft_depth)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent = 2)
+        return 0
+
+    problems = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+    else:
+        problems = compare(results, {}, args.tolerance)
+        print(f"No baseline at {args.baseline}, only checking perft counts and alpha-beta depth")
+
+    for problem in problems:
+        print(f"REGRESSION {problem}", file = sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,332 @@
+from move import Move, ID_SHIFT
+from board import AmazonsBoard, NoPieceError
+
+from functools import lru_cache
+from typing import Iterator, Tuple
+
+import random
+
+# Same order as the directions used by AmazonsBoard so both backends generate moves in the same order
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+# Whether stepping in each direction increases the square index
+FORWARD = [div_x * 2 + div_y > 0 for div_x, div_y in DIRECTIONS]
+
+@lru_cache(maxsize = None)
+def ray_tables(n : int) -> Tuple[list, list, list, list]:
+    '''
+        Precompute the rays leaving every square of an n x n board
+
+        Squares are indexed as x * n + y. Returns (masks, squares, stops, coords) where
+            masks[sq][d] is the bitboard of every square on the ray from sq in direction d
+            squares[sq][d] is the list of (x, y) on that ray, ordered by distance from sq
+            stops[sq][d] maps a blocking square on that ray to how many squares before it can be reached
+            coords[sq] is the (x, y) of the square
+    '''
+    coords = [(sq // n, sq % n) for sq in range(n * n)]
+    masks = []
+    squares = []
+    stops = []
+    for x, y in coords:
+        square_masks = []
+        square_rays = []
+        square_stops = []
+        for div_x, div_y in DIRECTIONS:
+            mask = 0
+            ray = []
+            stop = {}
+            u, v = x + div_x, y + div_y
+            while u >= 0 and u < n and v >= 0 and v < n:
+                mask |= 1 << (u * n + v)
+                stop[u * n + v] = len(ray)
+                ray.append((u, v))
+                u, v = u + div_x, v + div_y
+            square_masks.append(mask)
+            square_rays.append(ray)
+            square_stops.append(stop)
+        masks.append(square_masks)
+        squares.append(square_rays)
+        stops.append(square_stops)
+
+    return masks, squares, stops, coords
+
+@lru_cache(maxsize = None)
+def neighbour_masks(n : int) -> list[int]:
+    '''
+        Bitboard of the up to 8 squares touching each square of an n x n board
+    '''
+    masks, squares, stops, coords = ray_tables(n)
+    neighbours = []
+    for square_rays in squares:
+        mask = 0
+        for ray in square_rays:
+            if ray:
+                mask |= 1 << (ray[0][0] * n + ray[0][1])
+        neighbours.append(mask)
+
+    return neighbours
+
+def iterate_bits(bits : int):
+    '''
+        Yield the index of every set bit, lowest first
+    '''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class BitboardAmazonsBoard(AmazonsBoard):
+    '''
+        AmazonsBoard that mirrors the position into integer bitboards
+
+        The array stored by AmazonsBoard is still kept up to date so printing and move validation behave the
+        same, but move generation uses the bitboards: the first blocker along a ray is found with a single
+        mask and bit scan instead of walking the ray one square at a time. That's every generator the players
+        and searches use (movements, attacks, packed move codes and the random picks), in the same order as
+        AmazonsBoard so the same seed plays the same game on either backend. Mobility is counted from the
+        bitboards too, so AmazonsBoard's ray by ray tracking is turned off and a move only changes three squares
+    '''
+    track_reach = False
+
+    def __init__(self, n : int = 10, **kwargs):
+        self.__occupied = 0
+        self.__arrows = 0
+        self.__queens = {1 : 0, 2 : 0}
+        super().__init__(n, **kwargs)
+
+    #<editor-fold> Properties
+    @property
+    def occupied(self):
+        return self.__occupied
+
+    @property
+    def arrows(self):
+        return self.__arrows
+
+    def queens(self, id : int) -> int:
+        '''
+            Bitboard of the pieces belonging to a player
+        '''
+        return self.__queens.get(id, 0)
+
+    def mobility(self, id : int) -> int:
+        '''
+            Number of places all of a player's pieces can move to, counted from the bitboards
+        '''
+        masks, squares, stops, coords = ray_tables(self.n)
+        occupied = self.__occupied
+        return sum(self.__slide_count(sq, occupied, masks, stops) for sq in iterate_bits(self.__queens.get(id, 0)))
+
+    def piece_mobility(self, piece : Tuple[int, int]) -> int:
+        '''
+            Number of places the piece at a location can move to
+        '''
+        masks, squares, stops, coords = ray_tables(self.n)
+        sq = int(piece[0]) * self.n + int(piece[1])
+        if not (self.__queens[1] | self.__queens[2]) >> sq & 1:
+            return 0
+        return self.__slide_count(sq, self.__occupied, masks, stops)
+
+    def reachable_squares(self, piece : Tuple[int, int]) -> set[Tuple[int, int]]:
+        '''
+            All places the piece at a location can move to
+        '''
+        masks, squares, stops, coords = ray_tables(self.n)
+        sq = int(piece[0]) * self.n + int(piece[1])
+        if not (self.__queens[1] | self.__queens[2]) >> sq & 1:
+            return set()
+        return set(self.__slides(sq, self.__occupied, masks, squares, stops))
+    #</editor-fold> Properties
+
+    def reset(self, **kwargs) -> None:
+        '''
+            Reset the board to the starting configuration and rebuild the bitboards from it
+        '''
+        super().reset(**kwargs)
+        # Build the tables every board of this size shares now, rather than during the first move
+        neighbour_masks(self.n)
+        self.__occupied = 0
+        self.__arrows = 0
+        self.__queens = {1 : 0, 2 : 0}
+        for sq, value in enumerate(self.to_array().flat):
+            if value == 0:
+                continue
+            bit = 1 << sq
+            self.__occupied |= bit
+            if value == -1:
+                self.__arrows |= bit
+            elif value in self.__queens:
+                self.__queens[value] |= bit
+
+    def apply_move(self, m : Move) -> None:
+        '''
+            Add the move to the board and the bitboards
+        '''
+        super().apply_move(m)
+        n = self.n
+        start = 1 << int(m.x0 * n + m.y0)
+        end = 1 << int(m.x1 * n + m.y1)
+        attack = 1 << int(m.ax * n + m.ay)
+        self.__queens[m.id] = (self.__queens[m.id] & ~start) | end
+        self.__arrows |= attack
+        self.__occupied = ((self.__occupied & ~start) | end) | attack
+
+    def pop_last_move(self) -> None:
+        '''
+            Undo the last move from the board and the bitboards
+        '''
+        if len(self.history) == 0:
+            return
+        m = Move.from_code(self.history[-1])
+        super().pop_last_move()
+        n = self.n
+        start = 1 << int(m.x0 * n + m.y0)
+        end = 1 << int(m.x1 * n + m.y1)
+        attack = 1 << int(m.ax * n + m.ay)
+        self.__arrows &= ~attack
+        self.__occupied &= ~(attack | end)
+        self.__queens[m.id] = (self.__queens[m.id] & ~end) | start
+        self.__occupied |= start
+
+    def __slides(self, sq : int, occupied : int, masks : list, squares : list, stops : list) -> list[Tuple[int, int]]:
+        '''
+            Every square a piece on sq can slide to, ray by ray and nearest first
+        '''
+        reachable = []
+        square_masks = masks[sq]
+        square_rays = squares[sq]
+        square_stops = stops[sq]
+        for d in range(8):
+            blockers = occupied & square_masks[d]
+            if blockers == 0:
+                reachable.extend(square_rays[d])
+            # Rays with a positive index step meet their closest blocker at the lowest set bit
+            elif FORWARD[d]:
+                reachable.extend(square_rays[d][:square_stops[d][(blockers & -blockers).bit_length() - 1]])
+            else:
+                reachable.extend(square_rays[d][:square_stops[d][blockers.bit_length() - 1]])
+
+        return reachable
+
+    def __slide_count(self, sq : int, occupied : int, masks : list, stops : list) -> int:
+        '''
+            How many squares a piece on sq can slide to, without listing them
+        '''
+        count = 0
+        square_masks = masks[sq]
+        square_stops = stops[sq]
+        for d in range(8):
+            blockers = occupied & square_masks[d]
+            if blockers == 0:
+                count += len(square_stops[d])
+            elif FORWARD[d]:
+                count += square_stops[d][(blockers & -blockers).bit_length() - 1]
+            else:
+                count += square_stops[d][blockers.bit_length() - 1]
+
+        return count
+
+    def has_any_move(self, id : int) -> bool:
+        '''
+            Whether the player can make any move at all
+
+            A piece that can move can always shoot back where it came from, so this only needs one free square next
+            to one piece
+        '''
+        neighbours = neighbour_masks(self.n)
+        occupied = self.__occupied
+        for sq in iterate_bits(self.__queens.get(id, 0)):
+            if neighbours[sq] & ~occupied:
+                return True
+        return False
+
+    def populate_all_movements(self, id : int) -> list[Tuple[Tuple[int,int], Tuple[int,int]]]:
+        '''
+            Given a player id, generate all places their pieces can move to
+
+            Output matches AmazonsBoard.populate_all_movements
+        '''
+        masks, squares, stops, coords = ray_tables(self.n)
+        occupied = self.__occupied
+        potential_moves = []
+        for sq in iterate_bits(self.__queens.get(id, 0)):
+            piece = coords[sq]
+            for end in self.__slides(sq, occupied, masks, squares, stops):
+                potential_moves.append((piece, end))
+
+        return potential_moves
+
+    def populate_all_attacks_for_move(self, start : Tuple[int, int], end : Tuple[int, int]) -> list[Tuple[int, int]]:
+        '''
+            Given a starting position and ending position, generate all places the piece can attack
+
+            Output matches AmazonsBoard.populate_all_attacks_for_move
+        '''
+        masks, squares, stops, coords = ray_tables(self.n)
+        occupied = self.__occupied
+        sq = int(end[0] * self.n + end[1])
+        # Can always attack where we just moved from
+        potential_attacks = [start]
+        potential_attacks.extend(self.__slides(sq, occupied, masks, squares, stops))
+
+        return potential_attacks
+
+    def iter_movements(self, id : int) -> Iterator[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        '''
+            Lazily yield the same (piece location, ending location) pairs as populate_all_movements
+
+            Moves may be made on the board while iterating, as long as they are undone before the next pair is asked for
+        '''
+        masks, squares, stops, coords = ray_tables(self.n)
+        for sq in iterate_bits(self.__queens.get(id, 0)):
+            piece = coords[sq]
+            for end in self.__slides(sq, self.__occupied, masks, squares, stops):
+                yield piece, end
+
+    def iter_attacks_for_move(self, start : Tuple[int, int], end : Tuple[int, int]) -> Iterator[Tuple[int, int]]:
+        '''
+            Lazily yield the same attack locations as populate_all_attacks_for_move
+        '''
+        yield from self.populate_all_attacks_for_move(start, end)
+
+    def iter_move_codes(self, id : int) -> Iterator[int]:
+        '''
+            Lazily yield the same packed moves as populate_all_move_codes
+
+            Like iter_movements, any moves made while iterating have to be undone before the next move is asked for
+        '''
+        n = self.n
+        masks, squares, stops, coords = ray_tables(n)
+        player = (id + 1) << ID_SHIFT
+        for sq in iterate_bits(self.__queens.get(id, 0)):
+            x0, y0 = coords[sq]
+            for x1, y1 in self.__slides(sq, self.__occupied, masks, squares, stops):
+                movement = player | x0 | y0 << 8 | x1 << 16 | y1 << 24
+                # Can always attack where we just moved from
+                yield movement | x0 << 32 | y0 << 40
+                # The queen is still on its starting square when it shoots, so the occupancy doesn't change
+                for ax, ay in self.__slides(x1 * n + y1, self.__occupied, masks, squares, stops):
+                    yield movement | ax << 32 | ay << 40
+
+    def random_movement(self, id : int, rng : random.Random = random) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        '''
+            Pick one of the player's (piece location, ending location) pairs uniformly, without listing them all
+        '''
+        if not self.has_any_move(id):
+            raise NoPieceError(f"Player {id} has no pieces that can move")
+
+        masks, squares, stops, coords = ray_tables(self.n)
+        # Count every piece's moves once, then only list the moves of the piece that was picked
+        counts = [(sq, self.__slide_count(sq, self.__occupied, masks, stops)) for sq in iterate_bits(self.__queens[id])]
+        index = rng.randrange(sum(count for sq, count in counts))
+        for sq, count in counts:
+            if index < count:
+                return coords[sq], self.__slides(sq, self.__occupied, masks, squares, stops)[index]
+            index -= count
+
+    def random_attack(self, start : Tuple[int, int], end : Tuple[int, int], rng : random.Random = random) -> Tuple[int, int]:
+        '''
+            Pick one of the attack locations for a movement uniformly, without listing them all
+        '''
+        # Index 0 is shooting back at the starting square
+        return rng.choice(self.populate_all_attacks_for_move(start, end))
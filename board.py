@@ -1,8 +1,14 @@
 import numpy as np
 
-from move import Move
+from move import Move, ID_SHIFT, TRANSFORMS, transform_move, transform_position, unpack_move
 
-from typing import Optional, Tuple
+from array import array
+from bisect import insort
+from copy import deepcopy
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import random
 
 #<editor-fold> Exceptions
 class ControlError(Exception):
@@ -22,9 +28,174 @@ class SizeError(Exception):
 
 class GameOver(Exception):
     pass
+
+class ReplayError(Exception):
+    def __init__(self, index : int, reason : str):
+        super().__init__(f"Move {index} is illegal: {reason}")
+        # Index of the first illegal move in the sequence and why
+        self.index = index
+        self.reason = reason
 #</editor-fold> Exceptions
 
+@lru_cache(maxsize = None)
+def zobrist_keys(n : int) -> Tuple[dict, dict]:
+    '''
+        Random 64 bit keys for every (square contents, square) pair and for the player who moved last
+
+        Seeded by the board size so every process hashes the same position to the same value
+    '''
+    rng = random.Random(n)
+    squares = {value : [rng.getrandbits(64) for _ in range(n * n)] for value in (-1, 1, 2)}
+    last_player = {value : rng.getrandbits(64) for value in (-1, 1, 2)}
+    return squares, last_player
+
+@lru_cache(maxsize = None)
+def square_rays(n : int, dirs : Tuple[Tuple[int, int], ...]) -> list[list[list[Tuple[int, Tuple[int, int]]]]]:
+    '''
+        For every square (indexed x * n + y) and direction, the (index, (x, y)) of each square on the ray, nearest first
+    '''
+    rays = []
+    for x in range(n):
+        for y in range(n):
+            square_rays = []
+            for div_x, div_y in dirs:
+                ray = []
+                u, v = x + div_x, y + div_y
+                while u >= 0 and u < n and v >= 0 and v < n:
+                    ray.append((u * n + v, (u, v)))
+                    u, v = u + div_x, v + div_y
+                square_rays.append(ray)
+            rays.append(square_rays)
+
+    return rays
+
+@lru_cache(maxsize = None)
+def square_transforms(n : int) -> list[Tuple[int, ...]]:
+    '''
+        For each of the 8 symmetries (see move.TRANSFORMS), where every square (indexed x * n + y) ends up
+    '''
+    tables = []
+    for transform in TRANSFORMS:
+        table = []
+        for x in range(n):
+            for y in range(n):
+                u, v = transform_position((x, y), n, transform)
+                table.append(u * n + v)
+        tables.append(tuple(table))
+    return tables
+
+@lru_cache(maxsize = None)
+def square_neighbours(n : int) -> list[Tuple[int, ...]]:
+    '''
+        For every square (indexed x * n + y), the squares next to it
+    '''
+    return [tuple(ray[0][0] for ray in rays if len(ray)) for rays in square_rays(n, ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)))]
+
+def line_is_clear(cells : list[int], n : int, start : int, end : int) -> bool:
+    '''
+        Whether end (a square index) is on a straight or diagonal line from start with every square after start up
+        to and including end empty
+    '''
+    x, y = divmod(start, n)
+    u, v = divmod(end, n)
+    x_diff, y_diff = u - x, v - y
+    if (x_diff == 0 and y_diff == 0) or (x_diff != 0 and y_diff != 0 and abs(x_diff) != abs(y_diff)):
+        return False
+    step = ((x_diff > 0) - (x_diff < 0)) * n + (y_diff > 0) - (y_diff < 0)
+    for sq in range(start + step, end + step, step):
+        if cells[sq] != 0:
+            return False
+    return True
+
+def check_moves(n : int, cells : list[int], last_player : int, codes : Sequence[int]) -> Tuple[int, Optional[str], int, int]:
+    '''
+        Check a sequence of packed moves from a position in one pass, without a board
+
+        cells are the squares' contents indexed x * n + y, and are left as they are after the legal moves. The
+        moves are checked the same way as check_move, and the game is over when check_done would say so, but that
+        only needs to know whether each player's queens have an empty square next to them rather than every move
+        they have. Returns (how many moves were legal, why the next one isn't or None, the last player to move,
+        the winner or -1 if the game isn't over)
+    '''
+    neighbours = square_neighbours(n)
+    queens = {1 : set(), 2 : set()}
+    for sq, contents in enumerate(cells):
+        if contents == 1 or contents == 2:
+            queens[contents].add(sq)
+
+    def can_move(id : int) -> bool:
+        for queen in queens[id]:
+            for sq in neighbours[queen]:
+                if cells[sq] == 0:
+                    return True
+        return False
+
+    winner = -1
+    for i, code in enumerate(codes):
+        if winner != -1:
+            return i, "the game is already over", last_player, winner
+        id = (code >> ID_SHIFT) - 1
+        if id != 1 and id != 2:
+            return i, "the move has no owner", last_player, winner
+        if id == last_player:
+            return i, f"it is not player {id}'s turn", last_player, winner
+        x0, y0, x1, y1, ax, ay = (code >> shift & 0xFF for shift in range(0, 48, 8))
+        if x0 >= n or y0 >= n or x1 >= n or y1 >= n or ax >= n or ay >= n:
+            return i, f"the move is off the {n}x{n} board", last_player, winner
+        start, end, attack = x0 * n + y0, x1 * n + y1, ax * n + ay
+        if cells[start] != id:
+            return i, f"player {id} has no piece at {(x0, y0)}", last_player, winner
+        if not line_is_clear(cells, n, start, end):
+            return i, f"the move from {(x0, y0)} -> {(x1, y1)} is invalid", last_player, winner
+        # The piece is still on its starting square while the attack is checked, the same as check_move
+        if attack != start and not line_is_clear(cells, n, end, attack):
+            return i, f"the attack from {(x1, y1)} -> {(ax, ay)} is invalid", last_player, winner
+
+        cells[start] = 0
+        cells[end] = id
+        cells[attack] = -1
+        queens[id].remove(start)
+        queens[id].add(end)
+        last_player = id
+        next_player = 2 if id == 1 else 1
+        if not can_move(next_player):
+            winner = id
+        elif not can_move(id):
+            winner = next_player
+
+    return len(codes), None, last_player, winner
+
+class Region(object):
+    '''
+        A group of squares that pieces can reach each other through, walled off from the rest of the board by arrows
+        and the board edge (see AmazonsBoard.regions)
+
+        A region is "owned" when only one player has pieces in it, "contested" when both do and "dead" when nobody can
+        move in it (no pieces or no empty squares)
+    '''
+    __slots__ = ("squares", "pieces")
+
+    def __init__(self):
+        # Empty squares, and the pieces of each player, as (x, y)
+        self.squares = []
+        self.pieces = {}
+
+    @property
+    def kind(self):
+        if len(self.squares) == 0 or len(self.pieces) == 0:
+            return "dead"
+        return "contested" if len(self.pieces) > 1 else "owned"
+
+    @property
+    def owner(self):
+        # Player id for an owned region, otherwise None
+        return next(iter(self.pieces)) if self.kind == "owned" else None
+
 class AmazonsBoard(object):
+    # Whether every piece's moves are kept up to date ray by ray as squares change, subclasses that can work them out
+    # from their own state turn it off and override mobility, has_any_move and the generators that read them
+    track_reach = True
+
     def __init__(self, n : int = 10, **kwargs):
         if n == 1:
             raise SizeError(f"Board cannot be of size 1")
@@ -41,7 +212,8 @@ class AmazonsBoard(object):
         self.__up_left = (-1, -1)
         self.__down_right = (1, 1)
         self.__down_left = (-1, 1)
-        self.__dirs = [self.__up, self.__down, self.__left, self.__right, self.__up_left, self.__up_right, self.__down_left, self.__down_right]
+        self.__dirs = (self.__up, self.__down, self.__left, self.__right, self.__up_left, self.__up_right, self.__down_left, self.__down_right)
+        self.__opposite = [self.__dirs.index((-div_x, -div_y)) for div_x, div_y in self.__dirs]
 
         self.reset(**kwargs)
 
@@ -64,44 +236,346 @@ class AmazonsBoard(object):
 
     @property
     def moves(self):
+        return [Move.from_code(code) for code in self.__moves]
+
+    @property
+    def history(self):
+        # Packed moves (see move.pack_move) in the order they were made, don't change it from outside the board
         return self.__moves
+
+    @property
+    def hash(self):
+        return self.__hash
+
+    @property
+    def last_player(self):
+        return self.__last_player
+
+    @property
+    def empty_squares(self):
+        return self.__cells.count(0)
+
+    def mobility(self, id : int) -> int:
+        '''
+            Number of places all of a player's pieces can move to, kept up to date as moves are made
+        '''
+        return self.__mobility.get(id, 0)
+
+    def piece_mobility(self, piece : Tuple[int, int]) -> int:
+        '''
+            Number of places the piece at a location can move to
+        '''
+        rays = self.__reach.get((int(piece[0]), int(piece[1])))
+        return 0 if rays is None else sum(len(ray) for ray in rays)
+
+    def reachable_squares(self, piece : Tuple[int, int]) -> set[Tuple[int, int]]:
+        '''
+            All places the piece at a location can move to
+        '''
+        rays = self.__reach.get((int(piece[0]), int(piece[1])), ())
+        return set(square for ray in rays for square in ray)
     #</editor-fold> Properties
 
     def __str__(self):
-        return_string = ""
-        for index, row in enumerate(self.__board):
-            for item in row:
-                if item == -1:
-                    return_string += "X"
+        n = self.__n
+        cells = self.__cells
+        # Every square is followed by a space, arrows are shown as X
+        return "\n".join("".join("X " if value == -1 else f"{value} " for value in cells[x * n:(x + 1) * n]) for x in range(n))
+
+    def __deepcopy__(self, memo : dict):
+        '''
+            Copy the position, sharing the ray and hash key tables every board of this size uses instead of copying
+            them, they're most of a board's memory on big boards and never change
+        '''
+        memo[id(self.__rays)] = self.__rays
+        memo[id(self.__keys)] = self.__keys
+        copy = type(self).__new__(type(self))
+        memo[id(self)] = copy
+        for key, value in self.__dict__.items():
+            copy.__dict__[key] = deepcopy(value, memo)
+        return copy
+
+    def square(self, position : Tuple[int, int]) -> int:
+        '''
+            Contents of a square (0 empty, -1 arrow, otherwise the player id)
+        '''
+        return self.__cells[int(position[0]) * self.__n + int(position[1])]
+
+    def clear_path(self, start : Tuple[int, int], end : Tuple[int, int]) -> bool:
+        '''
+            Whether end is on a straight or diagonal line from start with every square after start up to and including end empty
+        '''
+        x, y = int(start[0]), int(start[1])
+        u, v = int(end[0]), int(end[1])
+        x_diff, y_diff = u - x, v - y
+        if (x_diff == 0 and y_diff == 0) or (x_diff != 0 and y_diff != 0 and abs(x_diff) != abs(y_diff)):
+            return False
+        if not self.bounds_check((u, v)):
+            return False
+        dir_x = (x_diff > 0) - (x_diff < 0)
+        dir_y = (y_diff > 0) - (y_diff < 0)
+        for step in range(1, max(abs(x_diff), abs(y_diff)) + 1):
+            if self.__cells[(x + step * dir_x) * self.__n + y + step * dir_y] != 0:
+                return False
+        return True
+
+    def is_legal(self, m : Union[Move, int]) -> bool:
+        '''
+            Whether the move (or packed move) can be played now, like check_move but without raising
+
+            Meant for moves that came from somewhere else, like a book or another position in a search
+        '''
+        start, end, attack, id = unpack_move(m.code if isinstance(m, Move) else m)
+        if self.__done or id not in (1, 2) or id == self.__last_player or not self.bounds_check(start):
+            return False
+        if self.square(start) != id or not self.clear_path(start, end):
+            return False
+        # The piece is still on its starting square while the attack is checked, the same as check_move
+        return attack == start or self.clear_path(end, attack)
+
+    def probe(self, tablebase) -> Optional[Tuple[int, int]]:
+        '''
+            (winner, moves until the game ends) with perfect play from a tablebase (see tablebase.Tablebase), or
+            None if the position isn't in it
+        '''
+        return tablebase.probe(self)
+
+    def symmetries(self) -> Tuple[int, ...]:
+        '''
+            The transforms (see move.TRANSFORMS) that leave the position exactly as it is, always including 0
+
+            Applying any of them to a legal move gives a legal move that leads to the same position up to symmetry,
+            so only one move of each such group needs to be looked at
+        '''
+        cells = self.__cells
+        tables = square_transforms(self.__n)
+        return (0,) + tuple(transform for transform in TRANSFORMS[1:] if all(cells[sq] == value for sq, value in zip(tables[transform], cells)))
+
+    def transformed_hash(self, transform : int) -> int:
+        '''
+            The hash the position would have after one of the 8 symmetries (see move.TRANSFORMS)
+        '''
+        if transform == 0:
+            return self.__hash
+        squares, last_player = self.__keys
+        table = square_transforms(self.__n)[transform]
+        key = last_player[self.__last_player]
+        for sq, value in enumerate(self.__cells):
+            if value != 0:
+                key ^= squares[value][table[sq]]
+        return key
+
+    def canonical(self) -> Tuple[int, int]:
+        '''
+            (canonical key, transform) where the key is the smallest hash over the 8 symmetries of the position, so
+            every symmetric twin of a position gets the same key, and the transform is one that gives it
+        '''
+        return min((self.transformed_hash(transform), transform) for transform in TRANSFORMS)
+
+    def canonical_key(self) -> int:
+        '''
+            The same key for a position and each of its reflections and rotations
+        '''
+        return self.canonical()[0]
+
+    def transformed(self, transform : int, **kwargs) -> "AmazonsBoard":
+        '''
+            A new board with the position after one of the 8 symmetries, with the same player to move and no history
+        '''
+        n = self.__n
+        starting_positions = {transform_position(divmod(sq, n), n, transform) : value for sq, value in enumerate(self.__cells) if value != 0}
+        return type(self)(n, starting_positions = starting_positions, last_player = self.__last_player, **kwargs)
+
+    def transform_move(self, m : Union[Move, int], transform : int) -> Union[Move, int]:
+        '''
+            A move (or packed move) after one of the 8 symmetries of this board
+        '''
+        if isinstance(m, Move):
+            return m.transformed(self.__n, transform)
+        return transform_move(m, self.__n, transform)
+
+    def regions(self) -> list[Region]:
+        '''
+            Split the board into regions, flood filling from square to neighbouring square over everything but arrows
+
+            A queen move or arrow can only pass through empty neighbours one step at a time, so nothing in one
+            region can ever affect another
+        '''
+        n = self.__n
+        cells = self.__cells
+        seen = [value == -1 for value in cells]
+        regions = []
+        for sq in range(n * n):
+            if seen[sq]:
+                continue
+            region = Region()
+            seen[sq] = True
+            stack = [sq]
+            while stack:
+                current = stack.pop()
+                value = cells[current]
+                if value == 0:
+                    region.squares.append(divmod(current, n))
                 else:
-                    return_string += str(item)
-                return_string += " "
-            if index + 1 != self.n:
-                return_string += "\n"
+                    region.pieces.setdefault(value, []).append(divmod(current, n))
+                for ray in self.__rays[current]:
+                    # The first square of each ray is the neighbour in that direction
+                    if len(ray) and not seen[ray[0][0]]:
+                        seen[ray[0][0]] = True
+                        stack.append(ray[0][0])
+            regions.append(region)
+
+        return regions
 
-        return return_string
+    def to_array(self) -> np.ndarray:
+        '''
+            Get a copy of the board contents (0 empty, -1 arrow, otherwise the player id)
+        '''
+        return self.__board.copy()
+
+    def to_compact(self) -> Tuple[int, bytes, int]:
+        '''
+            Small picklable form of the position: (n, board contents as int8 bytes, player who moved last)
+
+            The move history is not included, from_compact rebuilds a board with the same position and no history
+        '''
+        return self.n, self.__board.astype(np.int8).tobytes(), self.__last_player
+
+    @classmethod
+    def from_compact(cls, compact : Tuple[int, bytes, int], **kwargs) -> "AmazonsBoard":
+        '''
+            Rebuild a board from to_compact
+        '''
+        n, contents, last_player = compact
+        board = np.frombuffer(contents, dtype = np.int8).reshape(n, n)
+        starting_positions = {(int(x), int(y)) : int(board[x, y]) for x, y in zip(*np.nonzero(board))}
+        return cls(n, starting_positions = starting_positions, last_player = last_player, **kwargs)
 
-    def make_move(self, m : Move, **kwargs):
+    def make_move(self, m : Union[Move, int], **kwargs):
         '''
             Check the move, apply to the board, check if the game is over
+
+            The move can also be given packed, as from populate_all_move_codes
         '''
+        if isinstance(m, int):
+            m = Move.from_code(m)
         if self.done:
             raise GameOver(f"The game is currently over. Please reset the board to play again")
         if kwargs.get("print_move", False) not in [False, None]:
             print(m)
-        self.check_move(m)
+        # Searches that only play moves they generated themselves can skip validation
+        if kwargs.get("validate", True):
+            self.check_move(m)
         self.apply_move(m)
-        self.__moves.append(m)
+        self.__moves.append(m.code)
+        self.check_done()
+
+    def replay(self, codes : Iterable[Union[Move, int]], validate : bool = True) -> None:
+        '''
+            Make a whole sequence of moves (packed or not) at once, checking if the game is over only at the end
+
+            With validate the sequence is checked first in one pass by check_moves, and if any move is illegal a
+            ReplayError is raised with its index and the board is left as it was. Without it the moves are applied
+            as they are, so only use that for sequences this board made itself
+        '''
+        codes = [m.code if isinstance(m, Move) else int(m) for m in codes]
+        if not codes:
+            return
+        if self.__done:
+            raise ReplayError(0, "the game is already over")
+        if validate:
+            legal, reason, _, _ = check_moves(self.__n, list(self.__cells), self.__last_player, codes)
+            if reason is not None:
+                raise ReplayError(legal, reason)
+        for code in codes:
+            self.apply_move(Move.from_code(code))
+            self.__moves.append(code)
         self.check_done()
 
     def apply_move(self, m : Move) -> None:
         '''
             Add the move to the board
         '''
-        self.__board[m.start] = 0
-        self.__board[m.end] = m.id
-        self.__board[m.attack] = -1
-        self.__last_player = m.id
+        self.__set_square(m.start, 0)
+        self.__set_square(m.end, m.id)
+        self.__set_square(m.attack, -1)
+        self.__set_last_player(m.id)
+
+    def __set_last_player(self, id : int) -> None:
+        '''
+            Change who moved last, keeping the side to move in the hash
+        '''
+        keys = self.__keys[1]
+        self.__hash ^= keys[self.__last_player] ^ keys[id]
+        self.__last_player = id
+
+    def __set_square(self, position : Tuple[int, int], value : int) -> None:
+        '''
+            Change a single square and update the mobility of every piece that can see it
+        '''
+        x, y = int(position[0]), int(position[1])
+        sq = x * self.__n + y
+        old = self.__cells[sq]
+        self.__cells[sq] = value
+        self.__board[x, y] = value
+
+        keys = self.__keys[0]
+        if old != 0:
+            self.__hash ^= keys[old][sq]
+        if value != 0:
+            self.__hash ^= keys[value][sq]
+
+        if not self.track_reach:
+            return
+
+        # A piece leaving takes its moves with it
+        reach, mobility = self.__reach, self.__mobility
+        if (rays := reach.pop((x, y), None)) is not None:
+            mobility[old] -= sum(map(len, rays))
+            self.__pieces[old].remove((x, y))
+
+        # Only the rays passing through this square change, so find the first piece in each direction
+        cells = self.__cells
+        for d, ray in enumerate(self.__rays[sq]):
+            for distance, (index, square) in enumerate(ray):
+                if cells[index] != 0:
+                    if (rays := reach.get(square)) is not None:
+                        opposite = self.__opposite[d]
+                        # The piece's ray now stops before this square, or carries on through it
+                        if value != 0:
+                            new_ray = rays[opposite][:distance]
+                        else:
+                            new_ray = rays[opposite] + ((x, y),) + self.__walk_ray(sq, opposite)
+                        mobility[cells[index]] += len(new_ray) - len(rays[opposite])
+                        rays[opposite] = new_ray
+                    break
+
+        # A piece arriving gets all of its moves
+        if value == 1 or value == 2:
+            self.__add_piece(x, y, value)
+
+    def __walk_ray(self, sq : int, d : int) -> Tuple[Tuple[int, int], ...]:
+        '''
+            All empty squares from a square in a direction until something is in the way
+        '''
+        cells = self.__cells
+        squares = []
+        for index, square in self.__rays[sq][d]:
+            if cells[index] != 0:
+                break
+            squares.append(square)
+
+        return tuple(squares)
+
+    def __add_piece(self, x : int, y : int, id : int) -> None:
+        '''
+            Start tracking the moves of the piece at (x, y)
+        '''
+        sq = x * self.__n + y
+        rays = [self.__walk_ray(sq, d) for d in range(len(self.__dirs))]
+        self.__reach[(x, y)] = rays
+        self.__mobility[id] = self.__mobility.get(id, 0) + sum(map(len, rays))
+        insort(self.__pieces[id], (x, y))
 
     def bounds_check(self, position : Tuple[int, int]) -> bool:
         '''
@@ -131,40 +605,24 @@ class AmazonsBoard(object):
     def check_trajectory(self, start : Tuple[int, int], end : Tuple[int, int]) -> bool:
         '''
             Check that the piece at start can move to the location at end
-        '''
-        x, y = start
-        u, v = end
-        x_diff = u - x
-        y_diff = v - y
-        dir_x = np.sign(x_diff)
-        dir_y = np.sign(y_diff)
-
-        # Check there isn't something there first
-        if self.__board[end] != 0:
-            return False
-        # Check there are no pieces in that direction
-        while x < u and y < v:
-            x += dir_x
-            y += dir_y
-            if self.__board[x, y] != 0:
-                return False
 
-        # If either are 0, the move can be made
-        if x_diff == 0 or y_diff == 0:
-            return True
-        # Make sure it's a multiple of its' movement
-        else:
-            return abs(x_diff) == abs(y_diff)
+            The path has to be a straight or diagonal line, in any of the eight directions, with every square along
+            it empty including end
+        '''
+        return self.clear_path(start, end)
 
     def reset(self, **kwargs) -> None:
         '''
             Reset the board to the starting configuration
         '''
-        self.__board = np.zeros((self.n, self.n), dtype = int)
+        # Squares only ever hold -1, 0, 1 or 2, so a byte each is enough
+        self.__board = np.zeros((self.n, self.n), dtype = np.int8)
         self.__done = False
-        self.__last_player = -1
+        self.__last_player = kwargs.get("last_player", -1)
+        # Who moved last before the first move, restored once every move is undone
+        self.__initial_last_player = self.__last_player
         self.__winner = -1
-        self.__moves = []
+        self.__moves = array("q")
 
         # Custom starting positions
         if (starting_positions := kwargs.get("starting_positions")) is not None:
@@ -201,6 +659,27 @@ class AmazonsBoard(object):
                 self.__board[self.n - 1, pos - 1] = 2
                 self.__board[self.n - 1, pos + 1] = 2
 
+        # Plain list copy of the squares, reading a list is much faster than indexing the array one square at a time.
+        # It only holds references to the cached small ints, 8 bytes a square
+        self.__cells = self.__board.ravel().tolist()
+        self.__rays = square_rays(self.n, self.__dirs)
+        self.__keys = zobrist_keys(self.n)
+
+        # Track the moves of every piece from here on
+        self.__reach = {}
+        self.__mobility = {1 : 0, 2 : 0}
+        # Each player's piece locations, kept sorted so the generators always go through them in the same order
+        self.__pieces = {1 : [], 2 : []}
+        if self.track_reach:
+            for x, y in zip(*np.where((self.__board == 1) | (self.__board == 2))):
+                self.__add_piece(int(x), int(y), int(self.__board[x, y]))
+
+        # Hash the starting position, later changes are applied square by square
+        squares, last_player = zobrist_keys(self.n)
+        self.__hash = last_player[self.__last_player]
+        for x, y in zip(*np.nonzero(self.__board)):
+            self.__hash ^= squares[int(self.__board[x, y])][x * self.n + y]
+
     def check_move(self, m : Move) -> None:
         '''
             Perform all checks on the move, if there's a problem it will raise an exception
@@ -213,15 +692,7 @@ class AmazonsBoard(object):
         if self.__last_player == m.id:
             raise TurnError(f"It is not player {m.id}'s turn'")
 
-        # Make sure the player is trying to move a piece
-        if not self.is_piece(m):
-            raise NoPieceError(f"No player piece at {m.start}")
-
-        # Make sure the player has control of the piece
-        if not self.player_has_control(m):
-            raise ControlError(f"Player {m.id} does not have control of piece at {m.start}")
-
-        # Check the bounds for each step of the move
+        # Check the bounds for each step of the move, before anything indexes the board with them
         if not self.bounds_check(m.start):
             raise IndexError(f"Invalid Move starting position {m.start} on board {self.shape}")
 
@@ -231,6 +702,14 @@ class AmazonsBoard(object):
         if not self.bounds_check(m.attack):
             raise IndexError(f"Invalid Move attack position {m.attack} on board {self.shape}")
 
+        # Make sure the player is trying to move a piece
+        if not self.is_piece(m):
+            raise NoPieceError(f"No player piece at {m.start}")
+
+        # Make sure the player has control of the piece
+        if not self.player_has_control(m):
+            raise ControlError(f"Player {m.id} does not have control of piece at {m.start}")
+
         # Check if the piece can actually move to the correct location
         if not self.check_trajectory(m.start, m.end):
             raise PathError(f"Move from {m.start} -> {m.end} is invalid")
@@ -259,7 +738,7 @@ class AmazonsBoard(object):
         '''
             See if a specific player has any locations it can move to
         '''
-        return len(self.populate_all_movements(id)) != 0
+        return self.has_any_move(id)
 
     def populate_all_movements(self, id : int) -> list[Tuple[Tuple[int,int], Tuple[int,int]]]:
         '''
@@ -274,17 +753,9 @@ class AmazonsBoard(object):
         potential_moves = []
         piece_locations = np.where(self.__board == id)
         for piece in zip(piece_locations[0], piece_locations[1]):
-            for div_x, div_y in self.__dirs:
-                x, y = piece
-                x, y = x + div_x, y + div_y
-                while x >= 0 and x < self.n and y >= 0 and y < self.n:
-                    # Check if the piece can move there
-                    if self.__board[x, y] == 0:
-                        potential_moves.append((piece, (x, y)))
-                    # Otherwise break since we don't need to check further
-                    else:
-                        break
-                    x, y = x + div_x, y + div_y
+            # The places each piece can reach are already tracked ray by ray
+            for ray in self.__reach[(int(piece[0]), int(piece[1]))]:
+                potential_moves.extend([(piece, square) for square in ray])
 
         return potential_moves
 
@@ -300,44 +771,156 @@ class AmazonsBoard(object):
         '''
         # Can always attack where we just moved from
         potential_attacks = [start]
-        for div_x, div_y in self.__dirs:
-            x, y = end
-            x, y = x + div_x, y + div_y
-            while x >= 0 and x < self.n and y >= 0 and y < self.n:
-                if self.__board[x, y] == 0:
-                    potential_attacks.append((x,y))
-                else:
-                    break
-                x, y = x + div_x, y + div_y
+        sq = int(end[0]) * self.__n + int(end[1])
+        for d in range(len(self.__dirs)):
+            potential_attacks.extend(self.__walk_ray(sq, d))
 
         return potential_attacks
 
+    def populate_all_move_codes(self, id : int) -> list[int]:
+        '''
+            Given a player id, generate every move they can make, packed into ints (see move.pack_move)
+
+            Same order as building a Move for each attack of each movement, without creating any Move objects
+        '''
+        return list(self.iter_move_codes(id))
+
+    def populate_unique_move_codes(self, id : int) -> list[int]:
+        '''
+            populate_all_move_codes with only one move from each group of moves that are symmetric twins on this
+            position (see symmetries), the one with the smallest (start, end, attack) square indices, in the same
+            order otherwise
+
+            Without any symmetry it's every move. The default starting position is a mirror image of itself, so
+            it halves the moves there, and a position symmetric under all 8 transforms cuts them by up to 8x
+        '''
+        codes = self.populate_all_move_codes(id)
+        symmetries = self.symmetries()
+        if len(symmetries) == 1:
+            return codes
+        n = self.__n
+        tables = [square_transforms(n)[transform] for transform in symmetries[1:]]
+        unique = []
+        for code in codes:
+            start = (code & 0xFF) * n + (code >> 8 & 0xFF)
+            end = (code >> 16 & 0xFF) * n + (code >> 24 & 0xFF)
+            attack = (code >> 32 & 0xFF) * n + (code >> 40 & 0xFF)
+            if all((start, end, attack) <= (table[start], table[end], table[attack]) for table in tables):
+                unique.append(code)
+        return unique
+
+    def iter_move_codes(self, id : int) -> Iterator[int]:
+        '''
+            Lazily yield the same packed moves as populate_all_move_codes
+
+            Like iter_movements, any moves made while iterating have to be undone before the next move is asked for
+        '''
+        player = (id + 1) << ID_SHIFT
+        for piece, (x1, y1) in self.iter_movements(id):
+            x0, y0 = piece
+            movement = player | x0 | y0 << 8 | x1 << 16 | y1 << 24
+            # Can always attack where we just moved from
+            yield movement | x0 << 32 | y0 << 40
+            sq = x1 * self.__n + y1
+            for d in range(len(self.__dirs)):
+                for ax, ay in self.__walk_ray(sq, d):
+                    yield movement | ax << 32 | ay << 40
+
+    def iter_movements(self, id : int) -> Iterator[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        '''
+            Lazily yield the same (piece location, ending location) pairs as populate_all_movements
+
+            Moves may be made on the board while iterating, as long as they are undone before the next pair is asked for
+        '''
+        for piece in list(self.__pieces.get(id, ())):
+            # Ray tuples are replaced rather than changed, so hold on to the ones there are now
+            for ray in list(self.__reach[piece]):
+                for square in ray:
+                    yield piece, square
+
+    def iter_attacks_for_move(self, start : Tuple[int, int], end : Tuple[int, int]) -> Iterator[Tuple[int, int]]:
+        '''
+            Lazily yield the same attack locations as populate_all_attacks_for_move
+
+            Like iter_movements, any moves made while iterating have to be undone before the next location is asked for
+        '''
+        # Can always attack where we just moved from
+        yield start
+        for d in range(len(self.__dirs)):
+            yield from self.__walk_ray(int(end[0]) * self.__n + int(end[1]), d)
+
+    def has_any_move(self, id : int) -> bool:
+        '''
+            Whether the player can make any move at all
+
+            A piece that can move can always shoot back where it came from, so this only needs one free square next
+            to one piece, which the mobility counts already know
+        '''
+        return self.__mobility.get(id, 0) != 0
+
+    def random_movement(self, id : int, rng : random.Random = random) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        '''
+            Pick one of the player's (piece location, ending location) pairs uniformly, without listing them all
+        '''
+        if not self.has_any_move(id):
+            raise NoPieceError(f"Player {id} has no pieces that can move")
+
+        index = rng.randrange(self.__mobility[id])
+        for piece in self.__pieces[id]:
+            for ray in self.__reach[piece]:
+                if index < len(ray):
+                    return piece, ray[index]
+                index -= len(ray)
+
+    def random_attack(self, start : Tuple[int, int], end : Tuple[int, int], rng : random.Random = random) -> Tuple[int, int]:
+        '''
+            Pick one of the attack locations for a movement uniformly, without listing them all
+        '''
+        sq = int(end[0]) * self.__n + int(end[1])
+        rays = [self.__walk_ray(sq, d) for d in range(len(self.__dirs))]
+        # Index 0 is shooting back at the starting square
+        index = rng.randrange(1 + sum(map(len, rays))) - 1
+        if index < 0:
+            return start
+        for ray in rays:
+            if index < len(ray):
+                return ray[index]
+            index -= len(ray)
+
     def pop_last_move(self) -> None:
         '''
             Undo the last move from the board
         '''
         # Make sure there is a move to undo
         if len(self.__moves):
-            last_move = self.__moves.pop()
+            last_move = Move.from_code(self.__moves.pop())
 
             # Return everything to the previous board state
-            self.__board[last_move.attack] = 0
-            self.__board[last_move.end] = 0
-            self.__board[last_move.start] = self.__last_player
+            self.__set_square(last_move.attack, 0)
+            self.__set_square(last_move.end, 0)
+            self.__set_square(last_move.start, self.__last_player)
 
             # Check if this was the first move ever
             if len(self.__moves) == 0:
-                self.__last_player = -1
+                self.__set_last_player(self.__initial_last_player)
             # Swap the previous player
             else:
-                self.__last_player = 2 if self.__last_player == 1 else 1
+                self.__set_last_player(2 if self.__last_player == 1 else 1)
 
             if self.__done:
                 self.__done = not self.__done
+                self.__winner = -1
+
+    def rewind(self, length : int) -> None:
+        '''
+            Undo moves until only the first length moves are left on the board
+        '''
+        while len(self.__moves) > length:
+            self.pop_last_move()
 
     def print_moves(self) -> None:
         '''
             Print all moves in the order they were taken
         '''
-        for m in self.__moves:
+        for m in self.moves:
             print(m)
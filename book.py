@@ -0,0 +1,142 @@
+from move import move_player
+from board import AmazonsBoard
+from game import create_board
+from search import AlphaBetaSearch
+from territory import territory_evaluation
+
+from typing import Callable, Optional
+
+import argparse
+import os
+
+import numpy as np
+
+# One book entry: position hash (AmazonsBoard.hash), packed move, board size and the depth it was searched to
+BOOK_DTYPE = np.dtype([("hash", "<u8"), ("move", "<i8"), ("n", "u1"), ("depth", "u1")])
+
+class BookError(Exception):
+    pass
+
+def build_book(b : AmazonsBoard, plies : int = 2, replies : int = 3, time_limit : Optional[float] = 10.0, max_depth : Optional[int] = None, evaluate : Callable[[AmazonsBoard, int], float] = territory_evaluation) -> np.ndarray:
+    '''
+        Search the opening from the board and return the book entries, sorted by hash
+
+        Every position in the book gets the move an AlphaBetaSearch with the given budget chose. The book follows
+        that move and the next replies - 1 best moves by evaluate from each position, for plies moves, so it also
+        covers the most likely alternatives for both sides. Positions reached by different orders are only
+        searched once
+    '''
+    entries = {}
+
+    def expand(ply : int) -> None:
+        if ply >= plies or b.done or b.hash in entries:
+            return
+        to_move = 2 if b.last_player == 1 else 1
+        search = AlphaBetaSearch(evaluate)
+        best = search.search(b, to_move, time_limit, max_depth).code
+        entries[b.hash] = (best, search.depth)
+        if ply + 1 >= plies:
+            return
+
+        scores = {}
+        for code in b.populate_all_move_codes(to_move):
+            if code != best:
+                b.make_move(code, print_move = False, validate = False)
+                scores[code] = evaluate(b, to_move)
+                b.pop_last_move()
+        for code in [best] + sorted(scores, key = scores.get, reverse = True)[:replies - 1]:
+            b.make_move(code, print_move = False, validate = False)
+            expand(ply + 1)
+            b.pop_last_move()
+
+    expand(0)
+    book = np.array([(key, move, b.n, depth) for key, (move, depth) in entries.items()], dtype = BOOK_DTYPE)
+    return np.sort(book, order = "hash")
+
+def save_book(path : str, *books : np.ndarray) -> None:
+    '''
+        Write books to one file, sorted by hash so lookups can binary search it
+
+        Books for different board sizes and starting positions can share a file. Where two books have the same
+        position, the entry searched deepest is kept
+    '''
+    book = np.concatenate(books) if books else np.empty(0, dtype = BOOK_DTYPE)
+    # Deepest first within each position, then keep the first of each
+    book = book[np.lexsort((-book["depth"].astype(np.int16), book["n"], book["hash"]))]
+    keep = np.ones(len(book), dtype = bool)
+    keep[1:] = (book["hash"][1:] != book["hash"][:-1]) | (book["n"][1:] != book["n"][:-1])
+    np.save(path, book[keep])
+
+class OpeningBook(object):
+    '''
+        Moves for known positions, read from a file written by save_book
+
+        Nothing is read until the first lookup, then the file is memory mapped, so a book only costs the pages
+        its lookups touch. A book move is only returned if it is legal on the board asking, which guards against
+        hash collisions and books built with other starting positions
+    '''
+    def __init__(self, path : str):
+        self.__path = path
+        self.__entries = None
+
+    #<editor-fold> Properties
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def loaded(self):
+        return self.__entries is not None
+    #</editor-fold> Properties
+
+    def __load(self) -> np.ndarray:
+        if self.__entries is None:
+            if not os.path.exists(self.__path):
+                raise BookError(f"No opening book at {self.__path}")
+            entries = np.load(self.__path, mmap_mode = "r")
+            if entries.dtype != BOOK_DTYPE:
+                raise BookError(f"{self.__path} is not an opening book")
+            self.__entries = entries
+        return self.__entries
+
+    def __len__(self):
+        return len(self.__load())
+
+    def lookup(self, b : AmazonsBoard) -> Optional[int]:
+        '''
+            The packed book move for the board's position, or None if the book doesn't have it
+        '''
+        entries = self.__load()
+        hashes = entries["hash"]
+        key = np.uint64(b.hash)
+        i = int(np.searchsorted(hashes, key))
+        to_move = 2 if b.last_player == 1 else 1
+        while i < len(entries) and hashes[i] == key:
+            entry = entries[i]
+            move = int(entry["move"])
+            if entry["n"] == b.n and move_player(move) == to_move and b.is_legal(move):
+                return move
+            i += 1
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description = "Build an opening book from the standard starting position")
+    parser.add_argument("output", help = "book file to write (.npy), merged with what's already there")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [6, 8, 10], help = "board sizes to build for")
+    parser.add_argument("--plies", type = int, default = 2, help = "how many moves deep the book goes")
+    parser.add_argument("--replies", type = int, default = 3, help = "moves followed from each position")
+    parser.add_argument("--time", type = float, default = 10.0, help = "seconds to search each position")
+    parser.add_argument("--depth", type = int, help = "plies to search each position, instead of or as well as the time")
+    parser.add_argument("--backend", default = "array", help = "board backend to search with")
+    args = parser.parse_args()
+
+    books = [np.load(args.output)] if os.path.exists(args.output) else []
+    for n in args.sizes:
+        book = build_book(create_board(n, args.backend), args.plies, args.replies, args.time, args.depth)
+        print(f"{n}x{n}: {len(book)} positions")
+        books.append(book)
+    save_book(args.output, *books)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,268 @@
+from move import ID_SHIFT
+from board import AmazonsBoard, square_rays
+from bitboard import DIRECTIONS
+from timecontrol import Budget
+
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# Rollouts only try to solve positions with at most this many empty squares left, once every few moves
+ENDGAME_SQUARES = 12
+ENDGAME_INTERVAL = 4
+
+class NodeLimit(Exception):
+    pass
+
+class BudgetExpired(Exception):
+    pass
+
+@lru_cache(maxsize = None)
+def neighbour_masks(n : int) -> list[int]:
+    '''
+        For every square (indexed x * n + y), a bitmask of the squares next to it
+    '''
+    masks = []
+    for rays in square_rays(n, tuple(DIRECTIONS)):
+        mask = 0
+        for ray in rays:
+            if len(ray):
+                mask |= 1 << ray[0][0]
+        masks.append(mask)
+
+    return masks
+
+class EndgameSolver(object):
+    '''
+        Decide games the arrows have split into separate regions (see AmazonsBoard.regions)
+
+        Nothing one player does in a region they own can affect anything else, so an owned region only matters
+        through the most moves its owner can make in it, found with a single player search. Only the contested
+        regions are searched as a game, where on each turn a player can also spend one of their owned moves instead.
+        Dead regions are ignored
+
+        Each search is capped at max_nodes. If an owned region hits the cap, the moves found so far and the number
+        of empty squares are used as lower and upper bounds, and the game is only solved if it comes out the same
+        both ways. Positions with more than max_contested_squares empty squares in contested regions aren't searched,
+        which is checked before anything is, so an undecided position costs little more than finding its regions
+    '''
+    def __init__(self, max_nodes : int = 20000, max_contested_squares : int = 12):
+        self.__max_nodes = max_nodes
+        self.__max_contested_squares = max_contested_squares
+        self.__nodes = 0
+        self.__search_nodes = 0
+        self.__budget = None
+
+    #<editor-fold> Properties
+    @property
+    def max_nodes(self):
+        return self.__max_nodes
+
+    @property
+    def nodes(self):
+        return self.__nodes
+    #</editor-fold> Properties
+
+    def solve(self, b : AmazonsBoard, budget : Optional[Budget] = None) -> Optional[Tuple[int, int, int]]:
+        '''
+            Work out who wins from the board with best play
+
+            Returns (winner, moves left in the line found, packed move for the player to move), or None if the
+            position couldn't be decided, or the budget (a timecontrol.Budget) ran out first. The winner plays to
+            win, the loser plays to last as long as possible
+        '''
+        if b.done:
+            return None
+        self.__nodes = 0
+        self.__budget = budget if budget is not None and budget.limited else None
+        self.__n = b.n
+        self.__rays = square_rays(b.n, tuple(DIRECTIONS))
+        self.__neighbours = neighbour_masks(b.n)
+        to_move = 2 if b.last_player == 1 else 1
+
+        empty = 0
+        queens = {1 : [], 2 : []}
+        owned = []
+        for region in b.regions():
+            kind = region.kind
+            if kind == "contested":
+                for x, y in region.squares:
+                    empty |= 1 << (x * self.__n + y)
+                for id, pieces in region.pieces.items():
+                    queens[id].extend(x * self.__n + y for x, y in pieces)
+            elif kind == "owned":
+                owned.append(region)
+
+        # Most positions aren't decided yet, find that out before searching the owned regions
+        if bin(empty).count("1") > self.__max_contested_squares:
+            return None
+
+        # Bounds on how many moves each player can make in their own regions, and the first move of the best line found
+        lower = {1 : 0, 2 : 0}
+        upper = {1 : 0, 2 : 0}
+        first_moves = {1 : None, 2 : None}
+        try:
+            for region in owned:
+                owner = region.owner
+                at_least, at_most, first_move = self.__fill_region(region)
+                lower[owner] += at_least
+                upper[owner] += at_most
+                if first_moves[owner] is None and first_move is not None:
+                    first_moves[owner] = first_move
+        except BudgetExpired:
+            return None
+
+        state = (tuple(sorted(queens[1])), tuple(sorted(queens[2])))
+        opponent = 2 if to_move == 1 else 1
+        self.__search_nodes = 0
+        try:
+            # Give the player to move their worst case and the opponent their best, a win then is a win for sure
+            budgets = {to_move : lower[to_move], opponent : upper[opponent]}
+            wins, length, move = self.__play(empty, state, (budgets[1], budgets[2]), to_move, {})
+            if not wins:
+                # And the other way around for a sure loss
+                budgets = {to_move : upper[to_move], opponent : lower[opponent]}
+                if budgets[to_move] != lower[to_move] or budgets[opponent] != upper[opponent]:
+                    wins, length, move = self.__play(empty, state, (budgets[1], budgets[2]), to_move, {})
+                    if wins:
+                        return None
+        except (NodeLimit, BudgetExpired):
+            return None
+
+        # Spending an owned move means playing the first move of that region's best line
+        if move is None:
+            move = first_moves[to_move]
+        return (to_move if wins else opponent), length, move
+
+    def __count(self) -> None:
+        self.__nodes += 1
+        self.__search_nodes += 1
+        if self.__search_nodes > self.__max_nodes:
+            raise NodeLimit()
+        # Checking the clock costs more than a node, so only every so often
+        if self.__budget is not None and self.__nodes % 256 == 0 and self.__budget.expired():
+            raise BudgetExpired()
+
+    def __moves(self, empty : int, queens : Tuple[int, ...], id : int):
+        '''
+            Every move the queens can make over the empty squares, as (empty squares after, queens after, packed move)
+        '''
+        n = self.__n
+        rays = self.__rays
+        player = (id + 1) << ID_SHIFT
+        for i, start in enumerate(queens):
+            x0, y0 = divmod(start, n)
+            for ray in rays[start]:
+                for end, (x1, y1) in ray:
+                    if not empty >> end & 1:
+                        break
+                    moved = tuple(sorted(queens[:i] + (end,) + queens[i + 1:]))
+                    freed = (empty | 1 << start) & ~(1 << end)
+                    # Packed the same way as move.pack_move
+                    movement = player | x0 | y0 << 8 | x1 << 16 | y1 << 24
+                    # Can always attack where we just moved from
+                    yield freed & ~(1 << start), moved, movement | x0 << 32 | y0 << 40
+                    # Otherwise the queen is still on its starting square while the arrow flies, the same as check_move
+                    for arrow_ray in rays[end]:
+                        for attack, (ax, ay) in arrow_ray:
+                            if not empty >> attack & 1:
+                                break
+                            yield freed & ~(1 << attack), moved, movement | ax << 32 | ay << 40
+
+    def __can_move(self, empty : int, queens : Tuple[int, ...]) -> bool:
+        '''
+            Whether any of the queens has an empty square next to it
+        '''
+        for start in queens:
+            if empty & self.__neighbours[start]:
+                return True
+        return False
+
+    def __fill_region(self, region) -> Tuple[int, int, Optional[int]]:
+        '''
+            At least and at most how many moves the owner can make alone in an owned region, and the first move of the
+            best line found. The two counts are the same unless the search ran out of nodes
+        '''
+        owner = region.owner
+        empty = 0
+        for x, y in region.squares:
+            empty |= 1 << (x * self.__n + y)
+        queens = tuple(sorted(x * self.__n + y for x, y in region.pieces[owner]))
+
+        self.__search_nodes = 0
+        best, first_move = 0, None
+        seen = {}
+        try:
+            for after, moved, code in self.__moves(empty, queens, owner):
+                if first_move is None:
+                    # Any move at all is worth one
+                    best, first_move = 1, code
+                count = 1 + self.__fill(after, moved, owner, seen)
+                if count > best:
+                    best, first_move = count, code
+                # Every move uses up exactly one square, so nobody can do better than filling the region
+                if best == len(region.squares):
+                    break
+        except NodeLimit:
+            return best, len(region.squares), first_move
+        return best, best, first_move
+
+    def __fill(self, empty : int, queens : Tuple[int, ...], id : int, seen : dict) -> int:
+        '''
+            Most moves the queens can make from here with nobody else moving
+        '''
+        key = (empty, queens)
+        if key in seen:
+            return seen[key]
+        self.__count()
+
+        best = 0
+        limit = bin(empty).count("1")
+        for after, moved, _ in self.__moves(empty, queens, id):
+            best = max(best, 1 + self.__fill(after, moved, id, seen))
+            if best == limit:
+                break
+
+        seen[key] = best
+        return best
+
+    def __play(self, empty : int, queens : Tuple[Tuple[int, ...], Tuple[int, ...]], budgets : Tuple[int, int], to_move : int, seen : dict) -> Tuple[bool, int, Optional[int]]:
+        '''
+            Whether to_move wins the contested squares given the owned moves each player has left
+
+            Returns (wins, moves until the game ends, packed move or None for spending an owned move). The first
+            winning move found is taken, a losing player picks the move that lasts longest
+        '''
+        key = (empty, queens, budgets, to_move)
+        if key in seen:
+            return seen[key]
+        self.__count()
+
+        me, other = to_move - 1, 2 - to_move
+        best = None
+        for after, after_queens, after_budgets, code in self.__options(empty, queens, budgets, to_move):
+            # The same checks AmazonsBoard.check_done makes after every move
+            if after_budgets[other] == 0 and not self.__can_move(after, after_queens[other]):
+                result = (True, 1, code)
+            elif after_budgets[me] == 0 and not self.__can_move(after, after_queens[me]):
+                result = (False, 1, code)
+            else:
+                wins, length, _ = self.__play(after, after_queens, after_budgets, 2 if to_move == 1 else 1, seen)
+                result = (not wins, length + 1, code)
+
+            if best is None or (result[0] and not best[0]) or (not result[0] and not best[0] and result[1] > best[1]):
+                best = result
+            if best[0]:
+                break
+
+        seen[key] = best
+        return best
+
+    def __options(self, empty : int, queens : Tuple[Tuple[int, ...], Tuple[int, ...]], budgets : Tuple[int, int], to_move : int):
+        '''
+            Everything to_move can do in the game search, spending an owned move first as it's the cheapest to try
+        '''
+        me = to_move - 1
+        if budgets[me] > 0:
+            yield empty, queens, ((budgets[0] - 1, budgets[1]) if me == 0 else (budgets[0], budgets[1] - 1)), None
+        for after, moved, code in self.__moves(empty, queens[me], to_move):
+            yield after, ((moved, queens[1]) if me == 0 else (queens[0], moved)), budgets, code
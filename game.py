@@ -1,64 +1,139 @@
 from board import AmazonsBoard
+from bitboard import BitboardAmazonsBoard
 from player import Player
 from move import Move
+from transposition import TranspositionTable
+from timecontrol import Budget
 
 import time
 import numpy as np
 
+BOARD_BACKENDS = {
+    "array" : AmazonsBoard,
+    "bitboard" : BitboardAmazonsBoard,
+}
+
+# Players that choose their own moves, these hand over to the endgame solver once the game is decided
+AI_KINDS = ("Min", "Max", "MinMax", "Territory", "MCTS", "ParallelMCTS", "AlphaBeta", "UCT")
+
+def create_board(board_size, backend = "array", **kwargs):
+    '''
+        Create a board using the chosen backend ("array" or "bitboard")
+    '''
+    if backend not in BOARD_BACKENDS:
+        raise ValueError(f"Unknown board backend {backend}, expected one of {list(BOARD_BACKENDS)}")
+    return BOARD_BACKENDS[backend](board_size, **kwargs)
+
+def take_turn(player, kind, b, **kwargs):
+    '''
+        Have the player make one move of the given kind, returns False if the kind isn't known
+
+        AI players play the move from the opening_book (a book.OpeningBook) or the tablebase (a tablebase.Tablebase)
+        if one is passed and has the position, and play the endgame solver's move instead once the regions left on
+        the board decide the game, unless endgame = False is passed. "Tablebase" players only play tablebase moves,
+        and random moves outside it
+
+        A budget (a timecontrol.Budget), or move_time seconds and/or move_nodes nodes to make one from, caps how
+        long the AI players think, they play the best move found so far once it runs out
+    '''
+    budget = kwargs.get("budget")
+    if budget is None and (kwargs.get("move_time") is not None or kwargs.get("move_nodes") is not None):
+        budget = Budget(kwargs.get("move_time"), kwargs.get("move_nodes"))
+    if kind in AI_KINDS and (book := kwargs.get("opening_book")) is not None and player.make_book_move(b, book, print_move = kwargs.get("print_move")):
+        return True
+    if kind in AI_KINDS + ("Tablebase",) and (tablebase := kwargs.get("tablebase")) is not None and player.make_tablebase_move(b, tablebase, print_move = kwargs.get("print_move")):
+        return True
+    if kind in AI_KINDS and kwargs.get("endgame", True) and player.make_endgame_move(b, print_move = kwargs.get("print_move"), budget = budget):
+        return True
+    match kind:
+        case "Random" | "Tablebase":
+            player.make_random_move(b, print_move = kwargs.get("print_move"))
+        case "Human":
+            player.prompt_human_move(b)
+        case "Min":
+            player.make_min_opponent_move(b, print_move = kwargs.get("print_move"), budget = budget)
+        case "Max":
+            player.make_max_self_move(b, print_move = kwargs.get("print_move"), budget = budget)
+        case "MinMax":
+            player.make_minmax_move(b, print_move = kwargs.get("print_move"), budget = budget)
+        case "Territory":
+            player.make_territory_move(b, print_move = kwargs.get("print_move"), budget = budget)
+        case "MCTS":
+            player.make_mcts_move(b, kwargs.get("n_mcts_games"), print_move = kwargs.get("print_move"), mode = kwargs.get("mcts_mode"), cutoff = kwargs.get("mcts_cutoff"), budget = budget)
+        case "ParallelMCTS":
+            player.make_parallel_mcts_move(b, kwargs.get("n_mcts_games"), kwargs.get("mcts_pool"), print_move = kwargs.get("print_move"), mode = kwargs.get("mcts_mode"), cutoff = kwargs.get("mcts_cutoff"), budget = budget)
+        case "AlphaBeta":
+            player.make_alphabeta_move(b, kwargs.get("alphabeta_time"), kwargs.get("alphabeta_depth"), print_move = kwargs.get("print_move"), evaluate = kwargs.get("alphabeta_evaluate"), budget = budget)
+        case "UCT":
+            player.make_uct_move(b, kwargs.get("uct_iterations"), kwargs.get("uct_max_nodes"), print_move = kwargs.get("print_move"), budget = budget)
+        case other:
+            print(f"Some other case tried: {other}")
+            return False
+    return True
+
 def play_game(board_size, player_1, player_2, **kwargs):
-    b = AmazonsBoard(board_size, starting_positions = kwargs.get("starting_positions"))
-    p = Player(1)
-    q = Player(2)
+    '''
+        Play a game between two kinds of player, returns (winner, number of moves)
+
+        Keywords are passed to both players' take_turn, player_1_kwargs and player_2_kwargs override them for one
+        player, so two players of the same kind can play with different settings
+
+        With a time_control (a timecontrol.TimeControl) every move gets a budget from the player's clock. With
+        ponder = True "UCT" and "AlphaBeta" players keep searching in the background during the opponent's turn
+        (see Player.start_pondering, ponder_nodes caps a UCT tree), pondering is stopped before the player's own
+        turn and whenever the game ends, even with an error. on_move(player, kind, board) is called after every
+        move, before the player starts pondering, so it can read the player's search safely
+    '''
+    b = create_board(board_size, kwargs.get("backend", "array"), starting_positions = kwargs.get("starting_positions"))
+    # Optional per-player transposition tables, sized in bytes
+    if (table_bytes := kwargs.get("transposition_table_bytes")) is not None:
+        p = Player(1, TranspositionTable(table_bytes, kwargs.get("transposition_table_policy", "lru")))
+        q = Player(2, TranspositionTable(table_bytes, kwargs.get("transposition_table_policy", "lru")))
+    else:
+        p = Player(1)
+        q = Player(2)
 
     print_board = kwargs.get("print_board", False)
 
     if print_board is not False:
         print(b, "\n")
 
-    while not b.done:
-        match player_1:
-            case "Random":
-                p.make_random_move(b, print_move = kwargs.get("print_move"))
-            case "Human":
-                p.prompt_human_move(b)
-            case "Min":
-                p.make_min_opponent_move(b, print_move = kwargs.get("print_move"))
-            case "Max":
-                p.make_max_self_move(b, print_move = kwargs.get("print_move"))
-            case "MinMax":
-                p.make_minmax_move(b, print_move = kwargs.get("print_move"))
-            case "MCTS":
-                p.make_mcts_move(b, kwargs.get("n_mcts_games"), print_move = kwargs.get("print_move"), mode = kwargs.get("mcts_mode"))
-            case other:
-                print(f"Some other case tried: {other}")
-                break
-        if print_board is not False:
-            print(b, "\n")
-        if b.done:
-            break
-
-        match player_2:
-            case "Random":
-                q.make_random_move(b, print_move = kwargs.get("print_move"))
-            case "Human":
-                q.prompt_human_move(b)
-            case "Min":
-                q.make_min_opponent_move(b, print_move = kwargs.get("print_move"))
-            case "Max":
-                q.make_max_self_move(b, print_move = kwargs.get("print_move"))
-            case "MinMax":
-                q.make_minmax_move(b, print_move = kwargs.get("print_move"))
-            case other:
-                print(f"Some other case tried: {other}")
-                break
-        if print_board is not False:
-            print(b, "\n")
-        if b.done:
-            break
+    players = (
+        (p, player_1, {**kwargs, **kwargs.get("player_1_kwargs", {})}),
+        (q, player_2, {**kwargs, **kwargs.get("player_2_kwargs", {})}),
+    )
+    turn = 0
+    try:
+        while not b.done:
+            player, kind, player_kwargs = players[turn % 2]
+            player.stop_pondering()
+            if (time_control := player_kwargs.get("time_control")) is not None:
+                player_kwargs["budget"] = time_control.budget(b, player.id, player_kwargs.get("move_nodes"))
+            try:
+                if not take_turn(player, kind, b, **player_kwargs):
+                    break
+            finally:
+                if time_control is not None:
+                    time_control.stop(player.id)
+            # Optional callback (player, kind, board) after every move, before pondering starts changing the
+            # player's search from another thread
+            if (on_move := kwargs.get("on_move")) is not None:
+                on_move(player, kind, b)
+            if player_kwargs.get("ponder", False):
+                player.start_pondering(b, kind, player_kwargs.get("ponder_nodes"), player_kwargs.get("alphabeta_evaluate"))
+            if print_board is not False:
+                print(b, "\n")
+            turn += 1
+    finally:
+        for player, _, _ in players:
+            player.stop_pondering()
+    # Optional records.GameRecordWriter to save the game to
+    if (record := kwargs.get("record")) is not None:
+        record.write(b)
     if kwargs.get("print_end", False) is not False:
-        print(f"Player {b.winner} won! Game took {len(b.moves)} turns.")
+        print(f"Player {b.winner} won! Game took {len(b.history)} turns.")
 
-    return b.winner, len(b.moves)
+    return b.winner, len(b.history)
 
 
 def main():
@@ -1,58 +1,165 @@
 from typing import Tuple, Optional
 
+# A move packs into one int, 8 bits per coordinate then the player id (stored as id + 1 so -1 fits)
+#   bits 0-7 x0, 8-15 y0, 16-23 x1, 24-31 y1, 32-39 ax, 40-47 ay, 48-49 id + 1
+COORDINATE_BITS = 8
+COORDINATE_MASK = (1 << COORDINATE_BITS) - 1
+ID_SHIFT = 6 * COORDINATE_BITS
+# The symmetries of a square board, as bit flags applied in this order: 1 swaps x and y, 2 mirrors x, 4 mirrors y.
+# 0 is the identity, and e.g. 1 | 2 is a quarter turn
+TRANSFORMS = tuple(range(8))
+
+def pack_move(from_position : Tuple[int, int], to_position : Tuple[int, int], attack_position : Tuple[int, int], id : int = -1) -> int:
+    '''
+        Encode a move as a single int
+
+        Raises ValueError for a coordinate that doesn't fit in its 8 bits (0 - 255) or an id that isn't -1 - 2,
+        rather than wrapping it onto another square. The move generators pack their moves themselves and skip this
+    '''
+    x0, y0 = from_position
+    x1, y1 = to_position
+    ax, ay = attack_position
+    # Coordinates may be small NumPy integers, which would overflow when shifted
+    x0, y0, x1, y1, ax, ay = int(x0), int(y0), int(x1), int(y1), int(ax), int(ay)
+    mask = COORDINATE_MASK
+    if not (0 <= x0 <= mask and 0 <= y0 <= mask and 0 <= x1 <= mask and 0 <= y1 <= mask and 0 <= ax <= mask and 0 <= ay <= mask):
+        bad = next(c for c in (x0, y0, x1, y1, ax, ay) if not 0 <= c <= mask)
+        raise ValueError(f"Coordinate {bad} is out of range, moves fit coordinates 0 - {mask}")
+    if not -1 <= id <= 2:
+        raise ValueError(f"Player id {id} is out of range, moves fit ids -1 - 2")
+    return x0 | y0 << 8 | x1 << 16 | y1 << 24 | ax << 32 | ay << 40 | (id + 1) << ID_SHIFT
+
+def unpack_move(code : int) -> Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int], int]:
+    '''
+        Decode a packed move into (start, end, attack, id)
+    '''
+    return (
+        (code & COORDINATE_MASK, code >> 8 & COORDINATE_MASK),
+        (code >> 16 & COORDINATE_MASK, code >> 24 & COORDINATE_MASK),
+        (code >> 32 & COORDINATE_MASK, code >> 40 & COORDINATE_MASK),
+        (code >> ID_SHIFT) - 1,
+    )
+
+def transform_position(position : Tuple[int, int], n : int, transform : int) -> Tuple[int, int]:
+    '''
+        Apply one of the 8 symmetries of an n x n board (0 - 7, see TRANSFORMS) to a square
+    '''
+    x, y = position
+    if transform & 1:
+        x, y = y, x
+    if transform & 2:
+        x = n - 1 - x
+    if transform & 4:
+        y = n - 1 - y
+    return x, y
+
+def transform_move(code : int, n : int, transform : int) -> int:
+    '''
+        Apply one of the 8 symmetries of an n x n board to a packed move, keeping its id
+    '''
+    x0, y0, x1, y1, ax, ay = (code >> shift & COORDINATE_MASK for shift in range(0, ID_SHIFT, COORDINATE_BITS))
+    if transform & 1:
+        x0, y0, x1, y1, ax, ay = y0, x0, y1, x1, ay, ax
+    if transform & 2:
+        x0, x1, ax = n - 1 - x0, n - 1 - x1, n - 1 - ax
+    if transform & 4:
+        y0, y1, ay = n - 1 - y0, n - 1 - y1, n - 1 - ay
+    return (code >> ID_SHIFT) << ID_SHIFT | x0 | y0 << 8 | x1 << 16 | y1 << 24 | ax << 32 | ay << 40
+
+def move_player(code : int) -> int:
+    '''
+        Id of the player making a packed move
+    '''
+    return (code >> ID_SHIFT) - 1
+
 class Move(object):
+    '''
+        View of a packed move (see pack_move), so moves can be kept as plain ints and only wrapped when needed
+    '''
+    __slots__ = ("__code",)
+
     def __init__(self, from_position : Tuple[int, int], to_position : Tuple[int, int], attack_position : Tuple[int, int], id : Optional[int] = -1):
-        self.__x0, self.__y0 = from_position
-        self.__x1, self.__y1 = to_position
-        self.__ax, self.__ay = attack_position
-        self.__player_id = id # While optional (since the player could generate the move) it does need to be set for it to be a valid move
+        # While optional (since the player could generate the move) the id does need to be set for it to be a valid move
+        self.__code = pack_move(from_position, to_position, attack_position, id)
+
+    @classmethod
+    def from_code(cls, code : int) -> "Move":
+        '''
+            Wrap a packed move without re-encoding it
+        '''
+        m = cls.__new__(cls)
+        m.__code = code
+        return m
 
     #<editor-fold> Properties
+    @property
+    def code(self):
+        return self.__code
+
     @property
     def x0(self):
-        return self.__x0
+        return self.__code & COORDINATE_MASK
 
     @property
     def y0(self):
-        return self.__y0
+        return self.__code >> 8 & COORDINATE_MASK
 
     @property
     def ax(self):
-        return self.__ax
+        return self.__code >> 32 & COORDINATE_MASK
 
     @property
     def ay(self):
-        return self.__ay
+        return self.__code >> 40 & COORDINATE_MASK
 
     @property
     def x1(self):
-        return self.__x1
+        return self.__code >> 16 & COORDINATE_MASK
 
     @property
     def y1(self):
-        return self.__y1
+        return self.__code >> 24 & COORDINATE_MASK
 
     @property
     def start(self):
-        return self.x0, self.y0
+        return self.__code & COORDINATE_MASK, self.__code >> 8 & COORDINATE_MASK
 
     @property
     def end(self):
-        return self.x1, self.y1
+        return self.__code >> 16 & COORDINATE_MASK, self.__code >> 24 & COORDINATE_MASK
 
     @property
     def attack(self):
-        return self.ax, self.ay
+        return self.__code >> 32 & COORDINATE_MASK, self.__code >> 40 & COORDINATE_MASK
 
     @property
     def id(self):
-        return self.__player_id
+        return (self.__code >> ID_SHIFT) - 1
+    #</editor-fold> Properties
 
-    @id.setter
-    def id(self, id : int) -> None:
-        self.__player_id = id
+    def with_id(self, id : int) -> "Move":
+        '''
+            The same move made by another player
 
-    #</editor-fold> Properties
+            Moves are hashed by their code, which includes the id, so a move is never changed in place
+        '''
+        if not -1 <= id <= 2:
+            raise ValueError(f"Player id {id} is out of range, moves fit ids -1 - 2")
+        return Move.from_code((self.__code & ((1 << ID_SHIFT) - 1)) | (id + 1) << ID_SHIFT)
+
+    def transformed(self, n : int, transform : int) -> "Move":
+        '''
+            The same move on an n x n board after one of its symmetries (see transform_move)
+        '''
+        return Move.from_code(transform_move(self.__code, n, transform))
+
+    def __eq__(self, other):
+        if not isinstance(other, Move):
+            return NotImplemented
+        return self.__code == other.__code
+
+    def __hash__(self):
+        return hash(self.__code)
 
     def __str__(self):
         return f"{self.id}: {self.x0, self.y0} -> {self.x1, self.y1} @ {self.ax, self.ay}"
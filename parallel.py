@@ -0,0 +1,93 @@
+from move import Move
+from board import AmazonsBoard
+from player import Player
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import os
+import random
+
+def evaluate_moves(board_class : type, position : Tuple[int, bytes, int], player_id : int, moves : list[int], seeds : list[int], times_play : int, mode : Optional[str], cutoff : Optional[int] = None) -> list[Tuple[bool, int]]:
+    '''
+        Worker side of MCTSPool: simulate each root move "times_play" times from the compact position
+
+        Moves arrive packed (see move.pack_move), each with its own seed. The lengths returned count moves from the
+        shipped position, the caller adds the length of its own move history
+    '''
+    b = board_class.from_compact(position)
+    player = Player(player_id)
+    opponent_id = 2 if player_id == 1 else 1
+    results = []
+    for code, seed in zip(moves, seeds):
+        random.seed(seed)
+        player.make_move(Move.from_code(code), b, print_move = False)
+        results.append(player.simulate(b, opponent_id, times_play, mode, cutoff))
+        b.pop_last_move()
+
+    return results
+
+class MCTSPool(object):
+    '''
+        Long lived process pool that splits the root moves of Player.mcts across workers
+
+        Each decision ships the position once per task in the compact form from AmazonsBoard.to_compact. Every
+        root move gets its own seed derived from the pool seed, the decision number and the move's index, so a
+        seeded pool gives the same results however the moves are split and whichever worker runs them
+    '''
+    def __init__(self, workers : Optional[int] = None, seed : Optional[int] = None, tasks_per_worker : int = 4):
+        self.__workers = workers if workers is not None else os.cpu_count()
+        self.__seed = seed if seed is not None else random.getrandbits(32)
+        self.__tasks_per_worker = tasks_per_worker
+        self.__decisions = 0
+        self.__executor = ProcessPoolExecutor(max_workers = self.__workers)
+
+    #<editor-fold> Properties
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def seed(self):
+        return self.__seed
+    #</editor-fold> Properties
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        '''
+            Shut the worker processes down
+        '''
+        self.__executor.shutdown()
+
+    def evaluate(self, b : AmazonsBoard, player_id : int, times_play : int, mode : Optional[str] = None, cutoff : Optional[int] = None) -> dict[Move, Tuple[bool, int]]:
+        '''
+            Simulate every root move for player_id (one of each group of symmetric twins) on the workers and merge
+            the results
+
+            Returns the same move -> (won, fewest total moves) mapping Player.mcts builds
+        '''
+        moves = Player(player_id).generate_unique_moves(b)
+        position = b.to_compact()
+        n_tasks = max(1, min(len(moves), self.__workers * self.__tasks_per_worker))
+        chunks = [moves[i::n_tasks] for i in range(n_tasks)]
+
+        seeds = [hash((self.__seed, self.__decisions, index)) for index in range(len(moves))]
+        self.__decisions += 1
+
+        futures = []
+        for i in range(n_tasks):
+            codes = [m.code for m in chunks[i]]
+            futures.append(self.__executor.submit(evaluate_moves, type(b), position, player_id, codes, seeds[i::n_tasks], times_play, mode, cutoff))
+
+        history = len(b.history)
+        move_dict = {}
+        for chunk, future in zip(chunks, futures):
+            for m, (won, length) in zip(chunk, future.result()):
+                move_dict[m] = (won, length + history) if won else (won, length)
+
+        return move_dict
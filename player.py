@@ -1,15 +1,41 @@
 from move import Move
 from board import AmazonsBoard
+from rollout import batched_playouts
+from transposition import TranspositionTable
+from uct import UCTSearch
+from search import AlphaBetaSearch
+from endgame import EndgameSolver, ENDGAME_INTERVAL, ENDGAME_SQUARES
+from territory import territory_evaluation
+from timecontrol import Budget
 
-from typing import Optional, Tuple
+from typing import Any, Callable, Hashable, Iterator, Optional, Tuple
 
-import random
 from copy import deepcopy
 
+import random
+import threading
+
+import numpy as np
+
+# Simulations of each root move per round of a "batched" anytime_mcts
+BATCHED_ROUND = 16
+# Kinds of player that can keep searching while the opponent decides
+PONDER_KINDS = ("UCT", "AlphaBeta")
+
+def merge_outcomes(first : Tuple[bool, int], second : Tuple[bool, int]) -> Tuple[bool, int]:
+    '''
+        Combine two (won, fewest total moves) simulation results for the same move
+    '''
+    if first[0] and second[0]:
+        return (True, min(first[1], second[1]))
+    return first if first[0] else second
+
 class Player(object):
-    def __init__(self, id : int):
+    def __init__(self, id : int, transposition_table : Optional[TranspositionTable] = None):
         assert id in set((1, 2)), "Id Error: Player Id must be either 1 or 2"
         self.__id = id
+        self.__transposition_table = transposition_table
+        self.__ponder = None
 
         self.reset()
 
@@ -21,24 +47,146 @@ class Player(object):
     def moves(self):
         return self.__moves
 
+    @property
+    def transposition_table(self):
+        return self.__transposition_table
+
+    @property
+    def uct_search(self):
+        # The tree kept between make_uct_move calls, None until the first one
+        return self.__uct
+
+    @property
+    def pondering(self):
+        return self.__ponder is not None
+
     def make_move(self, m : Move, b : AmazonsBoard, **kwargs) -> None:
         '''
             How the player interacts with the board
         '''
-        m.id = self.id
-        b.make_move(m, **kwargs)
+        b.make_move(m.with_id(self.id), **kwargs)
 
     def reset(self) -> None:
-        pass
+        self.stop_pondering()
+        self.__uct = None
+        self.__alphabeta = None
+        self.__endgame = EndgameSolver()
+        # Rollouts try to solve every other move, so they only get a small search
+        self.__rollout_endgame = EndgameSolver(max_nodes = 50, max_contested_squares = 4)
+
+    def start_pondering(self, b : AmazonsBoard, kind : str, max_nodes : Optional[int] = None, evaluate : Optional[Callable[[AmazonsBoard, int], float]] = None) -> bool:
+        '''
+            Keep searching in a background thread while the opponent decides, returns whether pondering started
+
+            Only for PONDER_KINDS, right after our own move. "UCT" grows its tree from the opponent's side, so every
+            reply gets tried and the ones they're most likely to play get the most simulations, and the subtree of
+            the reply they do play is where the next make_uct_move starts. There are too many replies for guessing
+            one to pay off. max_nodes caps the size of the tree. "AlphaBeta" searches the opponent's move with
+            evaluate, filling the transposition table and history scores the next make_alphabeta_move starts from.
+            The search runs on a copy of the board, and any decision of ours stops it first. It shares the
+            interpreter with everything else, so it's free against a human or another process but slows down an
+            opponent playing in the same process
+        '''
+        opponent_id = 2 if self.id == 1 else 1
+        if self.__ponder is not None or kind not in PONDER_KINDS or b.done or b.last_player != self.id:
+            return False
+        board = deepcopy(b)
+        stop = threading.Event()
+        if kind == "UCT":
+            if self.__uct is None:
+                self.__uct = UCTSearch()
+            search = lambda : self.__uct.search(board, opponent_id, max_nodes = max_nodes, stop = stop)
+        else:
+            if self.__alphabeta is None:
+                self.__alphabeta = AlphaBetaSearch(evaluate, self.transposition_table)
+            search = lambda : self.__alphabeta.search(board, opponent_id, stop = stop)
+
+        errors = []
+
+        def ponder():
+            try:
+                search()
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target = ponder, name = f"ponder-player-{self.id}", daemon = True)
+        self.__ponder = (thread, stop, kind, errors)
+        thread.start()
+        return True
+
+    def stop_pondering(self) -> int:
+        '''
+            Cancel pondering and wait for the search to stop, returns how many simulations ("UCT") or positions
+            ("AlphaBeta") it searched. An error in the search is raised here
+        '''
+        if self.__ponder is None:
+            return 0
+        thread, stop, kind, errors = self.__ponder
+        self.__ponder = None
+        stop.set()
+        thread.join()
+        if len(errors):
+            raise errors[0]
+        return self.__uct.simulations if kind == "UCT" else self.__alphabeta.nodes
+
+    def cached_value(self, b : AmazonsBoard, label : Hashable, compute : Callable[[], Any]) -> Any:
+        '''
+            Get a value for the current position from the transposition table, computing and storing it on a miss
+
+            The label separates the different kinds of values a player stores for the same position
+        '''
+        if self.__transposition_table is None:
+            return compute()
+        key = (b.hash, self.id, label)
+        value = self.__transposition_table.lookup(key)
+        if value is None:
+            value = compute()
+            self.__transposition_table.store(key, value)
+        return value
+
+    def make_endgame_move(self, b : AmazonsBoard, **kwargs) -> bool:
+        '''
+            If the regions left on the board decide the game, play the solver's move and return True
+
+            The winning side plays a move that keeps the win, the losing side one that makes the game last longest.
+            A "budget" keyword (a timecontrol.Budget) stops the solver when it runs out, leaving the move to the AI
+        '''
+        outcome = self.__endgame.solve(b, kwargs.pop("budget", None))
+        if outcome is None:
+            return False
+        self.make_move(Move.from_code(outcome[2]), b, **kwargs)
+        return True
+
+    def make_book_move(self, b : AmazonsBoard, book, **kwargs) -> bool:
+        '''
+            If the opening book (see book.OpeningBook) has the position, play its move and return True
+        '''
+        code = book.lookup(b)
+        if code is None:
+            return False
+        self.make_move(Move.from_code(code), b, **kwargs)
+        return True
+
+    def make_tablebase_move(self, b : AmazonsBoard, tablebase, **kwargs) -> bool:
+        '''
+            If the tablebase (see tablebase.Tablebase) has the position, play its best move and return True
+        '''
+        if (2 if b.last_player == 1 else 1) != self.id:
+            return False
+        code = tablebase.best_move(b)
+        if code is None:
+            return False
+        self.make_move(Move.from_code(code), b, **kwargs)
+        return True
 
     def make_random_move(self, b : AmazonsBoard, **kwargs) -> None:
         '''
             Generate a random piece to move to a random location, then pick a random place to attack
         '''
         # From all pieces, pick a random starting and ending point (valid ending point no matter the starting point)
-        next_move = random.choice(b.populate_all_movements(self.id))
+        next_move = b.random_movement(self.id)
         # From the next move, pick a random place to attack
-        next_attack = random.choice(b.populate_all_attacks_for_move(*next_move))
+        next_attack = b.random_attack(*next_move)
         # Take the random move
         self.make_move(Move(*next_move, next_attack, self.id), b, **kwargs)
 
@@ -46,15 +194,15 @@ class Player(object):
         '''
             Calculate the move that leaves the opponent with the least number of moves
         '''
-        # Generate all moves we can take
-        all_moves = self.generate_all_moves(b)
+        # Go through all moves we can take, one at a time
+        all_moves = self.candidate_moves(b, kwargs.get("budget"))
         move_values = {}
         other_player_id = 2 if self.id == 1 else 1
         for m in all_moves:
             # Make the move on the board
             self.make_move(m, b, print_move = False)
             # Calculate how many moves the other player can take
-            move_values[m] = len(b.populate_all_movements(other_player_id))
+            move_values[m] = self.cached_value(b, "min", lambda : b.mobility(other_player_id))
             # Undo the move we just made
             b.pop_last_move()
 
@@ -66,14 +214,14 @@ class Player(object):
         '''
             Calculate the move that leaves us with the most number of moves after taking this move
         '''
-        # Generate all moves we can take
-        all_moves = self.generate_all_moves(b)
+        # Go through all moves we can take, one at a time
+        all_moves = self.candidate_moves(b, kwargs.get("budget"))
         move_values = {}
         for m in all_moves:
             # Make the move on the board
             self.make_move(m, b, print_move = False)
             # Calculate how many moves we can take after this move
-            move_values[m] = len(b.populate_all_movements(self.id))
+            move_values[m] = self.cached_value(b, "max", lambda : b.mobility(self.id))
             # Undo the move we just made
             b.pop_last_move()
 
@@ -87,17 +235,15 @@ class Player(object):
 
             To find this move, we take max(# of moves we can make / # of moves our opponent can make)
         '''
-        # Generate all moves we can take
-        all_moves = self.generate_all_moves(b)
+        # Go through all moves we can take, one at a time
+        all_moves = self.candidate_moves(b, kwargs.get("budget"))
         move_values = {}
         other_player_id = 2 if self.id == 1 else 1
         for m in all_moves:
             # Make the move on the board
             self.make_move(m, b, print_move = False)
-            # Calculate the number of moves this leaves our opponent with
-            other_player_moves = len(b.populate_all_movements(other_player_id))
-            # Calculate the number of moves we can make after this move
-            self_moves = len(b.populate_all_movements(self.id))
+            # Calculate the number of moves this leaves our opponent with and the number we can make after this move
+            self_moves, other_player_moves = self.cached_value(b, "minmax", lambda : (b.mobility(self.id), b.mobility(other_player_id)))
             try:
                 # Set the value
                 move_values[m] = self_moves / other_player_moves
@@ -111,60 +257,218 @@ class Player(object):
         best_move = max(move_values, key = move_values.get)
         self.make_move(best_move, b, **kwargs)
 
+    def make_territory_move(self, b : AmazonsBoard, **kwargs) -> None:
+        '''
+            Calculate the move that leaves us with the best territory score (see territory.territory_evaluation)
+        '''
+        move_values = {}
+        for m in self.candidate_moves(b, kwargs.get("budget")):
+            self.make_move(m, b, print_move = False)
+            move_values[m] = self.cached_value(b, "territory", lambda : territory_evaluation(b, self.id))
+            b.pop_last_move()
+
+        best_move = max(move_values, key = move_values.get)
+        self.make_move(best_move, b, **kwargs)
+
     def generate_all_moves(self, b : AmazonsBoard) -> list[Move]:
         '''
             Generate all moves we can take on the board
         '''
-        all_moves = []
-        # Generate all places we can move to
-        all_movements = b.populate_all_movements(self.id)
-        for movement in all_movements:
-            # Generate all places this move can attack
-            all_attacks = b.populate_all_attacks_for_move(*movement)
-            # Add these moves to the list
-            all_moves.extend([Move(*movement, attack, self.id) for attack in all_attacks])
+        return [Move.from_code(code) for code in b.populate_all_move_codes(self.id)]
+
+    def generate_unique_moves(self, b : AmazonsBoard) -> list[Move]:
+        '''
+            Generate one move for each group of moves that are symmetric twins on the board (see
+            AmazonsBoard.populate_unique_move_codes), every move if the position has no symmetry
+
+            Twins lead to the same position reflected or rotated, so they're worth the same and a root search only
+            needs to look at one of them
+        '''
+        return [Move.from_code(code) for code in b.populate_unique_move_codes(self.id)]
+
+    def iter_all_moves(self, b : AmazonsBoard) -> Iterator[Move]:
+        '''
+            Lazily yield all moves we can take on the board, in the same order as generate_all_moves
 
-        return all_moves
+            Each move can be made and undone before asking for the next one
+        '''
+        for code in b.iter_move_codes(self.id):
+            yield Move.from_code(code)
+
+    def candidate_moves(self, b : AmazonsBoard, budget : Optional[Budget] = None) -> Iterator[Move]:
+        '''
+            The moves a one ply player scores, all of them in generation order without a budget, leaving out
+            symmetric twins (see generate_unique_moves)
+
+            With a budget, the most promising moves come first (arrows closest to an opponent queen) and the moves
+            stop once the budget runs out, after at least one. Every move yielded counts as a node
+        '''
+        if budget is None or not budget.limited:
+            yield from self.iter_all_moves(b) if len(b.symmetries()) == 1 else self.generate_unique_moves(b)
+            return
+        board = b.to_array()
+        opponent_id = 2 if self.id == 1 else 1
+        queens = [(int(x), int(y)) for x, y in zip(*np.nonzero(board == opponent_id))]
+
+        def distance(code : int) -> int:
+            ax, ay = code >> 32 & 0xFF, code >> 40 & 0xFF
+            return min((max(abs(ax - x), abs(ay - y)) for x, y in queens), default = 0)
+
+        for i, code in enumerate(sorted(b.populate_unique_move_codes(self.id), key = distance)):
+            if i and budget.expired():
+                return
+            budget.count()
+            yield Move.from_code(code)
+
+    def random_legal_move(self, b : AmazonsBoard) -> Move:
+        '''
+            Pick uniformly from all moves we can take, without building the list of them
+        '''
+        # Reservoir sampling, the i'th move replaces the choice with probability 1 / i
+        choice = None
+        for i, m in enumerate(self.iter_all_moves(b), 1):
+            if random.randrange(i) == 0:
+                choice = m
+
+        return choice
 
     def prompt_human_move(self, b : AmazonsBoard, **kwargs) -> None:
-        piece = input("Which piece would you like to move? Ex. 'x,y'")
-        location = input("Where would you like to move that piece to? Ex. 'x,y'")
-        attack = input("Where would you like the piece to attack? Ex. 'x,y'")
-        piece = tuple([int(x) for x in piece.split(",")])
-        location = tuple([int(x) for x in location.split(",")])
-        attack = tuple([int(x) for x in attack.split(",")])
-        self.make_move(Move(piece, location, attack), b, **kwargs)
+        '''
+            Ask for a move until the three squares make one, anything that isn't 'x,y' or doesn't fit in a move
+            (a negative coordinate, more than 255) is asked for again
+        '''
+        while True:
+            piece = input("Which piece would you like to move? Ex. 'x,y'")
+            location = input("Where would you like to move that piece to? Ex. 'x,y'")
+            attack = input("Where would you like the piece to attack? Ex. 'x,y'")
+            try:
+                piece = tuple([int(x) for x in piece.split(",")])
+                location = tuple([int(x) for x in location.split(",")])
+                attack = tuple([int(x) for x in attack.split(",")])
+                m = Move(piece, location, attack)
+                break
+            except ValueError as e:
+                print(f"That isn't a move, try again ({e})")
+        self.make_move(m, b, **kwargs)
 
-    def make_mcts_move(self, b : AmazonsBoard, times_play : int, **kwargs) -> None:
+    def make_mcts_move(self, b : AmazonsBoard, times_play : Optional[int], **kwargs) -> None:
         '''
             Make a move using a pseudo-pure Monte Carlo Tree Search
+
+            With a "budget" keyword the root moves are simulated in rounds until it runs out (or times_play rounds)
         '''
         opponent_id = 1 if self.id == 2 else 2
-        self.make_move(self.mcts(b, opponent_id, times_play, mode = kwargs.get("mode")), b, **kwargs)
+        if (budget := kwargs.get("budget")) is not None and budget.limited:
+            m = self.anytime_mcts(b, opponent_id, budget, times_play, mode = kwargs.get("mode"), cutoff = kwargs.get("cutoff"))
+        else:
+            m = self.mcts(b, opponent_id, times_play, mode = kwargs.get("mode"), cutoff = kwargs.get("cutoff"))
+        self.make_move(m, b, **kwargs)
 
-    def mcts(self, b : AmazonsBoard, opponent_id : int, times_play : int, mode : Optional[str] = None) -> Move:
+    def make_parallel_mcts_move(self, b : AmazonsBoard, times_play : Optional[int], pool, **kwargs) -> None:
         '''
-            Find the best move using a MCTS
+            Make a move using the same search as make_mcts_move with the root moves split across an MCTSPool
+
+            With a "budget" keyword the pool is asked for one simulation of every root move at a time until it runs
+            out (or times_play rounds). A round can't be stopped part way, so it can run over by up to one round
         '''
-        all_moves = self.generate_all_moves(b)
+        if (budget := kwargs.get("budget")) is not None and budget.limited:
+            move_dict = {}
+            rounds = 0
+            while times_play is None or rounds < times_play:
+                if rounds and budget.expired():
+                    break
+                for m, outcome in pool.evaluate(b, self.id, 1, mode = kwargs.get("mode"), cutoff = kwargs.get("cutoff")).items():
+                    move_dict[m] = merge_outcomes(move_dict.get(m, (False, 0)), outcome)
+                budget.count(len(move_dict))
+                rounds += 1
+        else:
+            move_dict = pool.evaluate(b, self.id, times_play, mode = kwargs.get("mode"), cutoff = kwargs.get("cutoff"))
+        self.make_move(self.choose_mcts_move(b, move_dict), b, **kwargs)
+
+    def make_alphabeta_move(self, b : AmazonsBoard, time_limit : Optional[float] = None, max_depth : Optional[int] = None, **kwargs) -> None:
+        '''
+            Make a move using an iterative deepening alpha-beta search
+
+            An "evaluate" keyword replaces the default mobility difference evaluation. A "budget" keyword also
+            stops the search when it runs out, counting searched positions as nodes
+        '''
+        self.stop_pondering()
+        if self.__alphabeta is None:
+            self.__alphabeta = AlphaBetaSearch(kwargs.get("evaluate"), self.transposition_table)
+        max_nodes = None
+        if (budget := kwargs.get("budget")) is not None and budget.limited:
+            if (seconds := budget.seconds_left()) is not None:
+                time_limit = seconds if time_limit is None else min(time_limit, seconds)
+            max_nodes = budget.nodes_left()
+        m = self.__alphabeta.search(b, self.id, time_limit, max_depth, max_nodes)
+        if budget is not None:
+            budget.count(self.__alphabeta.nodes)
+        self.make_move(m, b, **kwargs)
+
+    def make_uct_move(self, b : AmazonsBoard, iterations : Optional[int] = None, max_nodes : Optional[int] = None, **kwargs) -> None:
+        '''
+            Make a move using a UCT tree search, keeping the tree between turns
+
+            A "budget" keyword also stops the search when it runs out, counting simulations as nodes
+        '''
+        self.stop_pondering()
+        if self.__uct is None:
+            self.__uct = UCTSearch(kwargs["exploration"]) if "exploration" in kwargs else UCTSearch()
+        time_limit = None
+        if (budget := kwargs.get("budget")) is not None and budget.limited:
+            time_limit = budget.seconds_left()
+            if (nodes := budget.nodes_left()) is not None:
+                iterations = nodes if iterations is None else min(iterations, nodes)
+        m = self.__uct.search(b, self.id, iterations, max_nodes, time_limit)
+        if budget is not None:
+            budget.count(self.__uct.simulations)
+        self.make_move(m, b, **kwargs)
+
+    def mcts(self, b : AmazonsBoard, opponent_id : int, times_play : int, mode : Optional[str] = None, cutoff : Optional[int] = None) -> Move:
+        '''
+            Find the best move using a MCTS, simulating one move of each group of symmetric twins
+        '''
+        all_moves = self.generate_unique_moves(b)
         move_dict = {}
         for m in all_moves:
-            # Copy the board to keep the original intact
-            new_board = deepcopy(b)
-            # Make the move of all possible moves
-            self.make_move(m, new_board, print_move = False)
-            # Simulate the game "times_play" number of times
-            outcomes = [self.play_full_game(new_board, opponent_id, mode) for _ in range(times_play)]
-            # Find the ones that win
-            winning_outcomes = [x for x in outcomes if x[0] == True]
-
-            # If we find a winning move, get the one that takes the least moves
-            if len(winning_outcomes):
-                move_dict[m] = min(winning_outcomes, key = lambda t : t[1])
-            # Otherwise there's no way to win with this move, just return false
-            else:
-                move_dict[m] = (False, 0)
+            # Make the move of all possible moves, simulations are undone so only this move needs to be taken back
+            self.make_move(m, b, print_move = False)
+            move_dict[m] = self.cached_value(b, ("mcts", mode, times_play, cutoff), lambda : self.simulate(b, opponent_id, times_play, mode, cutoff))
+            b.pop_last_move()
+
+        return self.choose_mcts_move(b, move_dict)
 
+    def anytime_mcts(self, b : AmazonsBoard, opponent_id : int, budget : Budget, rounds : Optional[int] = None, mode : Optional[str] = None, cutoff : Optional[int] = None) -> Move:
+        '''
+            The same search as mcts, but simulating every root move once per round (in a new random order each
+            round) until the budget runs out, so it can stop at any time with the best move found so far. Moves
+            the last round didn't get to keep the results of the earlier rounds
+
+            "batched" rounds simulate each move BATCHED_ROUND times at once. Every simulation counts as a node
+        '''
+        all_moves = self.generate_unique_moves(b)
+        times = BATCHED_ROUND if mode == "batched" else 1
+        move_dict = {m : (False, 0) for m in all_moves}
+        simulated = 0
+        played = 0
+        while rounds is None or played < rounds:
+            random.shuffle(all_moves)
+            for m in all_moves:
+                if simulated and budget.expired():
+                    return self.choose_mcts_move(b, move_dict)
+                self.make_move(m, b, print_move = False)
+                move_dict[m] = merge_outcomes(move_dict[m], self.simulate(b, opponent_id, times, mode, cutoff))
+                b.pop_last_move()
+                budget.count(times)
+                simulated += times
+            played += 1
+
+        return self.choose_mcts_move(b, move_dict)
+
+    def choose_mcts_move(self, b : AmazonsBoard, move_dict : dict[Move, Tuple[bool, int]]) -> Move:
+        '''
+            Pick the move whose simulations won in the fewest total moves, or a random move if none won
+        '''
         # Get all moves that won
         winning_moves = {k:v for k,v in move_dict.items() if v[0] == True}
 
@@ -176,15 +480,63 @@ class Player(object):
         # Did not find any winnings moves
         else:
             # Take a random move
-            return random.choice(self.generate_all_moves(b))
+            return self.random_legal_move(b)
+
+    def simulate(self, b : AmazonsBoard, opponent_id : int, times_play : int, mode : Optional[str] = None, cutoff : Optional[int] = None) -> Tuple[bool, int]:
+        '''
+            Simulate the game from the board "times_play" number of times with the opponent to move
+
+            Returns (True, fewest total moves) if any simulation was won, otherwise (False, 0). The cutoff (see
+            play_full_game) doesn't apply to "batched" simulations, they always play to the end
+        '''
+        if mode == "batched":
+            # Random games for both players, all simulated at once
+            wins, lengths = batched_playouts(b, self.id, opponent_id, times_play)
+            outcomes = list(zip(wins.tolist(), lengths.tolist()))
+        else:
+            outcomes = [self.play_full_game(b, opponent_id, mode, cutoff) for _ in range(times_play)]
+        # Find the ones that win
+        winning_outcomes = [x for x in outcomes if x[0] == True]
+
+        # If we find a winning move, get the one that takes the least moves
+        if len(winning_outcomes):
+            return min(winning_outcomes, key = lambda t : t[1])
+        # Otherwise there's no way to win with this move, just return false
+        return (False, 0)
 
-    def play_full_game(self, b : AmazonsBoard, opponent_id : int, mode : Optional[str] = None) -> Tuple[bool, int]:
+    def play_full_game(self, b : AmazonsBoard, opponent_id : int, mode : Optional[str] = None, cutoff : Optional[int] = None) -> Tuple[bool, int]:
         '''
             Play a game out til a player wins taking actions for each player
+
+            With a cutoff the game is only played that many more moves, then counted as won if the territory
+            evaluation favours us. The moves are undone afterwards, so the board is left how it was found
+        '''
+        start = len(b.history)
+        try:
+            return self.__play_out(b, opponent_id, mode, cutoff)
+        finally:
+            b.rewind(start)
+
+    def __play_out(self, b : AmazonsBoard, opponent_id : int, mode : Optional[str] = None, cutoff : Optional[int] = None) -> Tuple[bool, int]:
+        '''
+            Play random moves for self and moves of the chosen mode for the opponent until the game is over
         '''
         other_player = Player(opponent_id)
+        next_check = 0
+        stop = len(b.history) + cutoff if cutoff is not None else None
         # Only run random moves when the game isn't over
         while not b.done:
+            if stop is not None and len(b.history) >= stop:
+                return territory_evaluation(b, self.id) > 0, len(b.history)
+
+            # Stop once the regions left decide the game, counting the moves the solver's line would take. Solving
+            # costs about as much as a few random moves, so it's only tried every few moves
+            if len(b.history) >= next_check and b.empty_squares <= ENDGAME_SQUARES:
+                next_check = len(b.history) + ENDGAME_INTERVAL
+                if (outcome := self.__rollout_endgame.solve(b)) is not None:
+                    winner, remaining, _ = outcome
+                    return winner == self.id, len(b.history) + remaining
+
             match mode:
                 case None:
                     other_player.make_random_move(b)
@@ -207,4 +559,4 @@ class Player(object):
             if b.done:
                 break
         # If the game was already over after taking the previous move, see if we won and how many moves it took
-        return b.winner == self.id, len(b.moves)
+        return b.winner == self.id, len(b.history)
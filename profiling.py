@@ -0,0 +1,277 @@
+from board import AmazonsBoard
+from bitboard import BitboardAmazonsBoard
+from player import Player
+from search import SearchPosition
+from uct import UCTSearch
+
+from typing import Callable, Optional
+
+import player as player_module
+import time
+
+# Board methods that get counted and timed while a profiler is enabled
+BOARD_METHODS = (
+    "make_move",
+    "apply_move",
+    "pop_last_move",
+    "check_move",
+    "check_trajectory",
+    "check_done",
+    "populate_all_movements",
+    "populate_all_attacks_for_move",
+    "populate_all_move_codes",
+    "populate_unique_move_codes",
+    "random_movement",
+    "random_attack",
+    "regions",
+    "to_array",
+)
+# Generators are timed over every value they yield rather than the call that creates them
+BOARD_GENERATORS = ("iter_move_codes",)
+# AlphaBetaSearch plays mobility searches on its own copy of the position, a make there is a node like a board's make_move
+SEARCH_METHODS = ("make", "unmake")
+PLAYER_METHODS = ("generate_all_moves", "generate_unique_moves", "mcts", "simulate", "play_full_game", "cached_value")
+# The outermost call to one of these is a decision and gets its own stats
+DECISION_METHODS = (
+    "make_book_move",
+    "make_tablebase_move",
+    "make_endgame_move",
+    "make_random_move",
+    "make_min_opponent_move",
+    "make_max_self_move",
+    "make_minmax_move",
+    "make_territory_move",
+    "make_mcts_move",
+    "make_parallel_mcts_move",
+    "make_alphabeta_move",
+    "make_uct_move",
+)
+
+class ProfilingError(Exception):
+    pass
+
+class Profiler(object):
+    '''
+        Opt-in call counters and cumulative timers for the hot board and player methods, plus stats per decision
+
+        Enabling the profiler (with profiler: ..., or enable() and disable()) swaps the methods in BOARD_METHODS,
+        SEARCH_METHODS, PLAYER_METHODS and DECISION_METHODS on their classes for wrappers that count and time them, and disabling
+        puts the originals back, so nothing is paid when no profiler is enabled. Times are inclusive, make_move
+        also counts the time spent in check_move. Only one profiler can be enabled at a time
+
+        Each decision (the outermost call to a make_*_move method) records the player, method, ply, seconds,
+        nodes (moves made on any board or SearchPosition, so search and simulation moves included), rollouts (played out games and
+        UCT simulations) and moves generated. The stats are kept in decisions and passed to on_decision as they
+        happen. A make_book_move, make_tablebase_move or make_endgame_move that didn't move isn't counted. Work
+        done in other processes (MCTSPool) isn't seen
+    '''
+    __active = None
+
+    def __init__(self, on_decision : Optional[Callable[[dict], None]] = None):
+        self.__on_decision = on_decision
+        self.__originals = []
+        self.reset()
+
+    #<editor-fold> Properties
+    @property
+    def enabled(self):
+        return Profiler.__active is self
+
+    @property
+    def decisions(self):
+        return self.__decisions
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def rollouts(self):
+        return self.__rollouts
+
+    @property
+    def moves_generated(self):
+        return self.__generated
+    #</editor-fold> Properties
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def reset(self) -> None:
+        '''
+            Zero every counter and forget the decisions
+        '''
+        self.__timers = {}
+        self.__decisions = []
+        self.__nodes = 0
+        self.__rollouts = 0
+        self.__generated = 0
+        self.__depth = 0
+
+    def enable(self) -> None:
+        '''
+            Start counting, patching the wrappers in
+        '''
+        if Profiler.__active is self:
+            return
+        if Profiler.__active is not None:
+            raise ProfilingError("Another profiler is already enabled")
+        Profiler.__active = self
+
+        for cls in (AmazonsBoard, BitboardAmazonsBoard):
+            for name in BOARD_METHODS:
+                self.__patch(cls, name, self.__timed)
+            for name in BOARD_GENERATORS:
+                self.__patch(cls, name, self.__timed_generator)
+        for name in SEARCH_METHODS:
+            self.__patch(SearchPosition, name, self.__timed)
+        for name in PLAYER_METHODS:
+            self.__patch(Player, name, self.__timed)
+        for name in DECISION_METHODS:
+            self.__patch(Player, name, self.__decision)
+        self.__patch(UCTSearch, "search", self.__timed)
+        self.__patch(player_module, "batched_playouts", self.__timed)
+        self.__patch(AmazonsBoard, "__deepcopy__", self.__timed)
+
+    def disable(self) -> None:
+        '''
+            Stop counting and put the original methods back, the counts are kept
+        '''
+        if Profiler.__active is not self:
+            return
+        for owner, name, original in reversed(self.__originals):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.__originals = []
+        Profiler.__active = None
+
+    def stats(self) -> dict:
+        '''
+            Calls and total seconds for every method that was called, along with the totals
+        '''
+        return {
+            "methods" : {name : {"calls" : timer[0], "seconds" : timer[1]} for name, timer in self.__timers.items() if timer[0]},
+            "decisions" : len(self.__decisions),
+            "nodes" : self.__nodes,
+            "rollouts" : self.__rollouts,
+            "moves_generated" : self.__generated,
+        }
+
+    def print_stats(self, limit : Optional[int] = None) -> None:
+        '''
+            Print the methods that took the most time
+        '''
+        methods = sorted(self.stats()["methods"].items(), key = lambda item : item[1]["seconds"], reverse = True)
+        for name, timer in methods[:limit]:
+            print(f"{name:>48}: {timer['calls']:>10} calls {timer['seconds']:10.4f}s")
+
+    def __patch(self, owner, name : str, wrap : Callable, method : Optional[Callable] = None) -> None:
+        '''
+            Replace owner.name with a wrapper around it (or around method, for something owner doesn't have)
+        '''
+        original = getattr(owner, "__dict__", {}).get(name)
+        target = method if method is not None else original
+        if target is None:
+            return
+        label = f"{getattr(owner, '__name__', owner)}.{name}"
+        self.__originals.append((owner, name, original))
+        setattr(owner, name, wrap(label, name, target))
+
+    def __timer(self, label : str) -> list:
+        return self.__timers.setdefault(label, [0, 0.0])
+
+    def __count(self, name : str, result, args : tuple) -> None:
+        '''
+            Add what a call did to the node, rollout and generated move counts
+        '''
+        if name == "make_move" or name == "make":
+            self.__nodes += 1
+        elif name == "play_full_game":
+            self.__rollouts += 1
+        elif name == "search":
+            self.__rollouts += args[0].simulations
+        elif name == "batched_playouts":
+            self.__rollouts += len(result[0])
+        elif name == "populate_all_attacks_for_move":
+            self.__generated += len(result)
+
+    def __timed(self, label : str, name : str, method : Callable) -> Callable:
+        timer = self.__timer(label)
+        counted = name in ("make_move", "make", "play_full_game", "search", "batched_playouts", "populate_all_attacks_for_move")
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                timer[0] += 1
+                timer[1] += clock() - start
+            if counted:
+                self.__count(name, result, args)
+            return result
+
+        wrapper.__wrapped__ = method
+        return wrapper
+
+    def __timed_generator(self, label : str, name : str, method : Callable) -> Callable:
+        timer = self.__timer(label)
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            timer[0] += 1
+            values = method(*args, **kwargs)
+            while True:
+                start = clock()
+                try:
+                    value = next(values)
+                except StopIteration:
+                    return
+                finally:
+                    timer[1] += clock() - start
+                self.__generated += 1
+                yield value
+
+        wrapper.__wrapped__ = method
+        return wrapper
+
+    def __decision(self, label : str, name : str, method : Callable) -> Callable:
+        timed = self.__timed(label, name, method)
+
+        def wrapper(player, b, *args, **kwargs):
+            # Decisions made inside a decision (a simulated opponent's moves) are only counted as calls
+            if self.__depth:
+                return timed(player, b, *args, **kwargs)
+            before = (self.__nodes, self.__rollouts, self.__generated)
+            self.__depth += 1
+            start = time.perf_counter()
+            try:
+                result = timed(player, b, *args, **kwargs)
+            finally:
+                self.__depth -= 1
+            elapsed = time.perf_counter() - start
+            if result is False:
+                return result
+
+            decision = {
+                "player" : player.id,
+                "method" : name,
+                "ply" : len(b.history),
+                "seconds" : elapsed,
+                "nodes" : self.__nodes - before[0],
+                "rollouts" : self.__rollouts - before[1],
+                "moves_generated" : self.__generated - before[2],
+            }
+            self.__decisions.append(decision)
+            if self.__on_decision is not None:
+                self.__on_decision(decision)
+            return result
+
+        wrapper.__wrapped__ = method
+        return wrapper
@@ -0,0 +1,294 @@
+from move import ID_SHIFT
+from board import AmazonsBoard, ReplayError, check_moves
+
+from array import array
+from typing import Iterable, Iterator, Optional, Tuple
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# File header: magic, format version, 3 spare bytes
+FILE_MAGIC = b"AMZG"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<4sB3x")
+
+# Record header: board size, winner (-1 if not over), player who moved first (0 if nobody has), bytes per
+# square index, starting squares, moves. It's followed by the starting squares as (square index, contents) and
+# the moves as (start, end, attack) square indices, a square index being x * n + y
+RECORD_HEADER = struct.Struct("<BbBBHH")
+
+class RecordError(Exception):
+    pass
+
+def square_width(n : int) -> int:
+    '''
+        Bytes needed for a square index on an n x n board
+    '''
+    return 1 if n * n <= 256 else 2
+
+def starting_position(b : AmazonsBoard) -> np.ndarray:
+    '''
+        The board contents before any of the board's moves were made, found by undoing them on a copy
+    '''
+    board = b.to_array()
+    for code in reversed(b.history):
+        x0, y0 = code & 0xFF, code >> 8 & 0xFF
+        # The arrow can land where the piece started, so clear it before putting the piece back
+        board[code >> 32 & 0xFF, code >> 40 & 0xFF] = 0
+        board[code >> 16 & 0xFF, code >> 24 & 0xFF] = 0
+        board[x0, y0] = (code >> ID_SHIFT) - 1
+    return board
+
+def encode_record(b : AmazonsBoard) -> bytes:
+    '''
+        A board's game (starting position, moves, winner) in the binary record format
+    '''
+    n = b.n
+    if n > 255:
+        raise RecordError(f"Boards bigger than 255 x 255 can't be recorded, got {n}")
+    dtype = np.uint8 if square_width(n) == 1 else np.dtype("<u2")
+    start = starting_position(b).ravel()
+    occupied = np.flatnonzero(start)
+    pieces = np.empty(len(occupied), dtype = [("square", dtype), ("contents", np.int8)])
+    pieces["square"] = occupied
+    pieces["contents"] = start[occupied]
+
+    codes = np.asarray(b.history, dtype = np.int64)
+    squares = np.empty((len(codes), 3), dtype = dtype)
+    for i, shift in enumerate((0, 16, 32)):
+        squares[:, i] = (codes >> shift & 0xFF) * n + (codes >> (shift + 8) & 0xFF)
+    first = int(codes[0] >> ID_SHIFT) - 1 if len(codes) else 0
+
+    header = RECORD_HEADER.pack(n, b.winner if b.done else -1, first, square_width(n), len(pieces), len(codes))
+    return header + pieces.tobytes() + squares.tobytes()
+
+def record_offsets(buffer) -> Iterator[int]:
+    '''
+        Where each complete record in the contents of a record file starts, followed by where the last one ends
+    '''
+    end = len(buffer)
+    offset = FILE_HEADER.size
+    header = RECORD_HEADER.size
+    while offset + header <= end:
+        _, _, _, width, pieces, moves = RECORD_HEADER.unpack_from(buffer, offset)
+        size = header + pieces * (width + 1) + moves * 3 * width
+        if offset + size > end:
+            break
+        yield offset
+        offset += size
+    yield offset
+
+class GameRecord(object):
+    '''
+        One game read from a record file, decoded from the bytes only when asked
+    '''
+    __slots__ = ("__buffer", "__offset", "__n", "__winner", "__first", "__width", "__pieces", "__moves")
+
+    def __init__(self, buffer, offset : int):
+        self.__buffer = buffer
+        self.__offset = offset
+        self.__n, self.__winner, self.__first, self.__width, self.__pieces, self.__moves = RECORD_HEADER.unpack_from(buffer, offset)
+
+    #<editor-fold> Properties
+    @property
+    def n(self):
+        return self.__n
+
+    @property
+    def winner(self):
+        return self.__winner
+
+    @property
+    def first_player(self):
+        return self.__first
+
+    @property
+    def size(self):
+        return RECORD_HEADER.size + self.__pieces * (self.__width + 1) + self.__moves * 3 * self.__width
+    #</editor-fold> Properties
+
+    def __len__(self):
+        return self.__moves
+
+    def starting_positions(self) -> dict[Tuple[int, int], int]:
+        '''
+            Starting contents of every occupied square, as AmazonsBoard takes them
+        '''
+        dtype = [("square", np.uint8 if self.__width == 1 else np.dtype("<u2")), ("contents", np.int8)]
+        pieces = np.frombuffer(self.__buffer, dtype = dtype, count = self.__pieces, offset = self.__offset + RECORD_HEADER.size)
+        return {divmod(int(square), self.__n) : int(contents) for square, contents in pieces.tolist()}
+
+    def move_codes(self) -> np.ndarray:
+        '''
+            The moves packed the same way as move.pack_move, as an int64 array
+        '''
+        dtype = np.uint8 if self.__width == 1 else np.dtype("<u2")
+        offset = self.__offset + RECORD_HEADER.size + self.__pieces * (self.__width + 1)
+        squares = np.frombuffer(self.__buffer, dtype = dtype, count = self.__moves * 3, offset = offset).astype(np.int64).reshape(-1, 3)
+        x, y = np.divmod(squares, self.__n)
+        # Players take turns, starting with whoever moved first
+        other = 2 if self.__first == 1 else 1
+        ids = np.where(np.arange(self.__moves) % 2 == 0, self.__first, other)
+        return x[:, 0] | y[:, 0] << 8 | x[:, 1] << 16 | y[:, 1] << 24 | x[:, 2] << 32 | y[:, 2] << 40 | (ids + 1) << ID_SHIFT
+
+    def check(self) -> Tuple[int, Optional[str], int]:
+        '''
+            Check every move with check_moves, without building a board
+
+            Returns how many moves are legal, why the next one isn't (None if they all are) and the winner after
+            the legal moves (-1 if the game isn't over)
+        '''
+        cells = [0] * (self.__n * self.__n)
+        for (x, y), contents in self.starting_positions().items():
+            cells[x * self.__n + y] = contents
+        legal, reason, _, winner = check_moves(self.__n, cells, -1, self.move_codes().tolist())
+        return legal, reason, winner
+
+    def validate(self) -> None:
+        '''
+            Raise a ReplayError for the first illegal move, or a RecordError if the recorded winner is wrong
+        '''
+        legal, reason, winner = self.check()
+        if reason is not None:
+            raise ReplayError(legal, reason)
+        if winner != self.__winner:
+            raise RecordError(f"The game was recorded with winner {self.__winner} but replays to {winner}")
+
+    def board(self, board_class : type = AmazonsBoard, moves : Optional[int] = None, validate : bool = True, **kwargs) -> AmazonsBoard:
+        '''
+            Replay the game (or only its first moves) on a new board, see AmazonsBoard.replay for validate
+        '''
+        b = board_class(self.__n, starting_positions = self.starting_positions(), **kwargs)
+        b.replay(self.move_codes()[:moves].tolist(), validate = validate)
+        return b
+
+def audit_records(records : Iterable[GameRecord]) -> Iterator[Tuple[int, str]]:
+    '''
+        Check every game, yielding (game index, problem) for each one with an illegal move or the wrong winner
+    '''
+    for i, record in enumerate(records):
+        try:
+            record.validate()
+        except (ReplayError, RecordError) as e:
+            yield i, str(e)
+
+class GameRecordWriter(object):
+    '''
+        Appends games to a record file, writing the file header if the file is new
+
+        Every game is written with a single write, so an interrupted writer leaves at most one partial record at
+        the end. Readers skip it, and a writer opening the file cuts it off before appending. A file cut off
+        inside the header is started over, anything else that doesn't start with the header raises RecordError
+    '''
+    def __init__(self, path : str):
+        self.__path = path
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        header = FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION)
+        if size >= FILE_HEADER.size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as buffer:
+                if buffer[:FILE_HEADER.size] != header:
+                    raise RecordError(f"{path} is not a version {FILE_VERSION} game record file")
+                for end in record_offsets(buffer):
+                    pass
+                partial = end < len(buffer)
+            if partial:
+                os.truncate(path, end)
+        elif size > 0:
+            with open(path, "rb") as f:
+                if not header.startswith(f.read()):
+                    raise RecordError(f"{path} is not a version {FILE_VERSION} game record file")
+            os.truncate(path, 0)
+        self.__file = open(path, "ab")
+        if self.__file.tell() == 0:
+            self.__file.write(header)
+        self.__written = 0
+
+    #<editor-fold> Properties
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def written(self):
+        return self.__written
+    #</editor-fold> Properties
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, b : AmazonsBoard) -> None:
+        '''
+            Append the game played on the board
+        '''
+        self.__file.write(encode_record(b))
+        self.__written += 1
+
+    def flush(self) -> None:
+        self.__file.flush()
+
+    def close(self) -> None:
+        self.__file.close()
+
+class GameRecordReader(object):
+    '''
+        Memory mapped reader for a record file
+
+        Iterating walks the records in order without building anything. Indexing (and len) scans the record
+        headers once to build an offset table, 8 bytes per game, after which any game can be read directly
+    '''
+    def __init__(self, path : str):
+        self.__path = path
+        self.__file = open(path, "rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            raise RecordError(f"{path} is too short to be a game record file")
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.__map, 0)
+        if magic != FILE_MAGIC:
+            raise RecordError(f"{path} is not a game record file")
+        if version != FILE_VERSION:
+            raise RecordError(f"{path} has record format version {version}, expected {FILE_VERSION}")
+        self.__offsets = None
+
+    #<editor-fold> Properties
+    @property
+    def path(self):
+        return self.__path
+    #</editor-fold> Properties
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self.__offsets = None
+        self.__map.close()
+        self.__file.close()
+
+    def __index(self) -> array:
+        if self.__offsets is None:
+            self.__offsets = array("Q", record_offsets(self.__map))
+            # The last offset is the end of the records
+            self.__offsets.pop()
+        return self.__offsets
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        offsets = record_offsets(self.__map)
+        offset = next(offsets)
+        for end in offsets:
+            yield GameRecord(self.__map, offset)
+            offset = end
+
+    def __len__(self):
+        return len(self.__index())
+
+    def __getitem__(self, i : int) -> GameRecord:
+        return GameRecord(self.__map, self.__index()[i])
@@ -0,0 +1,142 @@
+from board import AmazonsBoard
+
+from typing import Optional, Tuple
+
+import numpy as np
+import random
+
+# Same order as the directions used by AmazonsBoard
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+class BatchedRollouts(object):
+    '''
+        Plays many independent random games from the same position at once
+
+        Every game is a layer of a (games, n + 2, n + 2) array. The extra border is filled with arrows so rays and
+        neighbour checks stop at the edge without any bounds checks. All games move in lockstep, so the player to
+        move is the same for every game still running, and finished games are dropped from the arrays as they end
+    '''
+    def __init__(self, b : AmazonsBoard, rng : Optional[np.random.Generator] = None):
+        self.__n = b.n
+        self.__start = np.full((b.n + 2, b.n + 2), -1, dtype = np.int8)
+        self.__start[1:-1, 1:-1] = b.to_array()
+        self.__done = b.done
+        self.__winner = b.winner
+        self.__history = len(b.history)
+        # Seeded from the random module by default so random.seed makes rollouts reproducible too
+        self.__rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+
+    @property
+    def n(self):
+        return self.__n
+
+    def play(self, player_id : int, to_move : int, n_games : int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+            Play n_games random games starting with to_move
+
+            Returns (wins, lengths) where wins[i] is whether player_id won game i and lengths[i] is the total
+            number of moves on the board when game i ended, the same values Player.play_full_game returns
+        '''
+        winners = np.zeros(n_games, dtype = np.int8)
+        lengths = np.full(n_games, self.__history, dtype = np.int64)
+        if self.__done:
+            winners[:] = self.__winner
+            return winners == player_id, lengths
+
+        boards = np.repeat(self.__start[None], n_games, axis = 0)
+        ids = np.arange(n_games)
+        queens = {}
+        for p in (1, 2):
+            x, y = np.nonzero(self.__start == p)
+            queens[p] = (np.repeat(x[None], n_games, axis = 0), np.repeat(y[None], n_games, axis = 0))
+
+        mover = to_move
+        plies = 0
+        while len(ids):
+            other = 2 if mover == 1 else 1
+            qx, qy = queens[mover]
+            games = np.arange(len(ids))
+
+            # Pick a piece and destination uniformly from every legal slide
+            slides = self.__reachable(boards, qx, qy)
+            n_slides = slides.sum(axis = (1, 2, 3))
+            stuck = n_slides == 0
+            flat = slides.reshape(len(ids), -1)
+            choice = np.argmax(self.__rng.random(flat.shape) * flat, axis = 1)
+            piece, dest = np.divmod(choice, (self.n + 2) ** 2)
+            dest_x, dest_y = np.divmod(dest, self.n + 2)
+            start_x = qx[games, piece]
+            start_y = qy[games, piece]
+
+            # Arrows are generated before the piece leaves, it can still always shoot back where it came from
+            arrows = self.__reachable(boards, dest_x[:, None], dest_y[:, None])[:, 0]
+            arrows[games, start_x, start_y] = True
+            arrows = arrows.reshape(len(ids), -1)
+            target = np.argmax(self.__rng.random(arrows.shape) * arrows, axis = 1)
+            arrow_x, arrow_y = np.divmod(target, self.n + 2)
+
+            boards[games, start_x, start_y] = 0
+            boards[games, dest_x, dest_y] = mover
+            boards[games, arrow_x, arrow_y] = -1
+            qx[games, piece] = dest_x
+            qy[games, piece] = dest_y
+            plies += 1
+
+            # Same rule as AmazonsBoard.check_done: the next player being stuck wins it for the mover,
+            # otherwise the mover being stuck loses it
+            winner = np.zeros(len(ids), dtype = np.int8)
+            winner[~self.__can_move(boards, *queens[other])] = mover
+            winner[(winner == 0) & ~self.__can_move(boards, *queens[mover])] = other
+            # A game where the mover could not slide anywhere was already lost before this ply
+            winner[stuck] = other
+
+            finished = winner != 0
+            if finished.any():
+                winners[ids[finished]] = winner[finished]
+                lengths[ids[finished]] += plies - stuck[finished]
+                keep = ~finished
+                ids = ids[keep]
+                boards = boards[keep]
+                queens = {p : (x[keep], y[keep]) for p, (x, y) in queens.items()}
+            mover = other
+
+        return winners == player_id, lengths
+
+    def __reachable(self, boards : np.ndarray, qx : np.ndarray, qy : np.ndarray) -> np.ndarray:
+        '''
+            Boolean (games, pieces, n + 2, n + 2) mask of the squares each piece can slide to
+        '''
+        n_games, n_pieces = qx.shape
+        reach = np.zeros((n_games, n_pieces, self.n + 2, self.n + 2), dtype = bool)
+        games = np.broadcast_to(np.arange(n_games)[:, None], qx.shape)
+        pieces = np.broadcast_to(np.arange(n_pieces)[None], qx.shape)
+        for div_x, div_y in DIRECTIONS:
+            x, y = qx, qy
+            alive = np.ones(qx.shape, dtype = bool)
+            for _ in range(self.n - 1):
+                # Rays that already stopped are parked on the corner, which is always a border arrow
+                x = np.where(alive, x + div_x, 0)
+                y = np.where(alive, y + div_y, 0)
+                alive = boards[games, x, y] == 0
+                if not alive.any():
+                    break
+                reach[games[alive], pieces[alive], x[alive], y[alive]] = True
+
+        return reach
+
+    def __can_move(self, boards : np.ndarray, qx : np.ndarray, qy : np.ndarray) -> np.ndarray:
+        '''
+            Whether any piece in each game has an empty neighbouring square
+        '''
+        games = np.arange(len(boards))[:, None]
+        can_move = np.zeros(len(boards), dtype = bool)
+        for div_x, div_y in DIRECTIONS:
+            can_move |= (boards[games, qx + div_x, qy + div_y] == 0).any(axis = 1)
+
+        return can_move
+
+def batched_playouts(b : AmazonsBoard, player_id : int, to_move : int, n_games : int, rng : Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+        Play n_games random games from the board at once, returning the (wins, lengths) arrays for player_id
+    '''
+    return BatchedRollouts(b, rng).play(player_id, to_move, n_games)
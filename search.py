@@ -0,0 +1,599 @@
+from move import Move, ID_SHIFT, move_player
+from board import AmazonsBoard, line_is_clear, square_neighbours, square_rays, zobrist_keys
+from bitboard import DIRECTIONS
+from transposition import TranspositionTable
+
+from functools import lru_cache
+from typing import Callable, Iterator, Optional, Tuple
+
+import math
+import threading
+import time
+
+# Score of a won position, wins found sooner score higher
+WIN_SCORE = 1_000_000
+# Scores at least this far from 0 are wins or losses rather than evaluations
+MATE_SCORE = WIN_SCORE - 1000
+
+class SearchTimeout(Exception):
+    pass
+
+def mobility_evaluation(b : AmazonsBoard, player_id : int) -> float:
+    '''
+        Number of moves the player can make minus the number of moves the opponent can make
+    '''
+    opponent_id = 2 if player_id == 1 else 1
+    return b.mobility(player_id) - b.mobility(opponent_id)
+
+def leaf_score(mine : int, theirs : int, ply : int) -> float:
+    '''
+        What a move made at ply is worth to the player that made it, searched no further, from both players'
+        mobility after it: the same as negamax scores the position after it, negated
+    '''
+    # The opponent is to move, so they lose first if neither can move
+    if theirs == 0:
+        return WIN_SCORE - ply - 1
+    if mine == 0:
+        return -(WIN_SCORE - ply - 1)
+    return mine - theirs
+
+def score_to_table(score : float, ply : int) -> float:
+    '''
+        A score found ply plies from the root, as stored in the transposition table
+
+        Win and loss scores count plies from the root, so they're stored as plies from the position itself, the
+        same position can be reached again at another ply
+    '''
+    if score >= MATE_SCORE:
+        return score + ply
+    if score <= -MATE_SCORE:
+        return score - ply
+    return score
+
+def score_from_table(score : float, ply : int) -> float:
+    '''
+        A score stored with score_to_table, for the position reached ply plies from the root
+    '''
+    if score >= MATE_SCORE:
+        return score - ply
+    if score <= -MATE_SCORE:
+        return score + ply
+    return score
+
+@lru_cache(maxsize = None)
+def ray_indices(n : int) -> list[Tuple[Tuple[int, ...], ...]]:
+    '''
+        For every square (indexed x * n + y), the square indices along each direction, nearest first
+    '''
+    return [tuple(tuple(index for index, _ in ray) for ray in rays if len(ray)) for rays in square_rays(n, tuple(DIRECTIONS))]
+
+class BoardPosition(object):
+    '''
+        The position AlphaBetaSearch searches, played on the board itself and scored with any evaluation
+    '''
+    def __init__(self, b : AmazonsBoard, evaluate : Callable[[AmazonsBoard, int], float]):
+        self.__board = b
+        self.__evaluate = evaluate
+
+    #<editor-fold> Properties
+    @property
+    def hash(self):
+        return self.__board.hash
+    #</editor-fold> Properties
+
+    def make(self, m : int) -> None:
+        self.__board.make_move(m, print_move = False, validate = False)
+
+    def unmake(self) -> None:
+        self.__board.pop_last_move()
+
+    def outcome(self, to_move : int) -> int:
+        '''
+            1 if to_move has won, -1 if they've lost, 0 while the game goes on
+        '''
+        b = self.__board
+        if not b.done:
+            return 0
+        return 1 if b.winner == to_move else -1
+
+    def evaluate(self, to_move : int) -> float:
+        return self.__evaluate(self.__board, to_move)
+
+    def moves(self, id : int) -> list[int]:
+        return self.__board.populate_all_move_codes(id)
+
+    def is_legal(self, m : int) -> bool:
+        return self.__board.is_legal(m)
+
+class SearchPosition(object):
+    '''
+        A copy of a board's position for searching with mobility_evaluation, as a flat list of squares and the
+        queens of each player
+
+        Making and undoing a move only changes three squares and the hash, where the board also updates every
+        queen's moves, which is most of the time a search spends. Leaves recount both players' mobility from the
+        squares instead, which takes less than keeping it up to date through the two moves that lead there. Scores,
+        game over and hashes are the same as on the board
+    '''
+    def __init__(self, b : AmazonsBoard):
+        n = b.n
+        self.__n = n
+        self.__cells = b.to_array().ravel().tolist()
+        self.__queens = {id : [sq for sq, value in enumerate(self.__cells) if value == id] for id in (1, 2)}
+        self.__rays = ray_indices(n)
+        self.__neighbours = square_neighbours(n)
+        self.__keys = zobrist_keys(n)
+        self.__hash = b.hash
+        self.__last_player = b.last_player
+        self.__moved = len(b.history) > 0
+        self.__undo = []
+
+    #<editor-fold> Properties
+    @property
+    def hash(self):
+        return self.__hash
+    #</editor-fold> Properties
+
+    def make(self, m : int) -> None:
+        n = self.__n
+        id = (m >> ID_SHIFT) - 1
+        start = (m & 0xFF) * n + (m >> 8 & 0xFF)
+        end = (m >> 16 & 0xFF) * n + (m >> 24 & 0xFF)
+        attack = (m >> 32 & 0xFF) * n + (m >> 40 & 0xFF)
+        cells = self.__cells
+        cells[start] = 0
+        cells[end] = id
+        cells[attack] = -1
+        queens = self.__queens[id]
+        queens[queens.index(start)] = end
+
+        squares, last_player = self.__keys
+        self.__hash ^= squares[id][start] ^ squares[id][end] ^ squares[-1][attack] ^ last_player[self.__last_player] ^ last_player[id]
+        self.__undo.append((id, start, end, attack, self.__last_player, self.__moved))
+        self.__last_player = id
+        self.__moved = True
+
+    def unmake(self) -> None:
+        id, start, end, attack, previous, moved = self.__undo.pop()
+        cells = self.__cells
+        cells[attack] = 0
+        cells[end] = 0
+        cells[start] = id
+        queens = self.__queens[id]
+        queens[queens.index(end)] = start
+
+        squares, last_player = self.__keys
+        self.__hash ^= squares[id][start] ^ squares[id][end] ^ squares[-1][attack] ^ last_player[id] ^ last_player[previous]
+        self.__last_player = previous
+        self.__moved = moved
+
+    def __can_move(self, id : int) -> bool:
+        cells = self.__cells
+        neighbours = self.__neighbours
+        for queen in self.__queens[id]:
+            for sq in neighbours[queen]:
+                if cells[sq] == 0:
+                    return True
+        return False
+
+    def outcome(self, to_move : int) -> int:
+        '''
+            1 if to_move has won, -1 if they've lost, 0 while the game goes on, decided like check_done
+        '''
+        if not self.__moved:
+            return 0
+        if not self.__can_move(to_move):
+            return -1
+        return 1 if not self.__can_move(2 if to_move == 1 else 1) else 0
+
+    def mobility(self, id : int) -> int:
+        '''
+            Number of places all of a player's queens can move to
+        '''
+        cells = self.__cells
+        rays = self.__rays
+        total = 0
+        for queen in self.__queens[id]:
+            for ray in rays[queen]:
+                for sq in ray:
+                    if cells[sq] != 0:
+                        break
+                    total += 1
+        return total
+
+    def evaluate(self, to_move : int) -> float:
+        return self.mobility(to_move) - self.mobility(2 if to_move == 1 else 1)
+
+    def __blocking(self, queens : list[int]) -> Tuple[int, list[int], list[Tuple[Tuple[int, ...], int]], dict[int, list[int]]]:
+        '''
+            Mobility of the queens, for every square how much of it an arrow there would take away, and for
+            moved_blocking the (ray, reach) of each of their rays with the rays every square can change, by index
+        '''
+        cells = self.__cells
+        rays = self.__rays
+        total = 0
+        lost = [0] * len(cells)
+        reaches = []
+        seen = {}
+        for queen in queens:
+            for ray in rays[queen]:
+                reach = 0
+                for sq in ray:
+                    if cells[sq] != 0:
+                        break
+                    reach += 1
+                total += reach
+                # An arrow on a square of the ray cuts it off there
+                for i in range(reach):
+                    lost[ray[i]] += reach - i
+                # So does a queen moving there, and one moving away from where it stops frees the rest of it
+                for sq in ray[:reach + 1]:
+                    seen.setdefault(sq, []).append(len(reaches))
+                reaches.append((ray, reach))
+        return total, lost, reaches, seen
+
+    def __moved_blocking(self, blocking, start : int, end : int, queen : Optional[int] = None) -> Tuple[int, list[int]]:
+        '''
+            The mobility and lost squares of __blocking, after a queen moved from start to end, only recounting the
+            rays that pass either, plus the moving queen's own rays from end if it isn't one of the queens counted
+        '''
+        cells = self.__cells
+        total, lost, reaches, seen = blocking
+        lost = lost[:]
+        changed = seen.get(start, [])
+        if end in seen:
+            changed = set(changed).union(seen[end])
+        rays = [reaches[index] for index in changed]
+        for ray, reach in rays:
+            total -= reach
+            for i in range(reach):
+                lost[ray[i]] -= reach - i
+        new_rays = [ray for ray, _ in rays]
+        if queen is not None:
+            new_rays.extend(self.__rays[queen])
+        for ray in new_rays:
+            reach = 0
+            for sq in ray:
+                if cells[sq] != 0:
+                    break
+                reach += 1
+            total += reach
+            for i in range(reach):
+                lost[ray[i]] += reach - i
+        return total, lost
+
+    def scored_movements(self, id : int) -> Iterator[list[Tuple[int, int, int]]]:
+        '''
+            Every move the player can make, in the same order as moves, with both players' mobility after it, as
+            (packed move, player's mobility, opponent's mobility), a list for each movement
+
+            The moves of one movement only differ in where the arrow lands, so mobility is counted once per movement
+            along with what an arrow on each square would take from it, instead of once per move. And a movement
+            only changes the rays through the squares it leaves and lands on, so only those are counted again.
+            Nothing is counted for the movements after the caller stops
+        '''
+        n = self.__n
+        cells = self.__cells
+        rays = self.__rays
+        queens = self.__queens
+        opponent_blocking = self.__blocking(queens[2 if id == 1 else 1])
+        player = (id + 1) << ID_SHIFT
+        for start in sorted(queens[id]):
+            x0, y0 = divmod(start, n)
+            others_blocking = self.__blocking([queen for queen in queens[id] if queen != start])
+            for ray in rays[start]:
+                for end in ray:
+                    if cells[end] != 0:
+                        break
+                    attacks = [start]
+                    for attack_ray in rays[end]:
+                        for attack in attack_ray:
+                            if cells[attack] != 0:
+                                break
+                            attacks.append(attack)
+
+                    cells[start] = 0
+                    cells[end] = id
+                    mine, mine_lost = self.__moved_blocking(others_blocking, start, end, end)
+                    theirs, theirs_lost = self.__moved_blocking(opponent_blocking, start, end)
+                    cells[start] = id
+                    cells[end] = 0
+
+                    x1, y1 = divmod(end, n)
+                    movement = player | x0 | y0 << 8 | x1 << 16 | y1 << 24
+                    yield [(movement | attack // n << 32 | attack % n << 40, mine - mine_lost[attack], theirs - theirs_lost[attack]) for attack in attacks]
+
+    def scored_moves(self, id : int) -> list[Tuple[int, int, int]]:
+        '''
+            All of scored_movements in one list
+        '''
+        return [scored for movement in self.scored_movements(id) for scored in movement]
+
+    def moves(self, id : int) -> list[int]:
+        '''
+            Every move the player can make, packed (see move.pack_move)
+        '''
+        n = self.__n
+        cells = self.__cells
+        rays = self.__rays
+        player = (id + 1) << ID_SHIFT
+        codes = []
+        for start in sorted(self.__queens[id]):
+            x0, y0 = divmod(start, n)
+            # The arrow is shot with the queen still on its starting square, so it stops there, and can always land there
+            for ray in rays[start]:
+                for end in ray:
+                    if cells[end] != 0:
+                        break
+                    x1, y1 = divmod(end, n)
+                    movement = player | x0 | y0 << 8 | x1 << 16 | y1 << 24
+                    codes.append(movement | x0 << 32 | y0 << 40)
+                    for attack_ray in rays[end]:
+                        for attack in attack_ray:
+                            if cells[attack] != 0:
+                                break
+                            codes.append(movement | attack // n << 32 | attack % n << 40)
+        return codes
+
+    def is_legal(self, m : int) -> bool:
+        '''
+            Whether a move remembered from another position can be played here
+        '''
+        n = self.__n
+        id = (m >> ID_SHIFT) - 1
+        x0, y0, x1, y1, ax, ay = (m >> shift & 0xFF for shift in range(0, ID_SHIFT, 8))
+        if id == self.__last_player or x0 >= n or y0 >= n or x1 >= n or y1 >= n or ax >= n or ay >= n:
+            return False
+        start, end, attack = x0 * n + y0, x1 * n + y1, ax * n + ay
+        cells = self.__cells
+        return cells[start] == id and line_is_clear(cells, n, start, end) and (attack == start or line_is_clear(cells, n, end, attack))
+
+class AlphaBetaSearch(object):
+    '''
+        Negamax search with alpha-beta pruning, principal variation search and iterative deepening
+
+        Moves are tried in the order: transposition table move, killer moves for the ply, then everything else by
+        history score. The root moves are re-ordered by their scores from the previous iteration. Evaluation is
+        pluggable, any function (board, player id) -> score from that player's point of view works. With the default
+        mobility_evaluation the search runs on a SearchPosition copy of the board, otherwise on the board itself
+
+        Inside the search moves are packed ints (see move.pack_move), only the move returned is a Move
+    '''
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, evaluate : Optional[Callable[[AmazonsBoard, int], float]] = None, transposition_table : Optional[TranspositionTable] = None, check_every : int = 128):
+        self.__evaluate = evaluate if evaluate is not None else mobility_evaluation
+        self.__table = transposition_table if transposition_table is not None else TranspositionTable(16 * 1024 * 1024, "depth")
+        self.__check_every = check_every
+        self.__history = {}
+        self.__killers = {}
+        self.__nodes = 0
+        self.__depth = 0
+        self.__deadline = math.inf
+        self.__max_nodes = math.inf
+        self.__stop = None
+        self.__frontier = False
+
+    #<editor-fold> Properties
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def depth(self):
+        return self.__depth
+
+    @property
+    def transposition_table(self):
+        return self.__table
+    #</editor-fold> Properties
+
+    def search(self, b : AmazonsBoard, player_id : int, time_limit : Optional[float] = None, max_depth : Optional[int] = None, max_nodes : Optional[int] = None, stop : Optional[threading.Event] = None) -> Move:
+        '''
+            Find the best move for player_id, deepening one ply at a time
+
+            Stops at max_depth, when time_limit seconds have passed, after max_nodes positions or once stop is set
+            (from another thread), returning the best move of the deepest finished iteration (or of the unfinished
+            one, if it already searched the previous best move)
+        '''
+        if time_limit is None and max_depth is None and max_nodes is None and stop is None:
+            max_depth = 2
+        self.__stop = stop
+        self.__deadline = time.perf_counter() + time_limit if time_limit is not None else math.inf
+        self.__max_nodes = max_nodes if max_nodes is not None else math.inf
+        self.__nodes = 0
+        self.__depth = 0
+        self.__killers = {}
+        # Keep the history between searches, but let older results count for less
+        self.__history = {m : score // 2 for m, score in self.__history.items() if score > 1}
+
+        start = len(b.history)
+        # Symmetric twins of a root move score the same, so only one of each is searched
+        root_moves = b.populate_unique_move_codes(player_id)
+        position = SearchPosition(b) if self.__evaluate is mobility_evaluation else BoardPosition(b, self.__evaluate)
+        self.__frontier = isinstance(position, SearchPosition)
+        root_scores = {m : 0 for m in root_moves}
+        best_move = root_moves[0]
+
+        depth = 1
+        while max_depth is None or depth <= max_depth:
+            root_moves.sort(key = lambda m : root_scores[m], reverse = True)
+            alpha = -math.inf
+            iteration_best = None
+            try:
+                searched = root_moves
+                # Every root move is a leaf of the first iteration, so they can all be scored at once
+                # (unless that alone is over the node budget, then they are searched one by one until it runs out)
+                if depth == 1 and self.__frontier and self.__nodes + len(root_moves) <= self.__max_nodes:
+                    root_scores = self.__score_moves(position.scored_moves(player_id), 0, only = set(root_moves))
+                    iteration_best = max(root_moves, key = root_scores.get)
+                    alpha = root_scores[iteration_best]
+                    searched = ()
+                for i, m in enumerate(searched):
+                    position.make(m)
+                    score = self.__principal_variation(position, depth, alpha, i == 0, player_id)
+                    position.unmake()
+                    root_scores[m] = score
+                    if score > alpha:
+                        alpha = score
+                        iteration_best = m
+            except SearchTimeout:
+                # A SearchPosition is only a copy, but a BoardPosition plays on the board itself
+                b.rewind(start)
+                # The first move tried is the previous best, once it is searched the new best is at least as good
+                if iteration_best is not None:
+                    best_move = iteration_best
+                break
+
+            best_move = iteration_best
+            self.__depth = depth
+            # A forced win or loss was found, searching deeper won't change it
+            if abs(alpha) >= MATE_SCORE or self.__out_of_time() or self.__nodes >= self.__max_nodes:
+                break
+            depth += 1
+
+        return Move.from_code(best_move)
+
+    def __out_of_time(self) -> bool:
+        return time.perf_counter() >= self.__deadline or self.__stop is not None and self.__stop.is_set()
+
+    def __principal_variation(self, position, depth : int, alpha : float, first : bool, player_id : int) -> float:
+        '''
+            Score a root child, with a null window unless it is the first child
+        '''
+        opponent_id = 2 if player_id == 1 else 1
+        if first:
+            return -self.__negamax(position, depth - 1, -math.inf, -alpha, opponent_id, 1)
+        score = -self.__negamax(position, depth - 1, -alpha - 1, -alpha, opponent_id, 1)
+        if score > alpha:
+            score = -self.__negamax(position, depth - 1, -math.inf, -score, opponent_id, 1)
+        return score
+
+    def __negamax(self, position, depth : int, alpha : float, beta : float, to_move : int, ply : int) -> float:
+        '''
+            Score of the position for to_move, searched depth more plies
+        '''
+        if self.__nodes >= self.__max_nodes:
+            raise SearchTimeout()
+        self.__nodes += 1
+        if self.__nodes % self.__check_every == 0 and self.__out_of_time():
+            raise SearchTimeout()
+
+        opponent_id = 2 if to_move == 1 else 1
+        # Both players' mobility already says whether the game is over, there's no need to look twice
+        if depth <= 0 and self.__frontier:
+            return -leaf_score(position.mobility(opponent_id), position.mobility(to_move), ply - 1)
+        outcome = position.outcome(to_move)
+        if outcome != 0:
+            return WIN_SCORE - ply if outcome > 0 else -(WIN_SCORE - ply)
+        if depth <= 0:
+            return position.evaluate(to_move)
+
+        original_alpha = alpha
+        table_move = None
+        entry = self.__table.lookup(position.hash)
+        if entry is not None:
+            entry_depth, score, flag, table_move = entry
+            score = score_from_table(score, ply)
+            if entry_depth >= depth:
+                if flag == self.EXACT:
+                    return score
+                elif flag == self.LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        best = -math.inf
+        best_move = None
+        for i, (m, score) in enumerate(self.__ordered_moves(position, to_move, ply, table_move, depth)):
+            # Moves scored together with the others at the frontier don't need to be made
+            if score is None:
+                position.make(m)
+                if i == 0:
+                    score = -self.__negamax(position, depth - 1, -beta, -alpha, opponent_id, ply + 1)
+                else:
+                    # Null window first, only re-search if the move might be better
+                    score = -self.__negamax(position, depth - 1, -alpha - 1, -alpha, opponent_id, ply + 1)
+                    if alpha < score < beta:
+                        score = -self.__negamax(position, depth - 1, -beta, -score, opponent_id, ply + 1)
+                position.unmake()
+
+            if score > best:
+                best = score
+                best_move = m
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.__record_cutoff(m, depth, ply)
+                break
+
+        # Nothing to move, this player has lost
+        if best_move is None:
+            return -(WIN_SCORE - ply)
+
+        if best <= original_alpha:
+            flag = self.UPPER
+        elif best >= beta:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        self.__table.store(position.hash, (depth, score_to_table(best, ply), flag, best_move), depth)
+        return best
+
+    def __record_cutoff(self, m : int, depth : int, ply : int) -> None:
+        '''
+            Remember a move that caused a beta cutoff as a killer for the ply and in the history table
+        '''
+        killers = self.__killers.setdefault(ply, [])
+        if m not in killers:
+            killers.insert(0, m)
+            del killers[4:]
+        self.__history[m] = self.__history.get(m, 0) + depth * depth
+
+    def __ordered_moves(self, position, to_move : int, ply : int, table_move : Optional[int], depth : int) -> Iterator[Tuple[int, Optional[float]]]:
+        '''
+            Yield (move, score) for the moves of to_move, best guesses first, with score None for moves that still
+            have to be searched
+
+            The table move and killers are checked and tried before the full move list is generated, so a cutoff
+            from one of them skips generation entirely. One ply from the frontier of a SearchPosition the rest of
+            the moves are scored a movement at a time, and only the best of each movement is yielded, so a cutoff
+            skips scoring the movements after it
+        '''
+        tried = set()
+        for m in [table_move] + self.__killers.get(ply, []):
+            if m is not None and m not in tried and move_player(m) == to_move and position.is_legal(m):
+                tried.add(m)
+                yield m, None
+
+        if depth == 1 and self.__frontier:
+            for scored in position.scored_movements(to_move):
+                scores = self.__score_moves(scored, ply, tried)
+                if len(scores):
+                    best = max(scores, key = scores.get)
+                    yield best, scores[best]
+            return
+
+        moves = position.moves(to_move)
+        if tried:
+            moves = [m for m in moves if m not in tried]
+        moves.sort(key = lambda m : self.__history.get(m, 0), reverse = True)
+        for m in moves:
+            yield m, None
+
+    def __score_moves(self, scored : list[Tuple[int, int, int]], ply : int, skip = (), only = None) -> dict[int, float]:
+        '''
+            Score the moves of SearchPosition.scored_moves or scored_movements (but the ones in skip, or only the
+            ones in only) as leaves, counting each as a searched position
+        '''
+        scores = {m : leaf_score(mine, theirs, ply) for m, mine, theirs in scored if m not in skip and (only is None or m in only)}
+        if self.__nodes + len(scores) > self.__max_nodes:
+            raise SearchTimeout()
+        self.__nodes += len(scores)
+        if self.__out_of_time():
+            raise SearchTimeout()
+        return scores
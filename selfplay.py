@@ -0,0 +1,289 @@
+from move import ID_SHIFT
+from bitboard import DIRECTIONS
+from game import play_game
+from player import Player
+from records import GameRecordReader, starting_position
+from uct import UCTSearch
+
+from typing import Iterator, Optional, Sequence
+
+import json
+import os
+import random
+
+import numpy as np
+
+# Feature planes, in order, from the point of view of the player to move
+PLANES = ("own queens", "opponent queens", "arrows", "player 1 to move")
+MOBILITY_PLANES = ("own reach", "opponent reach")
+
+# Arrays saved for every shard, with their types
+SHARD_ARRAYS = {
+    "planes" : np.uint8,
+    "result" : np.int8,
+    "move" : np.int16,
+    "visits" : np.float32,
+}
+
+def dihedral(a : np.ndarray, k : int) -> np.ndarray:
+    '''
+        One of the 8 symmetries of the square applied to the last two axes: transposed if k >= 4, then rotated
+        k % 4 quarter turns
+    '''
+    if k >= 4:
+        a = a.swapaxes(-1, -2)
+    return np.rot90(a, k % 4, axes = (-2, -1))
+
+def dihedral_squares(n : int, k : int) -> np.ndarray:
+    '''
+        Where every square index (x * n + y) goes under dihedral(..., k)
+    '''
+    moved = dihedral(np.arange(n * n).reshape(n, n), k).ravel()
+    destination = np.empty(n * n, dtype = np.int64)
+    destination[moved] = np.arange(n * n)
+    return destination
+
+def game_positions(start : np.ndarray, codes : np.ndarray) -> np.ndarray:
+    '''
+        The board contents before each of the packed moves, as a (moves, n, n) int8 stack
+
+        Only the three squares each move changes are updated, so nothing has to go through AmazonsBoard
+    '''
+    board = start.astype(np.int8)
+    positions = np.empty((len(codes),) + board.shape, dtype = np.int8)
+    for t, code in enumerate(codes.tolist()):
+        positions[t] = board
+        board[code & 0xFF, code >> 8 & 0xFF] = 0
+        board[code >> 16 & 0xFF, code >> 24 & 0xFF] = (code >> ID_SHIFT) - 1
+        board[code >> 32 & 0xFF, code >> 40 & 0xFF] = -1
+    return positions
+
+def queen_reach(pieces : np.ndarray, empty : np.ndarray) -> np.ndarray:
+    '''
+        Squares the pieces can reach in one queen move, for a (..., n, n) stack of boards
+    '''
+    n = pieces.shape[-1]
+    reach = np.zeros(pieces.shape, dtype = bool)
+    for div_x, div_y in DIRECTIONS:
+        to_x, from_x = slice(max(div_x, 0), n + min(div_x, 0)), slice(max(-div_x, 0), n + min(-div_x, 0))
+        to_y, from_y = slice(max(div_y, 0), n + min(div_y, 0)), slice(max(-div_y, 0), n + min(-div_y, 0))
+        frontier = pieces
+        while frontier.any():
+            moved = np.zeros(pieces.shape, dtype = bool)
+            moved[..., to_x, to_y] = frontier[..., from_x, from_y]
+            frontier = moved & empty
+            reach |= frontier
+    return reach
+
+def feature_planes(positions : np.ndarray, to_move : np.ndarray, mobility : bool = False) -> np.ndarray:
+    '''
+        (positions, planes, n, n) uint8 features for a stack of board contents, see PLANES and MOBILITY_PLANES
+    '''
+    to_move = to_move.reshape(-1, 1, 1)
+    own = positions == to_move
+    opponent = (positions > 0) & ~own
+    planes = [own, opponent, positions == -1, np.broadcast_to(to_move == 1, positions.shape)]
+    if mobility:
+        empty = positions == 0
+        planes.extend((queen_reach(own, empty), queen_reach(opponent, empty)))
+    return np.stack(planes, axis = 1).astype(np.uint8)
+
+def uct_visits(search : UCTSearch, n : int) -> np.ndarray:
+    '''
+        How the search's root visits split over start, end and attack squares, as a (3, n, n) float32 distribution
+        for each
+    '''
+    visits = np.zeros((3, n * n), dtype = np.float32)
+    for child in search.root.children:
+        code = child.move
+        for i, shift in enumerate((0, 16, 32)):
+            visits[i, (code >> shift & 0xFF) * n + (code >> (shift + 8) & 0xFF)] += child.visits
+    total = visits[0].sum()
+    if total > 0:
+        visits /= total
+    return visits.reshape(3, n, n)
+
+class ShardWriter(object):
+    '''
+        Streams training positions into fixed size shards of .npy files
+
+        Every shard is a set of memory mapped arrays (see SHARD_ARRAYS) named shard-00000-planes.npy and so on:
+        planes (positions, planes, n, n), result (+1 if the player to move won, -1 if they lost, 0 if the game
+        wasn't finished), move (start, end and attack square indices, x * n + y) and visits ((3, n, n) share of
+        search visits over the start, end and attack squares, all 0 when the move didn't come from a search).
+        Only the shard being filled is open, and the last one is cut down to its size on close. A manifest.json
+        lists the shards and planes
+
+        With augment every position is also written in the 7 other orientations of the board
+    '''
+    def __init__(self, directory : str, n : int, shard_size : int = 16384, mobility : bool = False, augment : bool = False):
+        self.__directory = directory
+        self.__n = n
+        self.__shard_size = shard_size
+        self.__mobility = mobility
+        self.__symmetries = [(k, dihedral_squares(n, k)) for k in range(8 if augment else 1)]
+        self.__planes = PLANES + (MOBILITY_PLANES if mobility else ())
+        self.__shards = []
+        self.__arrays = None
+        self.__filled = 0
+        self.__positions = 0
+        os.makedirs(directory, exist_ok = True)
+
+    #<editor-fold> Properties
+    @property
+    def directory(self):
+        return self.__directory
+
+    @property
+    def positions(self):
+        return self.__positions
+
+    @property
+    def shards(self):
+        return self.__shards
+    #</editor-fold> Properties
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __path(self, index : int, name : str) -> str:
+        return os.path.join(self.__directory, f"shard-{index:05d}-{name}.npy")
+
+    def __shapes(self) -> dict:
+        n = self.__n
+        return {"planes" : (len(self.__planes), n, n), "result" : (), "move" : (3,), "visits" : (3, n, n)}
+
+    def __open_shard(self) -> None:
+        index = len(self.__shards)
+        self.__arrays = {
+            name : np.lib.format.open_memmap(self.__path(index, name), mode = "w+", dtype = SHARD_ARRAYS[name], shape = (self.__shard_size,) + shape)
+            for name, shape in self.__shapes().items()
+        }
+        self.__shards.append({"index" : index, "positions" : 0})
+        self.__filled = 0
+
+    def __close_shard(self) -> None:
+        if self.__arrays is None:
+            return
+        arrays, self.__arrays = self.__arrays, None
+        for values in arrays.values():
+            values.flush()
+        if self.__filled < self.__shard_size:
+            index = self.__shards[-1]["index"]
+            parts = {name : np.array(values[:self.__filled]) for name, values in arrays.items()}
+            # Let go of the memory maps before the files are written over
+            del arrays, values
+            for name, part in parts.items():
+                np.save(self.__path(index, name), part)
+
+    def write(self, planes : np.ndarray, result : np.ndarray, move : np.ndarray, visits : Optional[np.ndarray] = None) -> None:
+        '''
+            Add a batch of positions, along with their symmetries when augmenting
+        '''
+        if visits is None:
+            visits = np.zeros((len(planes), 3, self.__n, self.__n), dtype = np.float32)
+        for k, squares in self.__symmetries:
+            self.__append({
+                "planes" : dihedral(planes, k),
+                "result" : result,
+                "move" : squares[move],
+                "visits" : dihedral(visits, k),
+            })
+
+    def __append(self, batch : dict) -> None:
+        size = len(batch["result"])
+        done = 0
+        while done < size:
+            if self.__arrays is None or self.__filled == self.__shard_size:
+                self.__close_shard()
+                self.__open_shard()
+            count = min(size - done, self.__shard_size - self.__filled)
+            for name, values in batch.items():
+                self.__arrays[name][self.__filled:self.__filled + count] = values[done:done + count]
+            self.__filled += count
+            self.__shards[-1]["positions"] = self.__filled
+            self.__positions += count
+            done += count
+
+    def write_game(self, start : np.ndarray, codes : np.ndarray, winner : int, visits : Optional[Sequence[Optional[np.ndarray]]] = None) -> None:
+        '''
+            Add every position of a game, given its starting board contents, packed moves and winner (-1 if unfinished)
+
+            visits has an entry for each move, the uct_visits of the search that chose it or None
+        '''
+        codes = np.asarray(codes, dtype = np.int64)
+        if len(codes) == 0:
+            return
+        n = self.__n
+        to_move = (codes >> ID_SHIFT) - 1
+        result = np.where(winner == -1, 0, np.where(to_move == winner, 1, -1)).astype(np.int8)
+        move = np.stack([(codes >> shift & 0xFF) * n + (codes >> (shift + 8) & 0xFF) for shift in (0, 16, 32)], axis = 1)
+        stacked = None
+        if visits is not None and any(v is not None for v in visits):
+            empty = np.zeros((3, n, n), dtype = np.float32)
+            stacked = np.stack([v if v is not None else empty for v in visits])
+        planes = feature_planes(game_positions(start, codes), to_move, self.__mobility)
+        self.write(planes, result, move, stacked)
+
+    def close(self) -> None:
+        '''
+            Finish the last shard and write the manifest
+        '''
+        self.__close_shard()
+        manifest = {
+            "board_size" : self.__n,
+            "planes" : list(self.__planes),
+            "arrays" : list(SHARD_ARRAYS),
+            "augmented" : len(self.__symmetries) > 1,
+            "positions" : self.__positions,
+            "shards" : self.__shards,
+        }
+        with open(os.path.join(self.__directory, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent = 2)
+
+def iter_shards(directory : str) -> Iterator[dict[str, np.ndarray]]:
+    '''
+        Memory map each shard listed in a directory's manifest, as a dict of arrays
+    '''
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    for shard in manifest["shards"]:
+        yield {name : np.load(os.path.join(directory, f"shard-{shard['index']:05d}-{name}.npy"), mmap_mode = "r") for name in manifest["arrays"]}
+
+def self_play(writer : ShardWriter, games : int, board_size : int, player_1 : str = "UCT", player_2 : str = "UCT", seed : Optional[int] = None, **kwargs) -> None:
+    '''
+        Play games with play_game (the keywords go to it) and write every position to the writer
+
+        Moves chosen by a "UCT" player also get the search's visit distribution, read before the player starts
+        pondering (with ponder = True) on the same tree
+    '''
+    if seed is not None:
+        random.seed(seed)
+    for _ in range(games):
+        visits = []
+        board = []
+
+        def record_visits(player : Player, kind : str, b) -> None:
+            search = player.uct_search
+            # The player might have played the endgame solver's move instead of searching
+            searched = kind == "UCT" and search is not None and search.history == b.history[:-1]
+            visits.append(uct_visits(search, b.n) if searched else None)
+            board[:] = [b]
+
+        play_game(board_size, player_1, player_2, on_move = record_visits, **kwargs)
+        if board:
+            b = board[0]
+            writer.write_game(starting_position(b), b.history, b.winner if b.done else -1, visits)
+
+def export_records(reader : GameRecordReader, writer : ShardWriter) -> None:
+    '''
+        Write every position of a game record file (see records.py) without replaying the games on a board
+    '''
+    for record in reader:
+        start = np.zeros((record.n, record.n), dtype = np.int8)
+        for square, contents in record.starting_positions().items():
+            start[square] = contents
+        writer.write_game(start, record.move_codes(), record.winner)
@@ -0,0 +1,547 @@
+from move import Move, unpack_move
+from board import AmazonsBoard, ControlError, GameOver, NoPieceError, PathError, SizeError, TurnError
+from game import AI_KINDS, BOARD_BACKENDS, create_board, take_turn
+from player import Player
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+# Kinds of player a game can be played against, "ParallelMCTS" needs a pool of its own
+SERVER_KINDS = tuple(kind for kind in AI_KINDS if kind != "ParallelMCTS") + ("Random",)
+
+# What check_move raises for a move that can't be played
+MOVE_ERRORS = (ControlError, NoPieceError, PathError, TurnError, GameOver, IndexError)
+
+# Longest request line a client can send
+MAX_LINE = 64 * 1024
+
+# Smallest board the default starting position fits on, and the largest a packed move can address
+MIN_SIZE = 4
+MAX_SIZE = 255
+
+# take_turn keywords the server sets itself, so a game's settings can't
+RESERVED_SETTINGS = ("print_move", "move_time", "budget")
+
+class ServerError(Exception):
+    pass
+
+# What a request can fail with, answered as an error instead of dropping the connection
+REQUEST_ERRORS = (ServerError, ValueError, KeyError, TypeError, SizeError) + MOVE_ERRORS
+
+def decide(backend : str, position : Tuple[int, bytes, int], player_id : int, kind : str, settings : dict) -> Tuple[int, float]:
+    '''
+        Worker side of GameServer: choose player_id's move on the compact position, returns (packed move, seconds)
+
+        settings are the take_turn keywords, including move_time for the decision's budget
+    '''
+    start = time.perf_counter()
+    b = BOARD_BACKENDS[backend].from_compact(position)
+    take_turn(Player(player_id), kind, b, print_move = False, **settings)
+    return b.history[-1], time.perf_counter() - start
+
+def move_to_json(code : int) -> list[list[int]]:
+    '''
+        A packed move as [[x0, y0], [x1, y1], [ax, ay]]
+    '''
+    start, end, attack, _ = unpack_move(code)
+    return [list(start), list(end), list(attack)]
+
+def percentile(values : list[float], q : float) -> Optional[float]:
+    return float(np.percentile(values, q)) if len(values) else None
+
+class ServerGame(object):
+    '''
+        One game hosted by a GameServer: the board, which side the server plays and how, and its decision latencies
+    '''
+    def __init__(self, id : int, b : AmazonsBoard, ai_id : int, kind : str, settings : dict, move_time : float):
+        self.__id = id
+        self.__board = b
+        self.__ai_id = ai_id
+        self.__kind = kind
+        self.__settings = settings
+        self.__move_time = move_time
+        self.__lock = asyncio.Lock()
+        self.__latencies = []
+        self.__timeouts = 0
+        self.__failures = 0
+
+    #<editor-fold> Properties
+    @property
+    def id(self):
+        return self.__id
+
+    @property
+    def board(self):
+        return self.__board
+
+    @property
+    def ai_id(self):
+        return self.__ai_id
+
+    @property
+    def kind(self):
+        return self.__kind
+
+    @property
+    def settings(self):
+        return self.__settings
+
+    @property
+    def move_time(self):
+        return self.__move_time
+
+    @property
+    def lock(self):
+        return self.__lock
+
+    @property
+    def latencies(self):
+        # Seconds from asking for each AI move to getting it, queueing included
+        return self.__latencies
+
+    @property
+    def timeouts(self):
+        return self.__timeouts
+
+    @property
+    def failures(self):
+        # AI moves whose decision raised, and were played at random instead
+        return self.__failures
+    #</editor-fold> Properties
+
+    def timed_out(self) -> None:
+        self.__timeouts += 1
+
+    def failed(self) -> None:
+        self.__failures += 1
+
+    def state(self) -> dict:
+        b = self.__board
+        return {
+            "game" : self.__id,
+            "board" : b.to_array().tolist(),
+            "to_move" : 2 if b.last_player == 1 else 1,
+            "done" : b.done,
+            "winner" : b.winner,
+            "moves" : len(b.history),
+        }
+
+class GameServer(object):
+    '''
+        Hosts many games at once over TCP or a Unix socket, with the AI moves decided on a shared process pool
+
+        The protocol is one JSON object per line each way, of at most MAX_LINE bytes. Every request has an "op",
+        every response "ok" and either the result or an "error":
+            {"op" : "new", "size" : 6, "opponent" : "UCT", "player" : 1, "move_time" : 0.5, "settings" : {...}}
+            {"op" : "move", "game" : 3, "move" : [[x0, y0], [x1, y1], [ax, ay]]}
+            {"op" : "state", "game" : 3}, {"op" : "close", "game" : 3}, {"op" : "stats"}
+        "size" is MIN_SIZE - max_size and "move_time" positive. "player" is the side the client plays, if it's 2
+        the server moves first. A move is checked with check_move, played, and answered with the server's reply as
+        "reply" along with the game state
+
+        AI decisions go to a pool of workers processes, each getting the compact position and a move_time budget
+        (per game, at most max_move_time). At most max_pending decisions are queued or running at once, the rest
+        wait for a slot, and each connection's next request is only read once its last one is answered, so busy
+        clients are slowed down rather than piling up work. A decision is only sent once a worker is free, and one
+        that isn't back within move_time + grace seconds from then is replaced by a random move (the worker still
+        finishes it before taking another), and so is one that fails, except for the first move of a game the
+        server starts: then the game isn't created and the error is the response. stats reports decision latency
+        and how busy the pool was. A worker starts from a fresh Player every move, so searches don't keep their
+        trees
+    '''
+    def __init__(self, workers : Optional[int] = None, backend : str = "array", move_time : float = 1.0, max_move_time : float = 10.0, grace : float = 1.0, max_games : int = 1000, max_pending : Optional[int] = None, max_size : int = 20):
+        if backend not in BOARD_BACKENDS:
+            raise ServerError(f"Unknown board backend {backend}, expected one of {list(BOARD_BACKENDS)}")
+        if not MIN_SIZE <= max_size <= MAX_SIZE:
+            raise ServerError(f"The largest board has to be {MIN_SIZE} - {MAX_SIZE}, not {max_size}")
+        self.__workers = workers if workers is not None else os.cpu_count()
+        self.__backend = backend
+        self.__move_time = move_time
+        self.__max_move_time = max_move_time
+        self.__grace = grace
+        self.__max_games = max_games
+        self.__max_size = max_size
+        self.__max_pending = max_pending if max_pending is not None else 2 * self.__workers
+        self.__executor = None
+        self.__server = None
+        self.__slots = None
+        self.__idle = None
+        self.__loop = None
+        self.__connections = {}
+        self.__games = {}
+        self.__ids = itertools.count(1)
+        self.__started = None
+        self.__pending = 0
+        self.__busy_seconds = 0.0
+        self.__latencies = []
+        self.__finished = 0
+        self.__timeouts = 0
+        self.__failures = 0
+
+    #<editor-fold> Properties
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def games(self):
+        return self.__games
+
+    @property
+    def address(self):
+        # (host, port) or the socket path being served
+        if self.__server is None:
+            return None
+        return self.__server.sockets[0].getsockname()
+    #</editor-fold> Properties
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def start(self, host : str = "127.0.0.1", port : int = 0, path : Optional[str] = None) -> None:
+        '''
+            Start the workers and listen on host:port (port 0 picks a free one), or on the Unix socket at path
+        '''
+        if self.__server is not None:
+            raise ServerError("The server is already running")
+        self.__executor = ProcessPoolExecutor(max_workers = self.__workers)
+        self.__slots = asyncio.Semaphore(self.__max_pending)
+        self.__idle = asyncio.Semaphore(self.__workers)
+        self.__loop = asyncio.get_running_loop()
+        self.__started = time.perf_counter()
+        if path is not None:
+            self.__server = await asyncio.start_unix_server(self.__handle, path, limit = MAX_LINE)
+        else:
+            self.__server = await asyncio.start_server(self.__handle, host, port, limit = MAX_LINE)
+
+    async def serve_forever(self) -> None:
+        await self.__server.serve_forever()
+
+    async def close(self) -> None:
+        '''
+            Stop listening and shut the workers down
+        '''
+        if self.__server is not None:
+            self.__server.close()
+            # Closing the connections ends their handlers at the next read
+            for writer in self.__connections.values():
+                writer.close()
+            await asyncio.gather(*self.__connections, return_exceptions = True)
+            await self.__server.wait_closed()
+            self.__server = None
+        if self.__executor is not None:
+            self.__executor.shutdown(cancel_futures = True)
+            self.__executor = None
+
+    def stats(self) -> dict:
+        '''
+            Games, decision latency (seconds, queueing included) and pool utilisation (share of worker time spent
+            deciding since the server started)
+        '''
+        uptime = time.perf_counter() - self.__started if self.__started is not None else 0.0
+        return {
+            "games" : len(self.__games),
+            "finished" : self.__finished,
+            "decisions" : len(self.__latencies),
+            "timeouts" : self.__timeouts,
+            "failures" : self.__failures,
+            "pending" : self.__pending,
+            "workers" : self.__workers,
+            "latency_mean" : float(np.mean(self.__latencies)) if len(self.__latencies) else None,
+            "latency_p50" : percentile(self.__latencies, 50),
+            "latency_p95" : percentile(self.__latencies, 95),
+            "latency_max" : max(self.__latencies, default = None),
+            "utilisation" : self.__busy_seconds / (self.__workers * uptime) if uptime > 0 else 0.0,
+            "uptime" : uptime,
+        }
+
+    async def __handle(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> None:
+        '''
+            Answer one connection's requests, in order
+        '''
+        task = asyncio.current_task()
+        self.__connections[task] = writer
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Over MAX_LINE, the rest of the line would be read as requests of its own so the connection ends
+                    writer.write(json.dumps({"ok" : False, "error" : f"ServerError: Requests are at most {MAX_LINE} bytes"}).encode() + b"\n")
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ServerError("A request has to be a JSON object")
+                    response = {"ok" : True, **await self.__dispatch(request)}
+                except REQUEST_ERRORS as e:
+                    response = {"ok" : False, "error" : f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.__connections[task]
+            writer.close()
+
+    async def __dispatch(self, request : dict) -> dict:
+        match request.get("op"):
+            case "new":
+                return await self.__new_game(request)
+            case "move":
+                return await self.__move(request)
+            case "state":
+                return self.__game(request).state()
+            case "close":
+                game = self.__games.pop(self.__game(request).id)
+                return {"game" : game.id, "latencies" : game.latencies, "timeouts" : game.timeouts, "failures" : game.failures}
+            case "stats":
+                return self.stats()
+            case other:
+                raise ServerError(f"Unknown op {other}")
+
+    def __game(self, request : dict) -> ServerGame:
+        if (game := self.__games.get(request.get("game"))) is None:
+            raise ServerError(f"No game {request.get('game')}")
+        return game
+
+    async def __new_game(self, request : dict) -> dict:
+        if len(self.__games) >= self.__max_games:
+            raise ServerError(f"The server already has {self.__max_games} games")
+        kind = request.get("opponent", "Random")
+        if kind not in SERVER_KINDS:
+            raise ServerError(f"Unknown opponent {kind}, expected one of {list(SERVER_KINDS)}")
+        if (player := request.get("player", 1)) not in (1, 2):
+            raise ServerError(f"The client plays player 1 or 2, not {player}")
+        settings = request.get("settings", {})
+        if not isinstance(settings, dict):
+            raise ServerError("settings has to be a JSON object")
+        if reserved := [key for key in RESERVED_SETTINGS if key in settings]:
+            raise ServerError(f"settings can't set {reserved}, the server sets them")
+        move_time = min(float(request.get("move_time", self.__move_time)), self.__max_move_time)
+        # Not move_time > 0 also catches NaN
+        if not move_time > 0:
+            raise ServerError(f"move_time has to be positive, not {move_time}")
+        if not MIN_SIZE <= (size := int(request.get("size", 10))) <= self.__max_size:
+            raise ServerError(f"size has to be {MIN_SIZE} - {self.__max_size}, not {size}")
+        b = create_board(size, self.__backend)
+
+        game = ServerGame(next(self.__ids), b, 2 if player == 1 else 1, kind, settings, move_time)
+        response = {}
+        if player == 2:
+            # Only kept once its first move worked, so settings the player can't use don't leave a stuck game behind
+            async with game.lock:
+                response["reply"] = await self.__ai_move(game, fallback = False)
+        self.__games[game.id] = game
+        return {**response, **game.state()}
+
+    async def __move(self, request : dict) -> dict:
+        game = self.__game(request)
+        try:
+            start, end, attack = (tuple(int(v) for v in square) for square in request["move"])
+            m = Move(start, end, attack, 2 if game.ai_id == 1 else 1)
+        except ValueError as e:
+            raise ServerError(f"A move is [[x0, y0], [x1, y1], [ax, ay]] with coordinates 0 - 255, not {request['move']}") from e
+        async with game.lock:
+            b = game.board
+            try:
+                b.make_move(m)
+            except MOVE_ERRORS as e:
+                raise ServerError(f"Illegal move, {e}") from e
+            response = {}
+            if not b.done:
+                response["reply"] = await self.__ai_move(game)
+            if b.done:
+                self.__finished += 1
+            return {**response, **game.state()}
+
+    def __worker_done(self, job) -> None:
+        '''
+            Done callback of a decision, from the executor's thread
+        '''
+        try:
+            self.__loop.call_soon_threadsafe(self.__idle.release)
+        except RuntimeError:
+            # The event loop already closed along with the server
+            pass
+
+    async def __ai_move(self, game : ServerGame, fallback : bool = True) -> list[list[int]]:
+        '''
+            Have the pool decide the server's move in the game and play it
+
+            A decision that raised is replaced by a random move, or raises ServerError without fallback
+        '''
+        b = game.board
+        start = time.perf_counter()
+        async with self.__slots:
+            self.__pending += 1
+            job = None
+            try:
+                # Only hand the decision over once a worker is free, so its time limit doesn't count time spent queued
+                await self.__idle.acquire()
+                try:
+                    job = self.__executor.submit(decide, self.__backend, b.to_compact(), game.ai_id, game.kind, {**game.settings, "move_time" : game.move_time})
+                except BaseException:
+                    self.__idle.release()
+                    raise
+                # The worker is only free again once the decision is done, even one given up on below
+                job.add_done_callback(self.__worker_done)
+                code, seconds = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), game.move_time + self.__grace)
+                self.__busy_seconds += seconds
+            except asyncio.TimeoutError:
+                # Cancelling only stops a decision that hasn't started
+                job.cancel()
+                self.__timeouts += 1
+                game.timed_out()
+                code = None
+            except Exception as e:
+                if not fallback:
+                    raise ServerError(f"The {game.kind} player couldn't move, {type(e).__name__}: {e}") from e
+                self.__failures += 1
+                game.failed()
+                code = None
+            finally:
+                self.__pending -= 1
+
+        if code is None:
+            Player(game.ai_id).make_random_move(b, print_move = False)
+        else:
+            b.make_move(code, print_move = False)
+        latency = time.perf_counter() - start
+        game.latencies.append(latency)
+        self.__latencies.append(latency)
+        return move_to_json(b.history[-1])
+
+class GameClient(object):
+    '''
+        Client side of the GameServer protocol, one request at a time
+    '''
+    def __init__(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        self.__reader = reader
+        self.__writer = writer
+
+    @classmethod
+    async def connect(cls, host : str = "127.0.0.1", port : int = 0, path : Optional[str] = None) -> "GameClient":
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit = MAX_LINE)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit = MAX_LINE)
+        return cls(reader, writer)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def request(self, op : str, **fields) -> dict:
+        '''
+            Send a request and wait for its response, raises ServerError if the server couldn't do it
+        '''
+        self.__writer.write(json.dumps({"op" : op, **fields}).encode() + b"\n")
+        await self.__writer.drain()
+        response = json.loads(await self.__reader.readline())
+        if not response.pop("ok"):
+            raise ServerError(response["error"])
+        return response
+
+    async def close(self) -> None:
+        self.__writer.close()
+        await self.__writer.wait_closed()
+
+async def scripted_game(client : GameClient, size : int = 6, opponent : str = "Random", player : int = 1, seed : Optional[int] = None, **fields) -> dict:
+    '''
+        Play a whole game against the server with random moves, keeping a board of our own in step with it
+
+        Returns the final state along with the game's decision latencies
+    '''
+    rng = random.Random(seed)
+    state = await client.request("new", size = size, opponent = opponent, player = player, **fields)
+    b = create_board(size)
+    ai_id = 2 if player == 1 else 1
+    if "reply" in state:
+        b.make_move(Move(*state["reply"], ai_id), print_move = False)
+    while not state["done"]:
+        start, end = b.random_movement(player, rng)
+        attack = b.random_attack(start, end, rng)
+        b.make_move(Move(start, end, attack, player), print_move = False)
+        state = await client.request("move", game = state["game"], move = [start, end, attack])
+        if "reply" in state:
+            b.make_move(Move(*state["reply"], ai_id), print_move = False)
+        if b.to_array().tolist() != state["board"]:
+            raise ServerError(f"Game {state['game']} went out of step with the server")
+    closed = await client.request("close", game = state["game"])
+    return {**state, "latencies" : closed["latencies"]}
+
+async def run_scripted_clients(games : int, concurrency : int, size : int = 6, opponent : str = "Random", seed : Optional[int] = None, **connection) -> list[dict]:
+    '''
+        Play games scripted games over concurrency connections at once, see scripted_game
+    '''
+    queue = list(range(games))
+    results = []
+
+    async def client_loop(index : int) -> None:
+        async with await GameClient.connect(**connection) as client:
+            while queue:
+                game = queue.pop()
+                results.append(await scripted_game(client, size, opponent, 1 + game % 2, hash((seed, game)) if seed is not None else None))
+
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    return results
+
+async def demo(args : argparse.Namespace) -> None:
+    async with GameServer(args.workers, move_time = args.move_time, max_pending = args.max_pending, max_size = args.max_size) as server:
+        await server.start(args.host, args.port, args.unix)
+        address = server.address
+        connection = {"path" : args.unix} if args.unix else {"host" : address[0], "port" : address[1]}
+        start = time.perf_counter()
+        results = await run_scripted_clients(args.demo, args.clients, args.size, args.opponent, args.seed, **connection)
+        print(f"{len(results)} games in {time.perf_counter() - start:.2f}s")
+        print(json.dumps(server.stats(), indent = 2))
+
+async def serve(args : argparse.Namespace) -> None:
+    async with GameServer(args.workers, move_time = args.move_time, max_pending = args.max_pending, max_size = args.max_size) as server:
+        await server.start(args.host, args.port, args.unix)
+        print(f"Serving on {server.address}")
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Host Amazons games against the AI players over a socket")
+    parser.add_argument("--host", default = "127.0.0.1", help = "address to listen on")
+    parser.add_argument("--port", type = int, default = 8765, help = "port to listen on, 0 for any free one")
+    parser.add_argument("--unix", help = "listen on a Unix socket at this path instead")
+    parser.add_argument("--workers", type = int, help = "processes deciding AI moves, defaults to one per CPU")
+    parser.add_argument("--move-time", type = float, default = 1.0, help = "default seconds per AI move")
+    parser.add_argument("--max-size", type = int, default = 20, help = f"largest board a game can be played on, at most {MAX_SIZE}")
+    parser.add_argument("--max-pending", type = int, help = "AI decisions queued or running at once, defaults to twice the workers")
+    parser.add_argument("--demo", type = int, metavar = "GAMES", help = "play this many scripted games against the server, print the stats and stop")
+    parser.add_argument("--clients", type = int, default = 8, help = "connections the scripted games are played over")
+    parser.add_argument("--size", type = int, default = 6, help = "board size of the scripted games")
+    parser.add_argument("--opponent", default = "Random", help = "AI the scripted games are played against")
+    parser.add_argument("--seed", type = int, help = "seed for the scripted games")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(demo(args) if args.demo is not None else serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,372 @@
+from move import ID_SHIFT, Move
+from board import AmazonsBoard, square_rays, zobrist_keys
+from bitboard import DIRECTIONS
+from endgame import neighbour_masks
+from game import create_board, take_turn
+from player import Player
+
+from typing import Iterable, Iterator, Optional, Tuple
+
+import argparse
+import os
+import random
+
+import numpy as np
+
+# One slot of the table: position hash (0 for an empty slot), result for the side to move (+d wins in d moves,
+# -d loses in d moves) and board size
+TABLEBASE_DTYPE = np.dtype([("hash", "<u8"), ("value", "i1"), ("n", "u1")])
+
+class TablebaseError(Exception):
+    pass
+
+# A position while building: (empty squares bitmask, player 1's queens, player 2's queens, player to move), with
+# squares indexed x * n + y and the queens sorted
+State = Tuple[int, Tuple[int, ...], Tuple[int, ...], int]
+
+def board_state(b : AmazonsBoard) -> State:
+    '''
+        The building form of a board's position. A board nobody has moved on yet is taken as player 1 to move
+    '''
+    empty = 0
+    queens = {1 : [], 2 : []}
+    for square, contents in enumerate(b.to_array().ravel().tolist()):
+        if contents == 0:
+            empty |= 1 << square
+        elif contents > 0:
+            queens[contents].append(square)
+    return empty, tuple(sorted(queens[1])), tuple(sorted(queens[2])), 2 if b.last_player == 1 else 1
+
+def probe_hash(b : AmazonsBoard) -> int:
+    '''
+        The hash a board's position is stored under. The same as AmazonsBoard.hash, except a board nobody has
+        moved on yet is hashed as player 1 to move
+    '''
+    if b.last_player != -1:
+        return b.hash
+    last_player = zobrist_keys(b.n)[1]
+    return b.hash ^ last_player[-1] ^ last_player[2]
+
+class TablebaseBuilder(object):
+    '''
+        Solves every position reachable from a set of roots exactly
+
+        Every move adds an arrow, so positions fall into layers by how many empty squares are left and each move
+        goes one layer down. The builder walks forward from the roots to find every reachable position, then goes
+        back up the layers from the fullest board (retrograde analysis), solving each position from the layer
+        below it. The winner plays to win as soon as possible and the loser to last as long as possible. Layers
+        are let go as soon as they've been used, and it gives up with a TablebaseError past max_positions
+    '''
+    def __init__(self, n : int, max_positions : int = 5_000_000):
+        self.__n = n
+        self.__max_positions = max_positions
+        self.__rays = square_rays(n, tuple(DIRECTIONS))
+        self.__neighbours = neighbour_masks(n)
+        squares, last_player = zobrist_keys(n)
+        self.__square_keys = squares
+        self.__last_player_keys = last_player
+        self.__positions = 0
+
+    #<editor-fold> Properties
+    @property
+    def n(self):
+        return self.__n
+
+    @property
+    def positions(self):
+        return self.__positions
+    #</editor-fold> Properties
+
+    def __can_move(self, empty : int, queens : Tuple[int, ...]) -> bool:
+        for square in queens:
+            if empty & self.__neighbours[square]:
+                return True
+        return False
+
+    def __children(self, state : State) -> Iterator[Tuple[Optional[State], int, int]]:
+        '''
+            Every move from the position as (position after or None if that ends the game, value of the game
+            ending for the mover, packed move)
+        '''
+        empty, queens_1, queens_2, to_move = state
+        n = self.__n
+        rays = self.__rays
+        queens = queens_1 if to_move == 1 else queens_2
+        player = (to_move + 1) << ID_SHIFT
+        for i, start in enumerate(queens):
+            x0, y0 = divmod(start, n)
+            for ray in rays[start]:
+                for end, (x1, y1) in ray:
+                    if not empty >> end & 1:
+                        break
+                    moved = tuple(sorted(queens[:i] + (end,) + queens[i + 1:]))
+                    freed = (empty | 1 << start) & ~(1 << end)
+                    # Packed the same way as move.pack_move
+                    movement = player | x0 | y0 << 8 | x1 << 16 | y1 << 24
+                    # Can always attack where we just moved from, otherwise the queen is still on its starting square
+                    # while the arrow flies, the same as check_move
+                    attacks = [(start, x0, y0)]
+                    for arrow_ray in rays[end]:
+                        for attack, (ax, ay) in arrow_ray:
+                            if not empty >> attack & 1:
+                                break
+                            attacks.append((attack, ax, ay))
+                    theirs = queens_2 if to_move == 1 else queens_1
+                    for attack, ax, ay in attacks:
+                        after = freed & ~(1 << attack)
+                        code = movement | ax << 32 | ay << 40
+                        # The same checks AmazonsBoard.check_done makes after every move
+                        if not self.__can_move(after, theirs):
+                            yield None, 1, code
+                        elif not self.__can_move(after, moved):
+                            yield None, -1, code
+                        else:
+                            yield ((after, moved, queens_2, 2) if to_move == 1 else (after, queens_1, moved, 1)), 0, code
+
+    def __hash(self, state : State) -> int:
+        empty, queens_1, queens_2, to_move = state
+        squares = self.__square_keys
+        key = self.__last_player_keys[2 if to_move == 1 else 1]
+        for square in queens_1:
+            key ^= squares[1][square]
+        for square in queens_2:
+            key ^= squares[2][square]
+        occupied = ~empty & ((1 << (self.__n * self.__n)) - 1)
+        for square in queens_1 + queens_2:
+            occupied &= ~(1 << square)
+        while occupied:
+            low = occupied & -occupied
+            key ^= squares[-1][low.bit_length() - 1]
+            occupied ^= low
+        return key
+
+    def solve(self, roots : Iterable[State]) -> np.ndarray:
+        '''
+            Solve every position reachable from the roots, returns (hash, value) pairs as a TABLEBASE_DTYPE array
+        '''
+        layers = {}
+        for state in roots:
+            layers.setdefault(bin(state[0]).count("1"), set()).add(state)
+        if not layers:
+            return np.empty(0, dtype = TABLEBASE_DTYPE)
+
+        # Forward, find every position
+        self.__positions = 0
+        for empties in range(max(layers), -1, -1):
+            layer = layers.get(empties, ())
+            self.__positions += len(layer)
+            if self.__positions > self.__max_positions:
+                raise TablebaseError(f"More than {self.__max_positions} positions to solve")
+            if not layer:
+                continue
+            below = layers.setdefault(empties - 1, set())
+            for state in layer:
+                for after, _, _ in self.__children(state):
+                    if after is not None:
+                        below.add(after)
+
+        # Backward, solve each layer from the one below it
+        hashes = []
+        values = []
+        solved = {}
+        for empties in range(max(layers) + 1):
+            current = {}
+            for state in layers.pop(empties, ()):
+                best = None
+                for after, value, _ in self.__children(state):
+                    if after is not None:
+                        child = solved[after]
+                        # A win for the opponent in d is a loss in d + 1 for us and the other way around
+                        value = -(child + 1) if child > 0 else 1 - child
+                    if best is None or better(value, best):
+                        best = value
+                current[state] = best
+                hashes.append(self.__hash(state))
+                values.append(best)
+            solved = current
+
+        table = np.empty(len(hashes), dtype = TABLEBASE_DTYPE)
+        table["hash"] = np.array(hashes, dtype = np.uint64)
+        table["value"] = values
+        table["n"] = self.__n
+        return table
+
+def better(value : int, best : int) -> bool:
+    '''
+        Whether a result (+d win in d, -d loss in d) is better for the side to move than best: quicker wins,
+        then slower losses
+    '''
+    if value > 0:
+        return best < 0 or value < best
+    return best < 0 and value < best
+
+def sample_positions(n : int, games : int, empty_squares : int, starting_positions : Optional[dict] = None, seed : Optional[int] = None) -> list[State]:
+    '''
+        Late positions to build a tablebase from, found by playing random games until at most empty_squares are left
+    '''
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(games):
+        b = create_board(n, starting_positions = starting_positions)
+        id = 1
+        while not b.done and b.empty_squares > empty_squares:
+            start, end = b.random_movement(id, rng)
+            b.make_move(Move(start, end, b.random_attack(start, end, rng), id), validate = False)
+            id = 2 if id == 1 else 1
+        if not b.done:
+            positions.append(board_state(b))
+    return positions
+
+def save_tablebase(path : str, *tables : np.ndarray) -> None:
+    '''
+        Write solved positions to an open addressing hash table file, so a probe is a hash and a few reads
+
+        The table is the next power of two at least twice the positions, each position goes to the slot given by
+        the low bits of its hash or the next free slot after it
+    '''
+    entries = np.concatenate(tables) if tables else np.empty(0, dtype = TABLEBASE_DTYPE)
+    _, unique = np.unique(entries[["hash", "n"]], return_index = True)
+    entries = entries[unique]
+    size = 1 << max(4, int(2 * len(entries)).bit_length())
+    mask = np.uint64(size - 1)
+    table = np.zeros(size, dtype = TABLEBASE_DTYPE)
+
+    # Place everything whose slot is free in one go, the rest move on a slot and try again
+    slots = (entries["hash"] & mask).astype(np.int64)
+    pending = np.arange(len(entries))
+    while len(pending):
+        free = table["hash"][slots[pending]] == 0
+        trying = pending[free]
+        _, first = np.unique(slots[trying], return_index = True)
+        placed = trying[first]
+        table[slots[placed]] = entries[placed]
+        pending = np.setdiff1d(pending, placed, assume_unique = True)
+        taken = table["hash"][slots[pending]] != 0
+        slots[pending[taken]] = (slots[pending[taken]] + 1) % size
+    np.save(path, table)
+
+class Tablebase(object):
+    '''
+        Exact results read from a file written by save_tablebase
+
+        The file is memory mapped on the first probe. probe gives the result of a position in expected constant
+        time, best_move probes every move to find the one that keeps the best result
+    '''
+    def __init__(self, path : str):
+        self.__path = path
+        self.__table = None
+
+    #<editor-fold> Properties
+    @property
+    def path(self):
+        return self.__path
+
+    @property
+    def loaded(self):
+        return self.__table is not None
+    #</editor-fold> Properties
+
+    def __load(self) -> np.ndarray:
+        if self.__table is None:
+            if not os.path.exists(self.__path):
+                raise TablebaseError(f"No tablebase at {self.__path}")
+            table = np.load(self.__path, mmap_mode = "r")
+            if table.dtype != TABLEBASE_DTYPE:
+                raise TablebaseError(f"{self.__path} is not a tablebase")
+            self.__table = table
+        return self.__table
+
+    def __len__(self):
+        return int(np.count_nonzero(self.__load()["hash"]))
+
+    def value(self, b : AmazonsBoard) -> Optional[int]:
+        '''
+            Result for the side to move (+d wins in d moves, -d loses in d moves), or None if it isn't in the table
+        '''
+        if b.done:
+            return None
+        table = self.__load()
+        key = probe_hash(b)
+        slot = key & (len(table) - 1)
+        while True:
+            entry = table[slot]
+            stored = int(entry["hash"])
+            if stored == 0:
+                return None
+            if stored == key and entry["n"] == b.n:
+                return int(entry["value"])
+            slot = (slot + 1) & (len(table) - 1)
+
+    def probe(self, b : AmazonsBoard) -> Optional[Tuple[int, int]]:
+        '''
+            (winner, moves until the game ends) with perfect play, or None if the position isn't in the table
+        '''
+        value = self.value(b)
+        if value is None:
+            return None
+        to_move = 2 if b.last_player == 1 else 1
+        return (to_move if value > 0 else 3 - to_move), abs(value)
+
+    def best_move(self, b : AmazonsBoard) -> Optional[int]:
+        '''
+            Packed move that keeps the best result for the side to move, or None if any move leads out of the table
+        '''
+        if self.value(b) is None:
+            return None
+        to_move = 2 if b.last_player == 1 else 1
+        best, best_move = None, None
+        for code in b.populate_all_move_codes(to_move):
+            b.make_move(code, print_move = False, validate = False)
+            if b.done:
+                value = 1 if b.winner == to_move else -1
+            else:
+                child = self.value(b)
+                value = None if child is None else (-(child + 1) if child > 0 else 1 - child)
+            b.pop_last_move()
+            if value is None:
+                return None
+            if best is None or better(value, best):
+                best, best_move = value, code
+        return best_move
+
+def move_accuracy(tablebase : Tablebase, kind : str, boards : Iterable[AmazonsBoard], **kwargs) -> float:
+    '''
+        How often a player of the given kind keeps the best result the tablebase says the position has, as a
+        benchmark against perfect play. Winning positions count if the move still wins, losing ones always count
+    '''
+    kept = 0
+    total = 0
+    for b in boards:
+        value = tablebase.value(b)
+        if value is None:
+            continue
+        to_move = 2 if b.last_player == 1 else 1
+        take_turn(Player(to_move), kind, b, print_move = False, endgame = False, **kwargs)
+        if b.done:
+            won = b.winner == to_move
+        else:
+            child = tablebase.value(b)
+            won = child is not None and child < 0
+        b.pop_last_move()
+        kept += 1 if value < 0 or won else 0
+        total += 1
+    return kept / total if total else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description = "Solve late positions from random games and save them as a tablebase")
+    parser.add_argument("output", help = "tablebase file to write (.npy)")
+    parser.add_argument("--size", type = int, default = 6, help = "board size")
+    parser.add_argument("--games", type = int, default = 100, help = "random games to take positions from")
+    parser.add_argument("--empty-squares", type = int, default = 8, help = "solve positions from when this many empty squares are left")
+    parser.add_argument("--max-positions", type = int, default = 5_000_000, help = "give up past this many positions")
+    parser.add_argument("--seed", type = int, help = "seed for the random games")
+    args = parser.parse_args()
+
+    builder = TablebaseBuilder(args.size, args.max_positions)
+    table = builder.solve(sample_positions(args.size, args.games, args.empty_squares, seed = args.seed))
+    print(f"{args.size}x{args.size}: {len(table)} positions")
+    save_tablebase(args.output, table)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+from board import AmazonsBoard
+from bitboard import DIRECTIONS
+
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+@lru_cache(maxsize = None)
+def padded_layout(n : int, sets : int = 2) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+        Index arrays for working on flattened (n + 2, n + 2) boards whose border is always blocked
+
+        Returns (where each square of the n x n board goes in the padded board, gather index that turns a (sets,
+        squares) stack of masks into a (sets, 8, squares) stack moved one step in each direction, gather index that
+        moves a (sets, 8, squares) stack one more step along its own direction)
+    '''
+    size = n + 2
+    squares = size * size
+    interior = (np.arange(1, n + 1)[:, None] * size + np.arange(1, n + 1)[None, :]).ravel()
+    offsets = np.array([div_x * size + div_y for div_x, div_y in DIRECTIONS])
+    # Square i in direction d takes the value from one step back along d. The border never lets anything through,
+    # so clipping the indices that would fall off the array doesn't change anything
+    behind = np.clip(np.arange(squares)[None, :] - offsets[:, None], 0, squares - 1)
+    spread = (np.arange(sets)[:, None, None] * squares + behind[None]).ravel()
+    step = ((np.arange(sets * len(DIRECTIONS)) * squares).reshape(sets, -1, 1) + behind[None]).ravel()
+    return interior, spread, step
+
+def queen_distances(n : int, empty : np.ndarray, pieces : np.ndarray) -> np.ndarray:
+    '''
+        Fewest queen moves needed to reach each square of a flattened padded n x n board, for each set of pieces
+
+        pieces is a (sets, squares) boolean stack, every set gets its own row of distances, n * n where it can't
+        reach. Each level slides every frontier along all eight directions at once until all the rays are blocked
+    '''
+    sets, squares = pieces.shape
+    _, spread, step = padded_layout(n, sets)
+    distances = np.full(pieces.shape, n * n, dtype = np.int16)
+    seen = pieces.copy()
+    frontier = pieces
+    level = 0
+    while np.count_nonzero(frontier):
+        level += 1
+        rays = frontier.ravel()[spread].reshape(sets, -1, squares) & empty
+        reach = rays.any(axis = 1)
+        moved = reach
+        # count_nonzero is a lot cheaper than any() on arrays this small
+        while np.count_nonzero(moved):
+            rays = rays.ravel()[step].reshape(sets, -1, squares) & empty
+            moved = rays.any(axis = 1)
+            reach |= moved
+        frontier = reach & ~seen
+        distances[frontier] = level
+        seen |= frontier
+
+    return distances
+
+def king_distances(n : int, empty : np.ndarray, pieces : np.ndarray) -> np.ndarray:
+    '''
+        Fewest single steps needed to reach each square of a flattened padded n x n board, for each set of pieces
+    '''
+    sets, squares = pieces.shape
+    _, spread, _ = padded_layout(n, sets)
+    distances = np.full(pieces.shape, n * n, dtype = np.int16)
+    seen = pieces.copy()
+    frontier = pieces
+    level = 0
+    while np.count_nonzero(frontier):
+        level += 1
+        frontier = frontier.ravel()[spread].reshape(sets, -1, squares).any(axis = 1) & empty & ~seen
+        distances[frontier] = level
+        seen |= frontier
+
+    return distances
+
+def territory_evaluation(b : AmazonsBoard, player_id : int, king_weight : float = 0.5, mobility_weight : float = 0.05, tie_bonus : float = 0.2) -> float:
+    '''
+        Territory score of the board from player_id's point of view, higher is better
+
+        Every empty square counts +1 for the player that can reach it in fewer queen moves and -1 for the other,
+        with ties going tie_bonus towards the player to move. The same count with king moves (which tells more
+        about who will actually fill a region) is added with king_weight, and the mobility difference with
+        mobility_weight
+    '''
+    n = b.n
+    opponent_id = 2 if player_id == 1 else 1
+    interior, _, _ = padded_layout(n)
+    cells = np.full((n + 2) * (n + 2), -1, dtype = np.int8)
+    cells[interior] = b.to_array().ravel()
+    empty = cells == 0
+    pieces = np.stack((cells == player_id, cells == opponent_id))
+
+    own_queen, other_queen = queen_distances(n, empty, pieces)[:, empty]
+    own_king, other_king = king_distances(n, empty, pieces)[:, empty]
+
+    to_move = 2 if b.last_player == 1 else 1
+    ties = (own_queen == other_queen) & (own_queen < n * n)
+    queen_territory = np.sign(other_queen - own_queen).sum() + ties.sum() * (tie_bonus if to_move == player_id else -tie_bonus)
+    king_territory = np.sign(other_king - own_king).sum()
+    mobility = b.mobility(player_id) - b.mobility(opponent_id)
+    return float(queen_territory + king_weight * king_territory + mobility_weight * mobility)
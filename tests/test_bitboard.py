@@ -0,0 +1,51 @@
+from board import AmazonsBoard
+from bitboard import BitboardAmazonsBoard
+from move import Move
+
+import random
+
+import pytest
+
+def assert_same_moves(array_board, bitboard, id):
+    assert bitboard.populate_all_move_codes(id) == array_board.populate_all_move_codes(id)
+    assert list(bitboard.iter_move_codes(id)) == list(array_board.iter_move_codes(id))
+    assert list(bitboard.iter_movements(id)) == list(array_board.iter_movements(id))
+    assert bitboard.mobility(id) == array_board.mobility(id)
+    assert bitboard.has_any_move(id) == array_board.has_any_move(id)
+
+@pytest.mark.parametrize("n, seed", [(4, 0), (5, 1), (6, 2), (8, 3), (10, 4)])
+def test_backends_generate_the_same_moves(n, seed):
+    array_board = AmazonsBoard(n)
+    bitboard = BitboardAmazonsBoard(n)
+    array_rng = random.Random(seed)
+    bitboard_rng = random.Random(seed)
+    id = 1
+    while not array_board.done:
+        assert_same_moves(array_board, bitboard, 1)
+        assert_same_moves(array_board, bitboard, 2)
+        for x, y in array_board.populate_all_movements(id)[:4]:
+            assert bitboard.piece_mobility(x) == array_board.piece_mobility(x)
+            assert bitboard.reachable_squares(x) == array_board.reachable_squares(x)
+            assert bitboard.populate_all_attacks_for_move(x, y) == array_board.populate_all_attacks_for_move(x, y)
+
+        # The same seed has to pick the same move on both backends
+        start, end = array_board.random_movement(id, array_rng)
+        assert bitboard.random_movement(id, bitboard_rng) == (start, end)
+        attack = array_board.random_attack(start, end, array_rng)
+        assert bitboard.random_attack(start, end, bitboard_rng) == attack
+
+        array_board.make_move(Move(start, end, attack, id), print_move = False)
+        bitboard.make_move(Move(start, end, attack, id), print_move = False)
+        assert bitboard.hash == array_board.hash
+        id = 2 if id == 1 else 1
+
+    assert bitboard.done
+    assert bitboard.winner == array_board.winner
+
+    # Undoing the game puts the bitboards back too
+    while bitboard.history:
+        array_board.pop_last_move()
+        bitboard.pop_last_move()
+        assert_same_moves(array_board, bitboard, 1)
+        assert_same_moves(array_board, bitboard, 2)
+    assert bitboard.occupied == BitboardAmazonsBoard(n).occupied
@@ -0,0 +1,46 @@
+from board import AmazonsBoard, TurnError
+from move import Move
+
+import random
+
+import pytest
+
+def test_pop_first_move_restores_compact_last_player():
+    start = AmazonsBoard(6)
+    b = AmazonsBoard.from_compact((start.n, start.to_compact()[1], 2))
+    assert b.last_player == 2
+    before = b.hash
+
+    m = b.populate_all_move_codes(1)[0]
+    b.make_move(m, print_move = False)
+    b.pop_last_move()
+    assert b.last_player == 2
+    assert b.hash == before
+    assert b.hash == AmazonsBoard.from_compact(b.to_compact()).hash
+
+    # Player 2 moved last, so it still isn't their turn
+    with pytest.raises(TurnError):
+        b.make_move(b.populate_all_move_codes(2)[0], print_move = False)
+    b.make_move(m, print_move = False)
+
+def test_pop_first_move_restores_transformed_last_player():
+    b = AmazonsBoard(6)
+    b.make_move(b.populate_all_move_codes(1)[0], print_move = False)
+    t = b.transformed(1)
+    before = t.hash
+    t.make_move(t.populate_all_move_codes(2)[0], print_move = False)
+    t.pop_last_move()
+    assert t.last_player == 1
+    assert t.hash == before
+
+def test_generators_follow_the_pieces_as_they_move():
+    rng = random.Random(0)
+    b = AmazonsBoard(8)
+    id = 1
+    while not b.done:
+        movements = [((int(x0), int(y0)), end) for (x0, y0), end in b.populate_all_movements(id)]
+        assert list(b.iter_movements(id)) == movements
+        start, end = b.random_movement(id, rng)
+        assert (start, end) in movements
+        b.make_move(Move(start, end, b.random_attack(start, end, rng), id), print_move = False)
+        id = 2 if id == 1 else 1
@@ -0,0 +1,37 @@
+from board import AmazonsBoard
+from move import Move
+from player import Player
+
+import builtins
+
+import pytest
+
+def test_id_is_read_only():
+    m = Move((0, 1), (2, 3), (4, 5))
+    with pytest.raises(AttributeError):
+        m.id = 1
+
+def test_with_id_keeps_the_original():
+    m = Move((0, 1), (2, 3), (4, 5))
+    moves = {m}
+    owned = m.with_id(2)
+    assert owned.id == 2 and m.id == -1
+    assert (owned.start, owned.end, owned.attack) == (m.start, m.end, m.attack)
+    assert m in moves and owned not in moves
+    with pytest.raises(ValueError):
+        m.with_id(3)
+
+def test_player_moves_get_the_players_id():
+    b = AmazonsBoard(6)
+    m = Move.from_code(b.populate_all_move_codes(1)[0]).with_id(-1)
+    Player(1).make_move(m, b, print_move = False)
+    assert m.id == -1
+    assert b.moves[-1] == m.with_id(1)
+
+def test_human_move_asks_again_after_a_bad_square(monkeypatch):
+    b = AmazonsBoard(6)
+    m = Move.from_code(b.populate_all_move_codes(1)[0])
+    answers = iter(["-1,0", "1,1", "2,2", "a,b", "1,1", "2,2"] + [f"{x},{y}" for x, y in (m.start, m.end, m.attack)])
+    monkeypatch.setattr(builtins, "input", lambda prompt : next(answers))
+    Player(1).prompt_human_move(b, print_move = False)
+    assert b.moves[-1] == m
@@ -0,0 +1,13 @@
+from board import AmazonsBoard
+from player import Player
+from profiling import Profiler
+
+def test_alphabeta_decisions_count_search_nodes():
+    b = AmazonsBoard(6)
+    with Profiler() as profiler:
+        Player(1).make_alphabeta_move(b, max_depth = 3, print_move = False)
+    decision = profiler.decisions[-1]
+    assert decision["method"] == "make_alphabeta_move"
+    # The move made on the board itself is one node, the search's own positions are the rest
+    assert decision["nodes"] > 1
+    assert "SearchPosition.make" in profiler.stats()["methods"]
@@ -0,0 +1,12 @@
+from search import MATE_SCORE, WIN_SCORE, score_from_table, score_to_table
+
+def test_mate_scores_are_stored_from_the_position():
+    # A win 3 plies below a position searched at ply 2 scores WIN_SCORE - 5 from the root
+    stored = score_to_table(WIN_SCORE - 5, 2)
+    assert stored == WIN_SCORE - 3
+    # Reached again at ply 4 it's still 3 plies away
+    assert score_from_table(stored, 4) == WIN_SCORE - 7
+    assert score_from_table(score_to_table(-(WIN_SCORE - 5), 2), 4) == -(WIN_SCORE - 7)
+    # Evaluations are stored as they are
+    assert score_to_table(MATE_SCORE - 1, 7) == MATE_SCORE - 1
+    assert score_from_table(-12, 7) == -12
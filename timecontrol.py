@@ -0,0 +1,165 @@
+from board import AmazonsBoard
+
+from typing import Optional
+
+import math
+import time
+
+class TimeControlError(Exception):
+    pass
+
+class Budget(object):
+    '''
+        How long one decision may take, in seconds and/or nodes, counted from when the budget is created
+
+        What a node is depends on the decision: a candidate move scored by the one ply players ("Min", "Max",
+        "MinMax", "Territory"), a simulation for "MCTS", "ParallelMCTS" and "UCT", and a searched position for
+        "AlphaBeta". A budget with neither limit never expires
+    '''
+    def __init__(self, seconds : Optional[float] = None, nodes : Optional[int] = None):
+        if seconds is not None and seconds < 0:
+            raise TimeControlError(f"A budget can't have negative time ({seconds})")
+        self.__seconds = seconds
+        self.__max_nodes = nodes
+        self.__start = time.perf_counter()
+        self.__deadline = self.__start + seconds if seconds is not None else math.inf
+        self.__nodes = 0
+
+    #<editor-fold> Properties
+    @property
+    def seconds(self):
+        return self.__seconds
+
+    @property
+    def max_nodes(self):
+        return self.__max_nodes
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.__start
+
+    @property
+    def limited(self):
+        return self.__seconds is not None or self.__max_nodes is not None
+    #</editor-fold> Properties
+
+    def count(self, nodes : int = 1) -> None:
+        '''
+            Spend nodes from the budget
+        '''
+        self.__nodes += nodes
+
+    def expired(self) -> bool:
+        '''
+            Whether the time or the nodes have run out
+        '''
+        if self.__max_nodes is not None and self.__nodes >= self.__max_nodes:
+            return True
+        return time.perf_counter() >= self.__deadline
+
+    def seconds_left(self) -> Optional[float]:
+        '''
+            Seconds until the deadline, None without a time limit
+        '''
+        if self.__seconds is None:
+            return None
+        return max(0.0, self.__deadline - time.perf_counter())
+
+    def nodes_left(self) -> Optional[int]:
+        '''
+            Nodes that can still be spent, None without a node limit
+        '''
+        if self.__max_nodes is None:
+            return None
+        return max(0, self.__max_nodes - self.__nodes)
+
+class TimeControl(object):
+    '''
+        A game clock for both players: seconds for the whole game plus increment seconds added after every move
+
+        budget gives the player to move a Budget for their next move and starts their clock, stop charges them
+        for the time it took. Each move gets an even share of the time left over the moves the player is expected
+        to have left, plus the increment, but never more than max_fraction of the time left. Every move fills one
+        square and games rarely fill more than half of the empty ones, so a player is expected to have about
+        moves_per_square * empty squares moves left. Clocks can run below zero, a player out of time gets
+        minimum seconds a move and shows up in flagged
+    '''
+    def __init__(self, seconds : float, increment : float = 0.0, moves_per_square : float = 0.25, max_fraction : float = 0.5, minimum : float = 0.01):
+        if seconds <= 0:
+            raise TimeControlError(f"A clock needs time to start with, not {seconds}")
+        self.__seconds = seconds
+        self.__increment = increment
+        self.__moves_per_square = moves_per_square
+        self.__max_fraction = max_fraction
+        self.__minimum = minimum
+        self.__remaining = {1 : seconds, 2 : seconds}
+        self.__moves = {1 : 0, 2 : 0}
+        self.__started = {}
+
+    #<editor-fold> Properties
+    @property
+    def seconds(self):
+        return self.__seconds
+
+    @property
+    def increment(self):
+        return self.__increment
+
+    @property
+    def flagged(self):
+        # Players that have used more than their time
+        return [id for id, remaining in self.__remaining.items() if remaining < 0]
+    #</editor-fold> Properties
+
+    def remaining(self, player_id : int) -> float:
+        '''
+            Seconds left on the player's clock, not counting a move in progress
+        '''
+        return self.__remaining[player_id]
+
+    def moves(self, player_id : int) -> int:
+        '''
+            Moves the player's clock has been charged for
+        '''
+        return self.__moves[player_id]
+
+    def moves_left(self, b : AmazonsBoard) -> int:
+        '''
+            How many more moves the player to move is expected to make
+        '''
+        return max(1, round(b.empty_squares * self.__moves_per_square))
+
+    def allocate(self, b : AmazonsBoard, player_id : int) -> float:
+        '''
+            Seconds the player should spend on their next move
+        '''
+        remaining = self.__remaining[player_id]
+        if remaining <= self.__minimum:
+            return self.__minimum
+        share = remaining / self.moves_left(b) + self.__increment
+        return max(self.__minimum, min(share, remaining * self.__max_fraction))
+
+    def budget(self, b : AmazonsBoard, player_id : int, nodes : Optional[int] = None) -> Budget:
+        '''
+            Start the player's clock and return the budget for their move, optionally capped at nodes as well
+        '''
+        if player_id in self.__started:
+            raise TimeControlError(f"Player {player_id}'s clock is already running")
+        budget = Budget(self.allocate(b, player_id), nodes)
+        self.__started[player_id] = time.perf_counter()
+        return budget
+
+    def stop(self, player_id : int) -> float:
+        '''
+            Stop the player's clock, charging them for the move and adding the increment. Returns the seconds taken
+        '''
+        if player_id not in self.__started:
+            raise TimeControlError(f"Player {player_id}'s clock isn't running")
+        elapsed = time.perf_counter() - self.__started.pop(player_id)
+        self.__remaining[player_id] += self.__increment - elapsed
+        self.__moves[player_id] += 1
+        return elapsed
@@ -0,0 +1,288 @@
+from game import AI_KINDS, play_game
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import combinations
+from typing import Callable, Optional, Tuple
+
+import csv
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+# Fields of a game result, in the order they're written to CSV
+RESULT_FIELDS = ("game", "player_1", "player_2", "winner", "winner_id", "moves", "seconds", "seed")
+
+# Kinds of player an entrant can be, anything take_turn plays without a human
+ENTRANT_KINDS = AI_KINDS + ("Random", "Tablebase")
+
+# Elo points per natural log unit of playing strength
+ELO_SCALE = 400 / math.log(10)
+
+class TournamentError(Exception):
+    pass
+
+def play_match(board_size : int, game : int, names : Tuple[str, str], entrants : Tuple[dict, dict], seed : int, backend : str = "array") -> dict:
+    '''
+        Worker side of Tournament: play one game between two entrants and return its result
+
+        Each entrant is a dict with the player "kind" (one of ENTRANT_KINDS) and the keywords for it. Raises
+        TournamentError if the game ends without a winner, which is what play_game reports for a kind it can't play
+    '''
+    random.seed(seed)
+    settings = [{key : value for key, value in entrant.items() if key != "kind"} for entrant in entrants]
+    start = time.perf_counter()
+    winner_id, moves = play_game(board_size, entrants[0]["kind"], entrants[1]["kind"], backend = backend,
+        player_1_kwargs = settings[0], player_2_kwargs = settings[1])
+    if winner_id not in (1, 2):
+        raise TournamentError(f"Game {game} between {names[0]} and {names[1]} ended without a winner")
+    return {
+        "game" : game,
+        "player_1" : names[0],
+        "player_2" : names[1],
+        "winner" : names[winner_id - 1],
+        "winner_id" : winner_id,
+        "moves" : moves,
+        "seconds" : time.perf_counter() - start,
+        "seed" : seed,
+    }
+
+def read_results(path : str) -> list[dict]:
+    '''
+        Load the results streamed to a JSONL or CSV file by Tournament.run, skipping a line cut short by an interruption
+    '''
+    if not os.path.exists(path):
+        return []
+    results = []
+    with open(path, newline = "") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                try:
+                    results.append({
+                        **row,
+                        "game" : int(row["game"]),
+                        "winner_id" : int(row["winner_id"]),
+                        "moves" : int(row["moves"]),
+                        "seconds" : float(row["seconds"]),
+                        "seed" : int(row["seed"]),
+                    })
+                except (TypeError, ValueError):
+                    continue
+        else:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+
+    return results
+
+def trim_partial_line(path : str) -> None:
+    '''
+        Cut off a last line left unfinished by an interruption, so new results start on a line of their own
+    '''
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        contents = f.read()
+        if contents and not contents.endswith(b"\n"):
+            f.truncate(contents.rfind(b"\n") + 1)
+
+def elo_ratings(results : list[dict], confidence : float = 1.96, prior_games : float = 1.0) -> dict[str, dict]:
+    '''
+        Fit Elo ratings to game results, with confidence intervals
+
+        Ratings are the maximum likelihood Bradley-Terry fit (the Elo model) centred on an average of 0. Every
+        pair that played also gets prior_games virtual games split evenly between them, so a player that won or
+        lost everything still gets a finite rating. Intervals are confidence standard errors either side, from the
+        curvature of the likelihood
+
+        Returns name -> {"elo", "low", "high", "games", "score"}
+    '''
+    names = sorted({name for result in results for name in (result["player_1"], result["player_2"])})
+    index = {name : i for i, name in enumerate(names)}
+    size = len(names)
+    if size == 0:
+        return {}
+    wins = np.zeros((size, size))
+    for result in results:
+        winner = index[result["winner"]]
+        loser = index[result["player_2"] if result["winner"] == result["player_1"] else result["player_1"]]
+        wins[winner, loser] += 1
+
+    games = wins + wins.T
+    played = games > 0
+    wins = wins + played * prior_games / 2
+    games = games + played * prior_games
+    total_wins = wins.sum(axis = 1)
+
+    # Minorization-maximization updates of the strengths, which always converge for the Bradley-Terry model
+    strength = np.ones(size)
+    for _ in range(10000):
+        pairs = strength[:, None] + strength[None, :]
+        updated = total_wins / np.maximum((games / pairs).sum(axis = 1), 1e-300)
+        updated[total_wins == 0] = strength[total_wins == 0]
+        updated /= np.exp(np.log(updated).mean())
+        converged = np.abs(updated - strength).max() < 1e-10
+        strength = updated
+        if converged:
+            break
+
+    log_strength = np.log(strength)
+    expected = 1 / (1 + np.exp(log_strength[None, :] - log_strength[:, None]))
+    information = games * expected * expected.T
+    hessian = np.diag(information.sum(axis = 1)) - information
+    # Ratings only matter relative to each other, the pseudo inverse gives the covariance with the average held at 0
+    errors = np.sqrt(np.maximum(np.diag(np.linalg.pinv(hessian)), 0)) * ELO_SCALE
+
+    ratings = {}
+    for name, i in index.items():
+        elo = float(log_strength[i] * ELO_SCALE)
+        played_games = sum(1 for result in results if name in (result["player_1"], result["player_2"]))
+        ratings[name] = {
+            "elo" : elo,
+            "low" : elo - confidence * float(errors[i]),
+            "high" : elo + confidence * float(errors[i]),
+            "games" : played_games,
+            "score" : sum(1 for result in results if result["winner"] == name) / played_games if played_games else 0.0,
+        }
+
+    return ratings
+
+class Tournament(object):
+    '''
+        Matches between player settings played across a process pool
+
+        entrants maps a name to a dict with the player "kind" and its take_turn keywords, for example
+        {"MCTS 100" : {"kind" : "MCTS", "n_mcts_games" : 100}}. With the "round_robin" schedule every pair plays
+        games_per_pairing games, with "gauntlet" only the challenger plays everyone else. Colours alternate within
+        each pairing. Every game has a fixed id and seed from the schedule, so an interrupted run can be resumed
+        from its results file. The keywords have to be picklable to reach the workers
+    '''
+    def __init__(self, entrants : dict[str, dict], board_size : int = 6, games_per_pairing : int = 2, schedule : str = "round_robin", challenger : Optional[str] = None, workers : Optional[int] = None, seed : Optional[int] = None, backend : str = "array"):
+        if schedule not in ("round_robin", "gauntlet"):
+            raise TournamentError(f"Unknown schedule {schedule}, expected round_robin or gauntlet")
+        if schedule == "gauntlet" and challenger not in entrants:
+            raise TournamentError(f"A gauntlet needs a challenger from the entrants, got {challenger}")
+        for name, entrant in entrants.items():
+            if not isinstance(entrant, dict) or entrant.get("kind") not in ENTRANT_KINDS:
+                raise TournamentError(f"Entrant {name} needs a kind from {list(ENTRANT_KINDS)}, got {entrant}")
+        self.__entrants = entrants
+        self.__board_size = board_size
+        self.__games_per_pairing = games_per_pairing
+        self.__schedule = schedule
+        self.__challenger = challenger
+        self.__workers = workers if workers is not None else os.cpu_count()
+        self.__seed = seed if seed is not None else 0
+        self.__backend = backend
+
+    #<editor-fold> Properties
+    @property
+    def entrants(self):
+        return self.__entrants
+
+    @property
+    def board_size(self):
+        return self.__board_size
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def seed(self):
+        return self.__seed
+    #</editor-fold> Properties
+
+    def pairings(self) -> list[Tuple[str, str]]:
+        '''
+            Every pair of entrants that plays, in schedule order
+        '''
+        if self.__schedule == "gauntlet":
+            return [(self.__challenger, name) for name in self.__entrants if name != self.__challenger]
+        return list(combinations(self.__entrants, 2))
+
+    def games(self) -> list[Tuple[int, str, str, int]]:
+        '''
+            Every game of the tournament as (game id, player 1 name, player 2 name, seed)
+        '''
+        schedule = []
+        for first, second in self.pairings():
+            for i in range(self.__games_per_pairing):
+                names = (first, second) if i % 2 == 0 else (second, first)
+                game = len(schedule)
+                schedule.append((game, *names, hash((self.__seed, game)) & 0xFFFFFFFF))
+
+        return schedule
+
+    def run(self, path : str, resume : bool = True, on_result : Optional[Callable[[dict], None]] = None) -> list[dict]:
+        '''
+            Play every game not already in the results file, streaming each result to it as the game finishes
+
+            The file is JSONL, or CSV if path ends in .csv. With resume a game whose id and players already have a
+            result in the file isn't played again, otherwise the file is started over. Returns every result,
+            old and new
+        '''
+        if resume:
+            trim_partial_line(path)
+        results = read_results(path) if resume else []
+        done = {(result["game"], result["player_1"], result["player_2"]) for result in results}
+        remaining = [game for game in self.games() if game[:3] not in done]
+
+        as_csv = path.endswith(".csv")
+        new_file = not resume or not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "w" if new_file else "a", newline = "") as f:
+            writer = csv.DictWriter(f, RESULT_FIELDS) if as_csv else None
+            if writer is not None and new_file:
+                writer.writeheader()
+            if not remaining:
+                return results
+
+            with ProcessPoolExecutor(max_workers = self.__workers) as executor:
+                futures = [
+                    executor.submit(play_match, self.__board_size, game, (first, second), (self.__entrants[first], self.__entrants[second]), seed, self.__backend)
+                    for game, first, second, seed in remaining
+                ]
+                try:
+                    for future in as_completed(futures):
+                        result = future.result()
+                        if writer is not None:
+                            writer.writerow(result)
+                        else:
+                            f.write(json.dumps(result) + "\n")
+                        f.flush()
+                        results.append(result)
+                        if on_result is not None:
+                            on_result(result)
+                except BaseException:
+                    # Don't wait for the games that haven't started, the finished ones are already saved
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+        return results
+
+def print_ratings(ratings : dict[str, dict]) -> None:
+    '''
+        Print the ratings best first
+    '''
+    for name, rating in sorted(ratings.items(), key = lambda item : item[1]["elo"], reverse = True):
+        print(f"{name:>24}: {rating['elo']:8.1f} ({rating['low']:8.1f} to {rating['high']:8.1f})  {rating['games']:>6} games  {rating['score']:6.1%}")
+
+def main():
+    entrants = {
+        "Random" : {"kind" : "Random"},
+        "Min" : {"kind" : "Min"},
+        "MinMax" : {"kind" : "MinMax"},
+        "MCTS 2" : {"kind" : "MCTS", "n_mcts_games" : 2},
+    }
+    tournament = Tournament(entrants, board_size = 5, games_per_pairing = 10, seed = 0)
+    results = tournament.run("tournament.jsonl", on_result = lambda result : print(f"game {result['game']}: {result['winner']} won in {result['moves']} moves"))
+    print_ratings(elo_ratings(results))
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TranspositionTable(object):
+    '''
+        Bounded cache of search results keyed by position hash (see AmazonsBoard.hash)
+
+        Entries are kept in least recently used order. When the table is full a new entry replaces
+            "lru" - the least recently used entry
+            "depth" - the shallowest of the few least recently used entries, so deep results survive longer
+    '''
+    # Rough cost of one entry: the dict slot, an int key and a small (depth, value) tuple
+    ENTRY_BYTES = 200
+    # How many of the oldest entries the "depth" policy compares before evicting one
+    DEPTH_CANDIDATES = 8
+
+    def __init__(self, max_bytes : int = 64 * 1024 * 1024, policy : str = "lru"):
+        if policy not in ("lru", "depth"):
+            raise ValueError(f"Unknown replacement policy {policy}, expected 'lru' or 'depth'")
+        self.__capacity = max(1, max_bytes // self.ENTRY_BYTES)
+        self.__policy = policy
+        self.__entries = OrderedDict()
+        self.reset_stats()
+
+    #<editor-fold> Properties
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    @property
+    def stores(self):
+        return self.__stores
+
+    @property
+    def evictions(self):
+        return self.__evictions
+    #</editor-fold> Properties
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key : Hashable):
+        return key in self.__entries
+
+    def lookup(self, key : Hashable, depth : int = 0) -> Optional[Any]:
+        '''
+            Get the value stored for a key if it was searched at least as deep as depth, otherwise None
+        '''
+        entry = self.__entries.get(key)
+        if entry is None or entry[0] < depth:
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        self.__entries.move_to_end(key)
+        return entry[1]
+
+    def store(self, key : Hashable, value : Any, depth : int = 0) -> None:
+        '''
+            Store a value for a key, evicting an older entry if the table is full
+        '''
+        self.__stores += 1
+        if key in self.__entries:
+            # Never overwrite a deeper result with a shallower one
+            if self.__policy == "depth" and self.__entries[key][0] > depth:
+                return
+            self.__entries[key] = (depth, value)
+            self.__entries.move_to_end(key)
+            return
+
+        if len(self.__entries) >= self.__capacity:
+            self.__evict()
+        self.__entries[key] = (depth, value)
+
+    def __evict(self) -> None:
+        '''
+            Remove one entry according to the replacement policy
+        '''
+        if self.__policy == "lru":
+            self.__entries.popitem(last = False)
+        else:
+            candidates = []
+            for key, (depth, _) in self.__entries.items():
+                candidates.append((depth, key))
+                if len(candidates) == self.DEPTH_CANDIDATES:
+                    break
+            del self.__entries[min(candidates, key = lambda c : c[0])[1]]
+        self.__evictions += 1
+
+    def clear(self) -> None:
+        '''
+            Remove every entry, keeping the counters
+        '''
+        self.__entries.clear()
+
+    def reset_stats(self) -> None:
+        '''
+            Zero the hit/miss/store/eviction counters
+        '''
+        self.__hits = 0
+        self.__misses = 0
+        self.__stores = 0
+        self.__evictions = 0
+
+    def stats(self) -> dict:
+        '''
+            Counters and fill level, useful for sizing the table
+        '''
+        lookups = self.__hits + self.__misses
+        return {
+            "size" : len(self.__entries),
+            "capacity" : self.__capacity,
+            "hits" : self.__hits,
+            "misses" : self.__misses,
+            "hit_rate" : self.__hits / lookups if lookups else 0.0,
+            "stores" : self.__stores,
+            "evictions" : self.__evictions,
+        }
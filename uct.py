@@ -0,0 +1,198 @@
+from move import Move, move_player
+from board import AmazonsBoard
+
+from array import array
+from typing import Optional
+
+import math
+import random
+import threading
+import time
+
+class UCTNode(object):
+    '''
+        One position in the search tree, reached by playing move (packed, see move.pack_move) from the parent's position
+    '''
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins", "complete")
+
+    def __init__(self, move : Optional[int] = None, parent : Optional["UCTNode"] = None):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        # Filled in with every legal move the first time the node is expanded
+        self.untried = None
+        self.visits = 0
+        # Simulations won by the player that made move
+        self.wins = 0
+        # Whether every line from here is in the tree down to the end of the game, so it can't grow any more
+        self.complete = False
+
+    def ucb(self, log_parent_visits : float, exploration : float) -> float:
+        '''
+            Upper confidence bound of this child, from the point of view of the player choosing it
+        '''
+        return self.wins / self.visits + exploration * math.sqrt(log_parent_visits / self.visits)
+
+    def size(self) -> int:
+        '''
+            Number of nodes in the subtree rooted here
+        '''
+        return 1 + sum(child.size() for child in self.children)
+
+class UCTSearch(object):
+    '''
+        Monte Carlo Tree Search using UCB1 to pick which line to simulate next (UCT)
+
+        All simulations are played on the board passed in and undone afterwards. The tree is kept between calls
+        to search, and when the board has moved on by moves that are already in the tree (our own move and the
+        opponent's reply) the matching subtree becomes the new root so its statistics are reused
+    '''
+    def __init__(self, exploration : float = math.sqrt(2)):
+        self.__exploration = exploration
+        self.__root = None
+        self.__history = array("q")
+        self.__nodes = 0
+        self.__simulations = 0
+
+    #<editor-fold> Properties
+    @property
+    def exploration(self):
+        return self.__exploration
+
+    @property
+    def root(self):
+        return self.__root
+
+    @property
+    def history(self):
+        # Moves that lead to the root's position
+        return self.__history
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+    @property
+    def simulations(self):
+        return self.__simulations
+    #</editor-fold> Properties
+
+    def reset(self) -> None:
+        '''
+            Throw away the tree
+        '''
+        self.__root = None
+        self.__history = array("q")
+        self.__nodes = 0
+
+    def search(self, b : AmazonsBoard, player_id : int, iterations : Optional[int] = None, max_nodes : Optional[int] = None, time_limit : Optional[float] = None, stop : Optional[threading.Event] = None) -> Move:
+        '''
+            Run simulations from the board for player_id and return the most visited move
+
+            Stops after iterations simulations, once the tree holds max_nodes nodes, when time_limit seconds have
+            passed, once stop is set (from another thread) or once the whole game tree from the board has been
+            added, whichever comes first. Without time_limit or stop, iterations defaults to 1000. At least one
+            simulation is always run
+        '''
+        if iterations is None and time_limit is None and stop is None:
+            iterations = 1000
+        deadline = time.perf_counter() + time_limit if time_limit is not None else math.inf
+        self.__advance(b)
+
+        played = 0
+        while iterations is None or played < iterations:
+            if played and (self.__root.complete or max_nodes is not None and self.__nodes >= max_nodes or time.perf_counter() >= deadline or stop is not None and stop.is_set()):
+                break
+            self.__iterate(b, player_id)
+            played += 1
+        # How many the last search ran, for profiling
+        self.__simulations = played
+
+        best = max(self.__root.children, key = lambda child : child.visits)
+        return Move.from_code(best.move)
+
+    def __advance(self, b : AmazonsBoard) -> None:
+        '''
+            Move the root down to the board's position if the moves since the last search are in the tree
+        '''
+        node = None
+        moves = b.history
+        if self.__root is not None and len(moves) >= len(self.__history) and moves[:len(self.__history)] == self.__history:
+            node = self.__root
+            for m in moves[len(self.__history):]:
+                node = next((child for child in node.children if child.move == m), None)
+                if node is None:
+                    break
+
+        if node is None:
+            node = UCTNode()
+            self.__nodes = 1
+        else:
+            node.parent = None
+            self.__nodes = node.size()
+        self.__root = node
+        self.__history = moves[:]
+
+    def __iterate(self, b : AmazonsBoard, player_id : int) -> None:
+        '''
+            One selection, expansion, simulation and backpropagation pass
+        '''
+        node = self.__root
+        depth = 0
+        to_move = player_id
+
+        # Selection, follow the best child while every move of a node has been tried
+        while node.untried is not None and len(node.untried) == 0 and len(node.children):
+            log_visits = math.log(node.visits)
+            node = max(node.children, key = lambda child : child.ucb(log_visits, self.__exploration))
+            b.make_move(node.move, print_move = False, validate = False)
+            depth += 1
+            to_move = 2 if to_move == 1 else 1
+
+        # Expansion, add one child for a move that hasn't been tried yet
+        if not b.done:
+            if node.untried is None:
+                node.untried = self.__legal_moves(b, to_move)
+                random.shuffle(node.untried)
+            if len(node.untried):
+                m = node.untried.pop()
+                b.make_move(m, print_move = False, validate = False)
+                depth += 1
+                to_move = 2 if to_move == 1 else 1
+                child = UCTNode(m, node)
+                node.children.append(child)
+                self.__nodes += 1
+                node = child
+
+        # A finished game can't be expanded, and a node whose moves all lead to complete nodes is complete too
+        if b.done and not node.complete:
+            node.complete = True
+            parent = node.parent
+            while parent is not None and len(parent.untried) == 0 and all(child.complete for child in parent.children):
+                parent.complete = True
+                parent = parent.parent
+
+        # Simulation, play random moves to the end of the game
+        while not b.done:
+            movement = b.random_movement(to_move)
+            attack = b.random_attack(*movement)
+            b.make_move(Move(*movement, attack, to_move), print_move = False)
+            depth += 1
+            to_move = 2 if to_move == 1 else 1
+        winner = b.winner
+
+        # Backpropagation, credit the win to every node whose move was made by the winner
+        while node is not None:
+            node.visits += 1
+            if node.move is not None and move_player(node.move) == winner:
+                node.wins += 1
+            node = node.parent
+
+        for _ in range(depth):
+            b.pop_last_move()
+
+    def __legal_moves(self, b : AmazonsBoard, id : int) -> list[int]:
+        '''
+            Every move the player can make on the board
+        '''
+        return b.populate_all_move_codes(id)